@@ -2,20 +2,24 @@ from dotenv import load_dotenv
 from flask import Flask, render_template, redirect, url_for, session
 from database.db_initialization import db
 import os
+from datetime import datetime
 from database.db_initialization import User, StudyCode
+from database.db_upgrades import upgrade_schema
 from sqlalchemy import inspect
 
 # helper function to load questions from JSON
 from config.config_helper import load_questions
 
 # To create and import BP use the following convention
-from routes.events_handler import events_handler_bp
+from routes.events_handler import calendar_schemas, events_handler_bp, month_calendar_events
 from routes.instructions import instructions_bp
 from routes.auth import auth_bp
 from routes.admin import admin_bp
 from routes.user_report import user_report_bp
 from routes.personal_expense import personal_expense_bp
 from routes.insights import insights_bp
+from monitoring.metrics import init_metrics
+from monitoring.structured_logging import init_logging
 
 app = Flask(__name__)
 
@@ -43,8 +47,24 @@ if not db_url or not secret_session_key:
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = secret_session_key
+# bearer token required to scrape /metrics; when unset, /metrics answers loopback requests only
+# (behind a same-host proxy, apply ProxyFix so remote_addr is the real client)
+app.config['METRICS_TOKEN'] = os.getenv("METRICS_TOKEN")
+app.config['LOG_LEVEL'] = os.getenv("LOG_LEVEL", "INFO")
+# keep one in N routine success messages (commits, saves)
+app.config['LOG_SUCCESS_SAMPLE_EVERY'] = int(os.getenv("LOG_SUCCESS_SAMPLE_EVERY", "10"))
+# most points sent for one insights timeline chart; longer series are bucketed by week or sampled
+app.config['CHART_POINT_BUDGET'] = int(os.getenv("CHART_POINT_BUDGET", "120"))
+# embed the current month's events in calendar.html so first paint needs no /api/calendar-events call
+app.config['CALENDAR_BOOTSTRAP_EVENTS'] = os.getenv("CALENDAR_BOOTSTRAP_EVENTS", "1") == "1"
+# how long a write's response is replayed for retries carrying the same Idempotency-Key
+app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
 
 db.init_app(app)
+# JSON logs written from a background thread, tagged with a per-request id
+init_logging(app)
+# request latency, DB time and pool usage exposed at /metrics
+init_metrics(app)
 
 # create database contents if not already
 with app.app_context():
@@ -55,6 +75,8 @@ with app.app_context():
     print("Create new database columns and rows")
 
     db.create_all()
+    # apply changes to tables that already existed (constraints, columns, indexes)
+    upgrade_schema()
 
     # This reflects the database schema and prints table names
     inspector = inspect(db.engine)
@@ -74,6 +96,7 @@ def index():
 @app.route('/calendar.html')
 def calendar():
     questions = None
+    bootstrap = None
     user_id = session.get('user_id')
     if user_id:
         user = User.query.get(user_id)
@@ -81,9 +104,17 @@ def calendar():
             study = StudyCode.query.filter_by(code=user.study_group_code).first()
             if study and (study.questions.get('drinking') or study.questions.get('gambling')):
                 questions = study.questions
+        if user and app.config.get('CALENDAR_BOOTSTRAP_EVENTS'):
+            # Same serializer as /api/calendar-events, reusing the study questions looked up above
+            today = datetime.utcnow().date()
+            bootstrap = {
+                "year": today.year,
+                "month": today.month,
+                "events": month_calendar_events(user_id, today.year, today.month, *calendar_schemas(questions)),
+            }
     if questions is None:
         questions = load_questions()
-    return render_template('calendar.html', questions=questions)
+    return render_template('calendar.html', questions=questions, bootstrap=bootstrap)
 
 @app.route('/settings.html')
 def user_settings():
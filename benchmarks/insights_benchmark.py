@@ -0,0 +1,73 @@
+"""
+Latency of compute_insights for participants with long histories.
+
+Seeds an in-memory SQLite database with one participant per history length,
+logging a gambling and a drinking answer on every day, then reports the median
+of several compute_insights calls for each insights window.
+
+    python -m benchmarks.insights_benchmark [--days 365 1095] [--windows 30d 1y all] [--repeat 7]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from database.db_initialization import CalendarEntry, Drinking, Gambling, User, db
+from database.insights_engine import INSIGHTS_WINDOWS, resolve_insights_window
+from routes.insights import compute_insights
+
+
+def _seed(days):
+    user = User(username=f"bench-{days}@test.com", password="x", is_admin=False)
+    db.session.add(user)
+    db.session.commit()
+
+    rng = random.Random(days)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    entries = [CalendarEntry(user_id=user.id, entry_date=today - timedelta(days=index)) for index in range(days)]
+    db.session.add_all(entries)
+    db.session.flush()
+    for entry in entries:
+        db.session.add(Gambling(user_id=user.id, entry_id=entry.id, gambling_questions={
+            "money_intended": str(rng.randint(0, 100)),
+            "money_spent": str(rng.randint(0, 150)),
+            "time_spent": str(rng.randint(1, 5)),
+            "money_earned": str(rng.randint(-80, 40)),
+        }))
+        db.session.add(Drinking(user_id=user.id, entry_id=entry.id, drinking_questions={
+            "num_drinks": str(rng.randint(1, 8)),
+        }))
+    db.session.commit()
+    return user.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, nargs="+", default=[365, 1095])
+    parser.add_argument("--windows", nargs="+", choices=list(INSIGHTS_WINDOWS), default=["30d", "1y", "all"])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        for days in args.days:
+            user_id = _seed(days)
+            for key in args.windows:
+                window = resolve_insights_window(user_id, key)
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    compute_insights(user_id, window)
+                    timings.append(time.perf_counter() - started)
+                print(f"{days:>6} days of history, window {key:>3}: median {statistics.median(timings) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
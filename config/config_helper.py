@@ -89,6 +89,20 @@ def field_map_from_schema(schema: dict) -> dict:
     }
 
 
+def get_select_questions(schema: dict):
+    """
+    Returns the select-type questions of a schema, tagged with their section.
+    These are the categorical answers researchers can filter reports by.
+    Example: [{'id': 'gambling_type', 'label': ..., 'options': [...], 'section': 'gambling'}]
+    """
+    questions = []
+    for section in ["drinking", "gambling"]:
+        for q in (schema or {}).get(section, []):
+            if q.get("type") == "select" and q.get("options"):
+                questions.append({**q, "section": section})
+    return questions
+
+
 def get_header_label_map(schema: dict) -> dict:
     """
     Maps each report column ID to a human-readable display label.
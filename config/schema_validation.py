@@ -0,0 +1,129 @@
+"""
+Server-side validation of activity payloads against a study's question schema.
+
+A schema is compiled once into flat per-question rules (type, min/max, decimal
+places, select options, required) and cached per (study id, questions_version),
+so validating a write is a dictionary lookup plus one pass over the questions.
+Messages match the client-side checks in app.js.
+"""
+import threading
+
+from sqlalchemy import select
+
+from database.db_initialization import StudyCode, User, db
+from monitoring.metrics import record_cache
+
+# Decimal places allowed for number answers unless a question sets "decimals".
+DEFAULT_DECIMALS = 2
+
+
+class _Rule:
+    __slots__ = ("qid", "label", "kind", "required", "minimum", "maximum", "decimals", "options")
+
+    def __init__(self, question):
+        self.qid = question["id"]
+        self.label = question.get("label") or question["id"]
+        self.kind = question.get("type", "number")
+        self.required = question.get("required", True)
+        self.minimum = question.get("min")
+        self.maximum = question.get("max")
+        self.decimals = question.get("decimals", DEFAULT_DECIMALS)
+        self.options = frozenset(question.get("options") or ()) if self.kind == "select" else None
+
+    def check(self, value):
+        """Return an error message for value, or None when it is acceptable."""
+        raw = "" if value is None else str(value).strip()
+        if not raw:
+            return f'"{self.label}" is required.' if self.required else None
+
+        if self.kind == "number":
+            try:
+                number = float(raw)
+            except ValueError:
+                return f'"{self.label}" must be a number.'
+            if number != number or number in (float("inf"), float("-inf")):
+                return f'"{self.label}" must be a number.'
+            if self.minimum is not None and number < self.minimum:
+                return f'"{self.label}" must be at least {self.minimum}.'
+            if self.maximum is not None and number > self.maximum:
+                return f'"{self.label}" must be no more than {self.maximum}.'
+            if "." in raw and len(raw.split(".", 1)[1]) > self.decimals:
+                return f'"{self.label}" can have at most {self.decimals} decimal places.'
+        elif self.options and raw not in self.options:
+            return f'"{self.label}" must be one of the listed options.'
+        return None
+
+
+class ActivityValidator:
+    """Validator compiled from one question schema; reuse it for any number of payloads."""
+
+    def __init__(self, schema):
+        schema = schema or {}
+        self.drinking = tuple(_Rule(q) for q in schema.get("drinking", []))
+        self.gambling = tuple(_Rule(q) for q in schema.get("gambling", []))
+
+    def validate(self, data):
+        """Return (True, "") or (False, first error message) for an activity payload."""
+        rules = ()
+        if data.get("drinking_logged"):
+            rules += self.drinking
+        if data.get("gambling_logged"):
+            rules += self.gambling
+        for rule in rules:
+            error = rule.check(data.get(rule.qid))
+            if error:
+                return False, error
+        return True, ""
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _has_questions(questions):
+    return bool(questions) and bool(questions.get("drinking") or questions.get("gambling"))
+
+
+def validator_for_study(study_id, version, default_schema, load_questions=None):
+    """
+    Cached validator for a study. `load_questions` is only called on a cache miss;
+    studies without custom questions use `default_schema`.
+    """
+    key = (study_id, version or 0)
+    validator = _cache.get(key)
+    record_cache("activity_validators", validator is not None)
+    if validator is not None:
+        return validator
+
+    questions = load_questions() if load_questions else None
+    validator = ActivityValidator(questions if _has_questions(questions) else default_schema)
+    with _cache_lock:
+        # Older versions of this study's schema can never be asked for again.
+        for stale in [k for k in _cache if k[0] == study_id]:
+            del _cache[stale]
+        _cache[key] = validator
+    return validator
+
+
+def validator_for_user(user_id, default_schema):
+    """Validator for the participant's study (or the default questions), one indexed lookup."""
+    study = db.session.execute(
+        select(StudyCode.id, StudyCode.questions_version)
+        .join(User, User.study_group_code == StudyCode.code)
+        .where(User.id == user_id)
+    ).first()
+    if study is None:
+        return validator_for_study(None, 0, default_schema)
+
+    study_id, version = study
+    return validator_for_study(
+        study_id,
+        version,
+        default_schema,
+        load_questions=lambda: db.session.get(StudyCode, study_id).questions,
+    )
+
+
+def clear_validator_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -3,12 +3,23 @@ import os
 from collections import defaultdict
 from datetime import datetime, timedelta
 
-from database.db_initialization import User, CalendarEntry, Drinking, Gambling
+from sqlalchemy import and_, func, or_, select
+
+from database.db_initialization import User, CalendarEntry, Drinking, Gambling, StudyCode, db
 from config.config_helper import *
+from database.db_helper import answer_filter_condition
+from database.summary_scores import SUMMARY_SCORE_COLUMNS, compute_summary_scores
+from monitoring.metrics import EXPORT_DURATION
 
 # Directory for temporary export files (avoids cluttering project root)
 EXPORTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp", "exports")
 
+# Report table pagination: default/maximum rows per page, and the point past
+# which the row count stops being exact and is reported as "N+".
+REPORT_PAGE_SIZE = 100
+MAX_REPORT_PAGE_SIZE = 500
+REPORT_COUNT_CAP = 10000
+
 
 def parse_report_date(date_str, include_end_of_day=False):
     # Parse YYYY-MM-DD and optionally include the full end date.
@@ -69,10 +80,63 @@ def row_matches_filters(row, report_type=None, num_drinks=None, gambling_without
     return True
 
 
-def build_report_dataset(user_id=None, user_ids=None, start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, schema=None):
+def load_answers_by_entry(entry_ids):
+    # Fetch drinking and gambling answers for many entries in two queries.
+    # entry_ids is a list of ids or a SELECT of them (for sets too large to bind one by one).
+    # Returns {entry_id: (drinking_questions, gambling_questions)}; the first row per entry wins.
+    answers = defaultdict(lambda: [None, None])
+    if isinstance(entry_ids, list) and not entry_ids:
+        return answers
+
+    for slot, model, column in ((0, Drinking, Drinking.drinking_questions), (1, Gambling, Gambling.gambling_questions)):
+        result = db.session.execute(
+            select(model.entry_id, column).where(model.entry_id.in_(entry_ids)).order_by(model.id)
+        )
+        for entry_id, questions in result:
+            if answers[entry_id][slot] is None:
+                answers[entry_id][slot] = questions
+    return answers
+
+
+def build_day_row(schema, dynamic_fields, user_id, date, day_entries, answers):
+    # Merge every entry a participant logged on one day into a single report row.
+    has_drinking = False
+    has_gambling = False
+
+    drinking_data = {}
+    gambling_data = {}
+
+    for entry in day_entries:
+        drinking_questions, gambling_questions = answers[entry.id]
+
+        if drinking_questions:
+            has_drinking = True
+            drinking_data.update(drinking_questions)
+
+        if gambling_questions:
+            has_gambling = True
+            gambling_data.update(gambling_questions)
+
+    merged_data = merge_activity_data(schema, drinking_data, gambling_data)
+
+    row = {
+        "user_id": user_id,
+        "date": date,
+        "has_drinking": has_drinking,
+        "has_gambling": has_gambling,
+    }
+
+    for field in dynamic_fields:
+        row[field] = merged_data.get(field)
+
+    return row
+
+
+def build_report_dataset(user_id=None, user_ids=None, start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, schema=None, answer_filters=None, study_ids=None):
     # Build one normalized dataset for table rendering and CSV export.
     if schema is None:
         schema = load_questions()
+    answer_condition = answer_filter_condition(answer_filters, schema)
     headers = get_csv_headers(schema)
     dynamic_fields = get_all_field_ids(schema)
 
@@ -81,6 +145,11 @@ def build_report_dataset(user_id=None, user_ids=None, start_date=None, end_date=
     parsed_num_drinks = parse_filter_number(num_drinks)
 
     users_query = User.query.filter(User.is_admin.is_(False))
+    if study_ids is not None:
+        # Study mode: participants whose study code belongs to one of study_ids.
+        users_query = users_query.filter(User.study_group_code.in_(
+            select(StudyCode.code).where(StudyCode.id.in_(study_ids))
+        ))
     if user_id is not None:
         # Single-user mode.
         users = users_query.filter_by(id=user_id).order_by(User.username.asc()).all()
@@ -95,121 +164,232 @@ def build_report_dataset(user_id=None, user_ids=None, start_date=None, end_date=
         users = users_query.order_by(User.username.asc()).all()
 
     rows = []
+    if not users:
+        return headers, rows
+
+    # One query for every participant's entries: the study predicate (or the
+    # selected users) plus the date and answer filters, grouped in Python.
+    conditions = []
+    if study_ids is not None:
+        conditions.append(CalendarEntry.study_id.in_(study_ids))
+    if user_id is not None or user_ids is not None:
+        conditions.append(CalendarEntry.user_id.in_([user.id for user in users]))
+    if parsed_start_date:
+        conditions.append(CalendarEntry.entry_date >= parsed_start_date)
+    if parsed_end_date:
+        conditions.append(CalendarEntry.entry_date < parsed_end_date)
+    if answer_condition is not None:
+        conditions.append(answer_condition)
+
+    entries = CalendarEntry.query.filter(*conditions).order_by(
+        CalendarEntry.user_id.asc(), CalendarEntry.entry_date.asc(), CalendarEntry.id.asc()
+    ).all()
+    if not entries:
+        return headers, rows
+
+    grouped_entries = defaultdict(lambda: defaultdict(list))
+    for entry in entries:
+        grouped_entries[entry.user_id][entry.entry_date.strftime("%Y-%m-%d")].append(entry)
+
+    answers = load_answers_by_entry(select(CalendarEntry.id).where(*conditions))
 
     for user in users:
-        query = CalendarEntry.query.filter_by(user_id=user.id)
-
-        if parsed_start_date:
-            query = query.filter(CalendarEntry.entry_date >= parsed_start_date)
-        if parsed_end_date:
-            query = query.filter(CalendarEntry.entry_date < parsed_end_date)
+        for date, day_entries in sorted(grouped_entries.get(user.id, {}).items()):
+            row = build_day_row(schema, dynamic_fields, user.id, date, day_entries, answers)
 
-        entries = query.order_by(CalendarEntry.entry_date.asc(), CalendarEntry.id.asc()).all()
-
-        grouped_entries = defaultdict(list)
-        for entry in entries:
-            date_str = entry.entry_date.strftime("%Y-%m-%d")
-            grouped_entries[date_str].append(entry)
+            if row_matches_filters(
+                row,
+                report_type=report_type,
+                num_drinks=parsed_num_drinks,
+                gambling_without_drinks=gambling_without_drinks,
+            ):
+                rows.append(row)
 
-        for date, day_entries in sorted(grouped_entries.items()):
-            has_drinking = False
-            has_gambling = False
+    return headers, rows
 
-            drinking_data = {}
-            gambling_data = {}
 
-            for entry in day_entries:
-                drinking = Drinking.query.filter_by(entry_id=entry.id).first()
-                gambling = Gambling.query.filter_by(entry_id=entry.id).first()
+def format_report_cursor(user_id, date):
+    # Cursor naming the last row already sent: "<user_id>:<YYYY-MM-DD>".
+    return f"{user_id}:{date}"
 
-                if drinking and drinking.drinking_questions:
-                    has_drinking = True
-                    drinking_data.update(drinking.drinking_questions)
 
-                if gambling and gambling.gambling_questions:
-                    has_gambling = True
-                    gambling_data.update(gambling.gambling_questions)
+def parse_report_cursor(cursor):
+    # Returns (user_id, day datetime) or None; raises ValueError for malformed cursors.
+    if not cursor:
+        return None
+    user_part, _, date_part = str(cursor).partition(":")
+    return int(user_part), datetime.strptime(date_part, "%Y-%m-%d")
 
-            merged_data = merge_activity_data(schema, drinking_data, gambling_data)
 
-            row = {
-                "user_id": user.id,
-                "date": date,
-                "has_drinking": has_drinking,
-                "has_gambling": has_gambling,
-            }
+def build_report_page(cursor=None, limit=REPORT_PAGE_SIZE, user_id=None, study_ids=None, start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, schema=None, answer_filters=None):
+    # One page of report rows ordered by (user_id, date), resuming after `cursor`.
+    # Uses a keyset predicate instead of OFFSET so every page costs the same.
+    if schema is None:
+        schema = load_questions()
+    limit = max(1, min(int(limit or REPORT_PAGE_SIZE), MAX_REPORT_PAGE_SIZE))
+    position = parse_report_cursor(cursor)
+    dynamic_fields = get_all_field_ids(schema)
+    parsed_num_drinks = parse_filter_number(num_drinks)
 
-            for field in dynamic_fields:
-                row[field] = merged_data.get(field)
+    base = select(CalendarEntry)
+    if user_id is not None:
+        base = base.where(CalendarEntry.user_id == user_id)
+    if study_ids is not None:
+        base = base.where(CalendarEntry.study_id.in_(study_ids))
+    parsed_start_date = parse_report_date(start_date)
+    parsed_end_date = parse_report_date(end_date, include_end_of_day=True)
+    if parsed_start_date:
+        base = base.where(CalendarEntry.entry_date >= parsed_start_date)
+    if parsed_end_date:
+        base = base.where(CalendarEntry.entry_date < parsed_end_date)
+    answer_condition = answer_filter_condition(answer_filters, schema)
+    if answer_condition is not None:
+        base = base.where(answer_condition)
+
+    page = {"rows": [], "next_cursor": None}
+
+    if position is None:
+        # Only the first page pays for the count: distinct (user, day) pairs,
+        # capped so very large studies stop counting early.
+        day = func.date(CalendarEntry.entry_date)
+        days = base.with_only_columns(CalendarEntry.user_id, day).group_by(CalendarEntry.user_id, day)
+        total = db.session.execute(
+            select(func.count()).select_from(days.limit(REPORT_COUNT_CAP + 1).subquery())
+        ).scalar()
+        has_row_filters = bool(report_type or parsed_num_drinks is not None or gambling_without_drinks)
+        page["total_estimate"] = min(total, REPORT_COUNT_CAP)
+        page["total_is_estimate"] = total > REPORT_COUNT_CAP or has_row_filters
+
+    # Rows are per day, so fetch a few more entries than rows and never emit a
+    # day whose entries may continue into the next batch.
+    batch_size = limit * 2
+    while True:
+        query = base
+        if position is not None:
+            after_user, after_day = position
+            query = query.where(or_(
+                CalendarEntry.user_id > after_user,
+                and_(CalendarEntry.user_id == after_user, CalendarEntry.entry_date >= after_day + timedelta(days=1)),
+            ))
+        entries = db.session.execute(
+            query.order_by(CalendarEntry.user_id, CalendarEntry.entry_date, CalendarEntry.id).limit(batch_size)
+        ).scalars().all()
+        exhausted = len(entries) < batch_size
 
+        grouped_entries = defaultdict(list)
+        for entry in entries:
+            grouped_entries[(entry.user_id, entry.entry_date.strftime("%Y-%m-%d"))].append(entry)
+        if not exhausted:
+            if len(grouped_entries) == 1:
+                # One day filled the whole batch; widen the batch and retry.
+                batch_size *= 2
+                continue
+            grouped_entries.popitem()
+
+        answers = load_answers_by_entry([entry.id for entry in entries])
+        for (row_user_id, date), day_entries in grouped_entries.items():
+            row = build_day_row(schema, dynamic_fields, row_user_id, date, day_entries, answers)
+            position = (row_user_id, datetime.strptime(date, "%Y-%m-%d"))
             if row_matches_filters(
                 row,
                 report_type=report_type,
                 num_drinks=parsed_num_drinks,
                 gambling_without_drinks=gambling_without_drinks,
             ):
-                rows.append(row)
+                page["rows"].append(row)
+                if len(page["rows"]) == limit:
+                    page["next_cursor"] = format_report_cursor(row_user_id, date)
+                    return page
 
-    return headers, rows
+        if exhausted:
+            return page
 
 # This function generates the csv file for a single user
 # Parameters: N/A
 # Returns: the output path for the csv to be saved
-def generate_user_csv_report(user_id: int, start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, output_path: str = None, schema=None):
+def generate_user_csv_report(user_id: int, start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, output_path: str = None, schema=None, answer_filters=None):
     user = User.query.get(user_id)
     if not user:
         raise Exception(f"User {user_id} not found")
 
-    headers, rows = build_report_dataset(
-        user_id=user_id,
-        start_date=start_date,
-        end_date=end_date,
-        report_type=report_type,
-        num_drinks=num_drinks,
-        gambling_without_drinks=gambling_without_drinks,
-        schema=schema,
-    )
-
-    if not output_path:
-        os.makedirs(EXPORTS_DIR, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = os.path.join(EXPORTS_DIR, f"user_{user_id}_report_{timestamp}.csv")
+    with EXPORT_DURATION.time(kind="user"):
+        headers, rows = build_report_dataset(
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+            report_type=report_type,
+            num_drinks=num_drinks,
+            gambling_without_drinks=gambling_without_drinks,
+            schema=schema,
+            answer_filters=answer_filters,
+        )
+
+        if not output_path:
+            os.makedirs(EXPORTS_DIR, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(EXPORTS_DIR, f"user_{user_id}_report_{timestamp}.csv")
 
-    with open(output_path, mode="w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
+        with open(output_path, mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
 
-        writer.writerow(headers)
+            writer.writerow(headers)
 
-        for row in rows:
-            writer.writerow([row.get(header) for header in headers])
+            for row in rows:
+                writer.writerow([row.get(header) for header in headers])
 
     return output_path
 
 # This function generates the csv file for all users
 # Parameters: N/A
 # Returns: the output path for the csv to be saved
-def generate_all_users_csv(start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, user_ids=None, output_path=None, schema=None):
+def generate_all_users_csv(start_date=None, end_date=None, report_type=None, num_drinks=None, gambling_without_drinks=False, user_ids=None, output_path=None, schema=None, answer_filters=None, study_ids=None):
     if output_path is None:
         os.makedirs(EXPORTS_DIR, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = os.path.join(EXPORTS_DIR, f"all_users_report_{timestamp}.csv")
 
-    headers, rows = build_report_dataset(
-        user_ids=user_ids,
-        start_date=start_date,
-        end_date=end_date,
-        report_type=report_type,
-        num_drinks=num_drinks,
-        gambling_without_drinks=gambling_without_drinks,
-        schema=schema,
-    )
+    with EXPORT_DURATION.time(kind="all_users"):
+        headers, rows = build_report_dataset(
+            user_ids=user_ids,
+            study_ids=study_ids,
+            start_date=start_date,
+            end_date=end_date,
+            report_type=report_type,
+            num_drinks=num_drinks,
+            gambling_without_drinks=gambling_without_drinks,
+            schema=schema,
+            answer_filters=answer_filters,
+        )
+
+        with open(output_path, mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+
+            writer.writerow(headers)
+
+            for row in rows:
+                writer.writerow([row.get(header) for header in headers])
+
+    return output_path
+
+# This function generates the csv file of TLFB summary scores, one row per participant
+# Parameters: study_ids -> list or subquery of StudyCode ids, window and heavy drinking threshold
+# Returns: the output path for the csv to be saved
+def generate_summary_scores_csv(study_ids, start_date=None, end_date=None, heavy_threshold=None, output_path=None):
+    if output_path is None:
+        os.makedirs(EXPORTS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = os.path.join(EXPORTS_DIR, f"summary_scores_{timestamp}.csv")
+
+    with EXPORT_DURATION.time(kind="summary_scores"):
+        options = {} if heavy_threshold is None else {"heavy_threshold": heavy_threshold}
+        scores = compute_summary_scores(study_ids, start_date=start_date, end_date=end_date, **options)
 
-    with open(output_path, mode="w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
+        with open(output_path, mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
 
-        writer.writerow(headers)
+            writer.writerow(SUMMARY_SCORE_COLUMNS)
 
-        for row in rows:
-            writer.writerow([row.get(header) for header in headers])
+            for row in scores:
+                writer.writerow([row.get(column) for column in SUMMARY_SCORE_COLUMNS])
 
     return output_path
@@ -0,0 +1,241 @@
+"""
+Daily activity rollups: one DailyActivity row per participant per day holding
+that day's gambling and drinking totals.
+
+Rows are kept current on write. The before_flush hook records which
+(participant, day) pairs a flush touches and the after_flush hook recomputes
+just those days from the typed answer columns. Set-based deletes that bypass
+the ORM (delete_entries_for_day) call refresh_daily_rollups themselves.
+Recomputed days are upserted on (user_id, day), so two saves of the same
+participant and day can't collide on the unique constraint.
+Reading any window then costs at most one row per day in it, however many
+answer rows were logged; monthly figures are sums of a month's daily rows.
+Caches derived from the rollups subscribe with on_rollups_refreshed; they are
+told only once the transaction that refreshed the rows commits, so a reader
+can't re-cache the pre-commit figures after the invalidation has run.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, union
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database.db_initialization import CalendarEntry, DailyActivity, Drinking, Gambling, db
+
+logger = logging.getLogger(__name__)
+
+# Key under session.info holding the (user_id, day) pairs touched by the current flush
+_TOUCHED_KEY = "tlfb_rollup_days"
+# Key under session.info holding the user ids refreshed in the current transaction
+_REFRESHED_KEY = "tlfb_rollup_refreshed_users"
+
+REBUILD_BATCH_SIZE = 100
+
+# DailyActivity columns recomputed by a refresh (everything but the (user_id, day) key)
+_TOTAL_COLUMNS = (
+    "study_id", "gambling_sessions", "money_intended", "money_spent", "time_spent",
+    "money_earned", "over_intent_sessions", "drinking_sessions", "num_drinks",
+)
+# INSERT constructs supporting ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Callables given the set of user ids whose rollups were just recomputed
+_refresh_listeners = []
+
+
+def on_rollups_refreshed(listener):
+    """Call listener(user_ids) whenever recomputed rollups of those participants are committed."""
+    _refresh_listeners.append(listener)
+    return listener
+
+
+def _queue_refreshed(session, user_ids):
+    if user_ids:
+        session.info.setdefault(_REFRESHED_KEY, set()).update(user_ids)
+
+
+def notify_committed_refreshes(session):
+    """after_commit hook: pass the user ids refreshed in the committed transaction to the listeners."""
+    user_ids = session.info.pop(_REFRESHED_KEY, None)
+    if user_ids:
+        for listener in _refresh_listeners:
+            listener(user_ids)
+
+
+def discard_refreshes(session):
+    """after_rollback hook: the refreshed rows were rolled back, so there is nothing to report."""
+    session.info.pop(_REFRESHED_KEY, None)
+
+
+def _as_date(value):
+    """func.date() yields a date on Postgres and an ISO string on SQLite."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def collect_touched_days(session):
+    """before_flush hook: remember the (user_id, day) pairs whose totals this flush changes."""
+    touched = session.info.setdefault(_TOUCHED_KEY, set())
+    entry_ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, (CalendarEntry, Gambling, Drinking)):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, CalendarEntry):
+            # The stored date (looked up below) is the entry's old day if it moved.
+            if obj.id is not None:
+                entry_ids.add(obj.id)
+            if obj not in session.deleted:
+                touched.add((obj.user_id, _as_date(obj.entry_date or datetime.utcnow())))
+        elif obj.entry_id is not None:
+            entry_ids.add(obj.entry_id)
+    if entry_ids:
+        with session.no_autoflush:
+            rows = session.execute(
+                select(CalendarEntry.user_id, CalendarEntry.entry_date).where(CalendarEntry.id.in_(entry_ids))
+            ).all()
+        touched.update((user_id, _as_date(entry_date)) for user_id, entry_date in rows if entry_date)
+
+
+def refresh_touched_days(session):
+    """after_flush hook: recompute the rollups collected by collect_touched_days."""
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if touched:
+        refresh_daily_rollups(touched, session)
+
+
+def _day_totals(connection, conditions):
+    """{(user_id, day): DailyActivity column dict} for the calendar entries matching conditions."""
+    day = func.date(CalendarEntry.entry_date)
+    intended = func.coalesce(Gambling.money_intended, 0.0)
+    spent = func.coalesce(Gambling.money_spent, 0.0)
+    gambling = connection.execute(
+        select(
+            CalendarEntry.user_id,
+            day,
+            func.max(CalendarEntry.study_id),
+            func.count(Gambling.id),
+            func.sum(intended),
+            func.sum(spent),
+            func.coalesce(func.sum(Gambling.time_spent), 0.0),
+            func.coalesce(func.sum(Gambling.money_earned), 0.0),
+            func.sum(case((spent > intended, 1), else_=0)),
+        )
+        .join(Gambling, Gambling.entry_id == CalendarEntry.id)
+        .where(*conditions)
+        .group_by(CalendarEntry.user_id, day)
+    ).all()
+    drinking = connection.execute(
+        select(
+            CalendarEntry.user_id,
+            day,
+            func.max(CalendarEntry.study_id),
+            func.count(Drinking.id),
+            func.coalesce(func.sum(Drinking.num_drinks), 0.0),
+        )
+        .join(Drinking, Drinking.entry_id == CalendarEntry.id)
+        .where(*conditions)
+        .group_by(CalendarEntry.user_id, day)
+    ).all()
+
+    totals = {}
+
+    def row_for(user_id, day_value, study_id):
+        key = (user_id, _as_date(day_value))
+        if key not in totals:
+            totals[key] = {
+                "user_id": user_id, "day": key[1], "study_id": study_id,
+                "gambling_sessions": 0, "money_intended": 0.0, "money_spent": 0.0, "time_spent": 0.0,
+                "money_earned": 0.0, "over_intent_sessions": 0, "drinking_sessions": 0, "num_drinks": 0.0,
+            }
+        return totals[key]
+
+    for user_id, day_value, study_id, sessions, intended_total, spent_total, hours, earned, over in gambling:
+        row = row_for(user_id, day_value, study_id)
+        row.update(
+            gambling_sessions=sessions, money_intended=intended_total, money_spent=spent_total,
+            time_spent=hours, money_earned=earned, over_intent_sessions=over,
+        )
+    for user_id, day_value, study_id, sessions, drinks in drinking:
+        row = row_for(user_id, day_value, study_id)
+        row.update(drinking_sessions=sessions, num_drinks=drinks)
+    return totals
+
+
+def _upsert_rollups(connection, rows):
+    """
+    Write rows, updating the (user_id, day) rows that already exist. A concurrent
+    write of the same participant and day may insert its row at any point in this
+    transaction, so a plain INSERT could fail on uq_daily_activity_user_day.
+    """
+    dialect_insert = _UPSERT_INSERTS.get(connection.dialect.name)
+    if dialect_insert is None:
+        connection.execute(insert(DailyActivity), rows)
+        return
+    statement = dialect_insert(DailyActivity)
+    statement = statement.on_conflict_do_update(
+        index_elements=[DailyActivity.user_id, DailyActivity.day],
+        set_={name: statement.excluded[name] for name in _TOTAL_COLUMNS},
+    )
+    connection.execute(statement, rows)
+
+
+def refresh_daily_rollups(user_days, session=None):
+    """Recompute the DailyActivity rows of the given (user_id, date) pairs from the answer tables."""
+    session = session or db.session
+    connection = session.connection()
+    days_by_user = {}
+    for user_id, day in user_days:
+        if user_id is not None:
+            days_by_user.setdefault(user_id, set()).add(day)
+
+    for user_id, days in days_by_user.items():
+        totals = _day_totals(connection, [
+            CalendarEntry.user_id == user_id,
+            CalendarEntry.entry_date >= datetime.combine(min(days), time.min),
+            CalendarEntry.entry_date < datetime.combine(max(days) + timedelta(days=1), time.min),
+        ])
+        rows = [row for (_, day), row in totals.items() if day in days]
+        emptied = days - {row["day"] for row in rows}
+        if emptied:
+            connection.execute(
+                delete(DailyActivity).where(DailyActivity.user_id == user_id, DailyActivity.day.in_(emptied))
+            )
+        if rows:
+            _upsert_rollups(connection, rows)
+    _queue_refreshed(session, set(days_by_user))
+
+
+def rebuild_daily_rollups(user_ids):
+    """Replace every DailyActivity row of user_ids with totals recomputed from their answers."""
+    user_ids = list(user_ids)
+    connection = db.session.connection()
+    for offset in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[offset:offset + REBUILD_BATCH_SIZE]
+        connection.execute(delete(DailyActivity).where(DailyActivity.user_id.in_(batch)))
+        rows = list(_day_totals(connection, [CalendarEntry.user_id.in_(batch)]).values())
+        if rows:
+            _upsert_rollups(connection, rows)
+    _queue_refreshed(db.session, set(user_ids))
+    db.session.commit()
+
+
+def backfill_daily_rollups():
+    """
+    Build rollups for participants with logged answers but no DailyActivity rows
+    (databases created before the table existed). Returns the number of participants rebuilt.
+    """
+    with_answers = union(select(Gambling.user_id), select(Drinking.user_id)).subquery()
+    missing = db.session.execute(
+        select(with_answers.c.user_id).where(
+            with_answers.c.user_id.notin_(select(DailyActivity.user_id).distinct())
+        )
+    ).scalars().all()
+    if missing:
+        rebuild_daily_rollups(missing)
+        logger.info("Built daily activity rollups", extra={"participants": len(missing)})
+    return len(missing)
@@ -0,0 +1,131 @@
+"""
+Answer normalization: copies the study's role-mapped answers out of the JSON
+question blobs into typed numeric columns on Gambling and Drinking.
+
+The JSON stays the source of truth for the calendar and CSV exports; the typed
+columns exist so aggregates can SUM/filter in SQL instead of parsing every row
+in Python. Which JSON key feeds which column depends on the participant's study
+schema (see config_helper.field_map_from_schema).
+"""
+import logging
+
+from sqlalchemy import inspect as sa_inspect, select
+
+from config.config_helper import field_map_from_schema
+from database.db_initialization import Drinking, Gambling, StudyCode, User, db
+
+logger = logging.getLogger(__name__)
+
+# model -> (JSON column attribute, typed role columns)
+TYPED_ANSWER_COLUMNS = {
+    Gambling: ("gambling_questions", (
+        "time_spent", "money_intended", "money_spent", "money_earned", "drinks_while_gambling",
+    )),
+    Drinking: ("drinking_questions", ("num_drinks",)),
+}
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def to_number(value):
+    """Parse a stored answer into a float, or None if it is blank or not numeric."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def field_maps_for_users(user_ids, session=None):
+    """Return {user_id: field map} resolving each user's study schema in one query."""
+    session = session or db.session
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    rows = session.execute(
+        select(User.id, StudyCode.questions)
+        .outerjoin(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.id.in_(user_ids))
+    ).all()
+    maps = {user_id: field_map_from_schema(questions) for user_id, questions in rows}
+    default_map = field_map_from_schema(None)
+    return {user_id: maps.get(user_id, default_map) for user_id in user_ids}
+
+
+def typed_answer_values(model, answers, field_map):
+    """{typed column: value} for a Gambling/Drinking JSON answer dict."""
+    answers = answers or {}
+    return {role: to_number(answers.get(field_map[role])) for role in TYPED_ANSWER_COLUMNS[model][1]}
+
+
+def apply_typed_answers(row, field_map):
+    """Set the typed columns of a Gambling/Drinking row from its JSON answers."""
+    json_attr = TYPED_ANSWER_COLUMNS[type(row)][0]
+    for role, value in typed_answer_values(type(row), getattr(row, json_attr), field_map).items():
+        setattr(row, role, value)
+
+
+def _needs_normalizing(session, obj):
+    if type(obj) not in TYPED_ANSWER_COLUMNS:
+        return False
+    if obj in session.new:
+        return True
+    json_attr = TYPED_ANSWER_COLUMNS[type(obj)][0]
+    return sa_inspect(obj).attrs[json_attr].history.has_changes()
+
+
+def normalize_pending_answers(session):
+    """before_flush hook: refresh typed columns for new or edited answer rows."""
+    pending = [obj for obj in (*session.new, *session.dirty) if _needs_normalizing(session, obj)]
+    if not pending:
+        return
+    with session.no_autoflush:
+        maps = field_maps_for_users({obj.user_id for obj in pending}, session)
+    default_map = field_map_from_schema(None)
+    for obj in pending:
+        apply_typed_answers(obj, maps.get(obj.user_id, default_map))
+
+
+def backfill_typed_answers(batch_size=BACKFILL_BATCH_SIZE, user_ids=None):
+    """
+    Fill typed columns for rows written before they existed, visiting rows whose
+    typed columns are all NULL. upgrade_schema runs it once and records that, and
+    runs it again only after adding typed columns.
+    With user_ids, every row of those users is recomputed instead (used after
+    a study's questions change, since that can remap which answer is which).
+    Returns the number of rows updated.
+    """
+    updated = 0
+    for model, (json_attr, roles) in TYPED_ANSWER_COLUMNS.items():
+        if user_ids is None:
+            scope = [getattr(model, role).is_(None) for role in roles]
+        elif user_ids:
+            scope = [model.user_id.in_(user_ids)]
+        else:
+            continue
+        last_id = 0
+        while True:
+            batch = (
+                model.query
+                .filter(model.id > last_id, getattr(model, json_attr).isnot(None), *scope)
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                break
+            maps = field_maps_for_users({row.user_id for row in batch})
+            for row in batch:
+                apply_typed_answers(row, maps[row.user_id])
+            last_id = batch[-1].id
+            updated += len(batch)
+            db.session.commit()
+    if updated:
+        logger.info("Backfilled typed answer columns", extra={"rows": updated})
+    return updated
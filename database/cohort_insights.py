@@ -0,0 +1,296 @@
+"""
+Cohort insights: every participant's insight summary for a whole study, plus
+the study-wide distribution (quartiles) of each figure.
+
+The per-participant totals come from one GROUP BY user_id over the study's
+DailyActivity rollups, the behavioural indicators (chasing, loss streaks) from
+compute_gambling_metrics' study-scoped queries, and the roster from one join of
+User to StudyCode. Derived figures and quartiles are then computed per metric
+column, so a study of any size costs the same handful of queries rather than
+one insights load per participant.
+
+Percentile ranks (participant vs. cohort) read a CohortDistribution: each
+metric's cohort values kept sorted, so a rank is two bisects. Distributions are
+cached per study and window; rollup refreshes mark the participants they touch
+and the next read recomputes only those participants (plus roster changes),
+moving their values within the sorted columns instead of rebuilding the study.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from statistics import median, quantiles
+
+from sqlalchemy import case, func, select
+
+from database.activity_rollups import on_rollups_refreshed
+from database.db_initialization import DailyActivity, StudyCode, User, db
+from database.gambling_metrics import compute_gambling_metrics
+from monitoring.metrics import record_cache
+
+# (key, label) of each per-participant figure, in display order
+COHORT_METRICS = (
+    ("gambling_days", "Gambling days"),
+    ("total_sessions", "Gambling sessions"),
+    ("total_intended", "Intended ($)"),
+    ("total_wagered", "Wagered ($)"),
+    ("excess_wagered", "Wagered over intent ($)"),
+    ("over_intent_rate", "Sessions over intent (%)"),
+    ("total_hours", "Hours gambling"),
+    ("total_losses", "Net losses ($)"),
+    ("projected_yearly_losses", "Projected yearly losses ($)"),
+    ("chasing_rate", "Chasing rate (%)"),
+    ("longest_loss_streak", "Longest loss streak (days)"),
+    ("drinking_days", "Drinking days"),
+    ("total_drinks", "Drinks"),
+    ("drinks_per_drinking_day", "Drinks per drinking day"),
+)
+
+
+# Seconds a cached distribution is trusted without re-reading the whole study
+# (covers rollups refreshed by another process).
+DISTRIBUTION_MAX_AGE = 600
+
+
+def _cohort_totals(study_ids, start, end, user_ids=None):
+    """{user_id: summed rollup row} for the study's DailyActivity rows in [start, end]."""
+    query = (
+        select(
+            DailyActivity.user_id,
+            func.sum(case((DailyActivity.gambling_sessions > 0, 1), else_=0)),
+            func.sum(DailyActivity.gambling_sessions),
+            func.sum(DailyActivity.money_intended),
+            func.sum(DailyActivity.money_spent),
+            func.sum(DailyActivity.time_spent),
+            func.sum(DailyActivity.money_earned),
+            func.sum(DailyActivity.over_intent_sessions),
+            func.sum(case((DailyActivity.drinking_sessions > 0, 1), else_=0)),
+            func.sum(DailyActivity.num_drinks),
+        )
+        .where(DailyActivity.study_id.in_(study_ids), DailyActivity.day >= start, DailyActivity.day <= end)
+        .group_by(DailyActivity.user_id)
+    )
+    if user_ids is not None:
+        query = query.where(DailyActivity.user_id.in_(user_ids))
+    return {row[0]: row[1:] for row in db.session.execute(query).all()}
+
+
+def _participant_summary(totals, indicators, window_days):
+    gambling_days, sessions, intended, wagered, hours, net, over_intent, drinking_days, drinks = (
+        value or 0 for value in totals
+    )
+    losses = round(-net, 2) if net < 0 else 0.0
+    return {
+        "gambling_days": gambling_days,
+        "total_sessions": sessions,
+        "total_intended": round(intended, 2),
+        "total_wagered": round(wagered, 2),
+        "excess_wagered": round(wagered - intended, 2),
+        "over_intent_rate": round(over_intent * 100.0 / sessions, 1) if sessions else None,
+        "total_hours": round(hours, 1),
+        "total_losses": losses,
+        "projected_yearly_losses": round(losses * 365 / window_days, 2),
+        "chasing_rate": indicators.get("chasing_rate"),
+        "longest_loss_streak": indicators.get("longest_loss_streak", 0),
+        "drinking_days": drinking_days,
+        "total_drinks": round(drinks, 1),
+        "drinks_per_drinking_day": round(drinks / drinking_days, 1) if drinking_days else None,
+    }
+
+
+def distribution(values):
+    """Min, quartiles and max of the non-None values (None everywhere when there are none)."""
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return {"n": 0, "min": None, "q1": None, "median": None, "q3": None, "max": None}
+    if len(values) == 1:
+        q1 = median = q3 = values[0]
+    else:
+        q1, median, q3 = quantiles(values, n=4, method="inclusive")
+    return {
+        "n": len(values),
+        "min": values[0],
+        "q1": round(q1, 2),
+        "median": round(median, 2),
+        "q3": round(q3, 2),
+        "max": values[-1],
+    }
+
+
+def _participant_summaries(study_ids, window, user_ids=None):
+    """[(user_id, username, summary)] for the studies' participants (optionally only user_ids), by username."""
+    roster = (
+        select(User.id, User.username)
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.is_admin.is_(False), StudyCode.id.in_(study_ids))
+        .order_by(User.username, User.id)
+    )
+    if user_ids is not None:
+        roster = roster.where(User.id.in_(user_ids))
+    roster = db.session.execute(roster).all()
+    totals = _cohort_totals(study_ids, window.start, window.end, user_ids)
+    indicators = compute_gambling_metrics(
+        user_ids=user_ids, study_ids=study_ids,
+        start_date=window.start.isoformat(), end_date=window.end.isoformat(),
+    )
+
+    empty = (0,) * 9
+    return [
+        (user_id, username, _participant_summary(totals.get(user_id, empty), indicators.get(user_id, {}), window.days))
+        for user_id, username in roster
+    ]
+
+
+def compute_cohort_insights(study_ids, window):
+    """
+    Insight summaries for every participant of study_ids over an InsightsWindow,
+    with the distribution of each COHORT_METRICS figure across the cohort.
+    Participants who logged nothing in the window count as zeros; rates that
+    need at least one session or drinking day are left out of their distribution.
+    """
+    participants = [
+        {"user_id": user_id, "username": username, **summary}
+        for user_id, username, summary in _participant_summaries(study_ids, window)
+    ]
+    return {
+        "window": window.as_dict(),
+        "metrics": [{"key": key, "label": label} for key, label in COHORT_METRICS],
+        "participants": participants,
+        "distributions": {
+            key: distribution([participant[key] for participant in participants]) for key, _ in COHORT_METRICS
+        },
+    }
+
+
+class CohortDistribution:
+    """One study's COHORT_METRICS values over a window, each metric's values kept sorted."""
+
+    def __init__(self, start, end, summaries, change_seq):
+        self.start, self.end = start, end
+        self.built_at = time.monotonic()
+        # Rollup refreshes up to this sequence number are reflected in the columns
+        self.change_seq = change_seq
+        self.summaries = {}
+        self.columns = {key: [] for key, _ in COHORT_METRICS}
+        for user_id, _, summary in summaries:
+            self.update(user_id, summary)
+
+    def update(self, user_id, summary):
+        """Replace the participant's values (summary=None removes them) in each sorted column."""
+        previous = self.summaries.pop(user_id, None)
+        if summary is not None:
+            self.summaries[user_id] = summary
+        for key, column in self.columns.items():
+            if previous is not None and previous[key] is not None:
+                del column[bisect_left(column, previous[key])]
+            if summary is not None and summary[key] is not None:
+                insort(column, summary[key])
+
+    def percentile(self, key, value):
+        """Percentile rank of value among the cohort's values of key (ties count half), or None."""
+        column = self.columns[key]
+        if value is None or not column:
+            return None
+        below, through = bisect_left(column, value), bisect_right(column, value)
+        return round((below + through) / 2 * 100 / len(column), 1)
+
+
+_distributions = {}
+_distribution_lock = threading.Lock()
+# user_id -> sequence number of the last rollup refresh that touched the participant
+_changed_users = {}
+_change_seq = 0
+
+
+def _mark_changed(user_ids):
+    global _change_seq
+    with _distribution_lock:
+        _change_seq += 1
+        for user_id in user_ids:
+            _changed_users[user_id] = _change_seq
+
+
+on_rollups_refreshed(_mark_changed)
+
+
+def _prune_changes():
+    """
+    Drop expired distributions, then the refreshes every remaining distribution
+    already reflects, so _changed_users stays bounded. Call with the lock held.
+    """
+    now = time.monotonic()
+    for key in [key for key, cached in _distributions.items() if now - cached.built_at >= DISTRIBUTION_MAX_AGE]:
+        del _distributions[key]
+    floor = min((cached.change_seq for cached in _distributions.values()), default=_change_seq)
+    for user_id in [user_id for user_id, changed_at in _changed_users.items() if changed_at <= floor]:
+        del _changed_users[user_id]
+
+
+def cohort_distribution(study_id, window):
+    """
+    The study's CohortDistribution for window, built on first use and then
+    patched with just the participants refreshed or enrolled since. The columns
+    are patched in place under _distribution_lock; read them with it held.
+    """
+    key = (study_id, window.key)
+    with _distribution_lock:
+        cached = _distributions.get(key)
+    fresh = (
+        cached is not None and (cached.start, cached.end) == (window.start, window.end)
+        and time.monotonic() - cached.built_at < DISTRIBUTION_MAX_AGE
+    )
+    record_cache("cohort_distributions", fresh)
+    if not fresh:
+        seq = _change_seq
+        cached = CohortDistribution(window.start, window.end, _participant_summaries([study_id], window), seq)
+        with _distribution_lock:
+            _distributions[key] = cached
+            _prune_changes()
+        return cached
+
+    roster = set(db.session.execute(
+        select(User.id)
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.is_admin.is_(False), StudyCode.id == study_id)
+    ).scalars())
+    with _distribution_lock:
+        seq = _change_seq
+        changed = {user_id for user_id, changed_at in _changed_users.items() if changed_at > cached.change_seq}
+        stale = (changed & roster) | (roster - cached.summaries.keys())
+    summaries = _participant_summaries([study_id], window, user_ids=sorted(stale)) if stale else []
+    with _distribution_lock:
+        for user_id in cached.summaries.keys() - roster:
+            cached.update(user_id, None)
+        for user_id, _, summary in summaries:
+            cached.update(user_id, summary)
+        cached.change_seq = max(cached.change_seq, seq)
+        _prune_changes()
+    return cached
+
+
+def participant_percentiles(user_id, study_id, window):
+    """
+    {metric: {label, value, percentile, median, n}} ranking the participant
+    against the other participants of study_id over window; {} if they aren't in it.
+    """
+    cohort = cohort_distribution(study_id, window)
+    ranks = {}
+    with _distribution_lock:
+        summary = cohort.summaries.get(user_id)
+        if summary is None:
+            return {}
+        for key, label in COHORT_METRICS:
+            column = cohort.columns[key]
+            ranks[key] = {
+                "label": label,
+                "value": summary[key],
+                "percentile": cohort.percentile(key, summary[key]),
+                "median": round(median(column), 2) if column else None,
+                "n": len(column),
+            }
+    return ranks
+
+
+def clear_distribution_cache():
+    with _distribution_lock:
+        _distributions.clear()
+        _changed_users.clear()
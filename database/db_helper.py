@@ -1,11 +1,130 @@
 import datetime
+import logging
+import sys
+from contextlib import contextmanager
 
+from sqlalchemy import and_, delete, extract, func, insert, or_, select, type_coerce, union
+from sqlalchemy.dialects.postgresql import JSONB
+
+from database.activity_rollups import refresh_daily_rollups
+from database.answer_normalization import TYPED_ANSWER_COLUMNS, field_maps_for_users, typed_answer_values
 from database.db_initialization import User, Gambling, Drinking, db, CalendarEntry
+from database.db_upgrades import cascade_deletes_enforced
+from database.study_scoping import STUDY_SCOPED_MODELS, study_ids_for_users
+
+logger = logging.getLogger(__name__)
 """
     NOTE USING THESE HELPER FUNCTIONS COMMITS THE ENTRIES TO THE DB !!!
-    If we want, we can commit later using the commit_to_db() function but this may cause sync issues
+    Unless they are called inside `with unit_of_work():`, in which case they only
+    stage (and flush) the object and everything is committed once when the block exits.
 """
 
+# Key under db.session.info holding the active UnitOfWork for this session
+_UOW_KEY = "tlfb_unit_of_work"
+
+
+class UnitOfWork:
+    """
+    Collects writes so a whole logical operation costs one transaction.
+    Use through the unit_of_work() context manager rather than directly.
+    """
+
+    def __init__(self):
+        # model -> list of column dicts waiting for a bulk INSERT
+        self._bulk_rows = {}
+
+    def add(self, obj):
+        db.session.add(obj)
+        return obj
+
+    def add_all(self, objects):
+        db.session.add_all(objects)
+        return objects
+
+    def bulk_insert(self, model, rows):
+        """
+        Stage many plain-dict rows of one model. They are sent as a single
+        executemany INSERT at the next flush, skipping per-object ORM bookkeeping.
+        Rows inserted this way are not returned as objects.
+        """
+        self._bulk_rows.setdefault(model, []).extend(dict(row) for row in rows)
+
+    def flush(self):
+        """Send staged objects and bulk rows to the DB without committing (assigns IDs)."""
+        db.session.flush()
+        touched = set()
+        for model, rows in self._bulk_rows.items():
+            if rows:
+                _fill_derived_columns(model, rows)
+                db.session.execute(insert(model), rows)
+                touched |= _rollup_days(model, rows)
+        self._bulk_rows = {}
+        if touched:
+            refresh_daily_rollups(touched)
+
+
+# This function fills the columns the flush hooks derive for ORM objects (study_id, typed answers)
+# Bulk rows skip those hooks, so UnitOfWork.flush calls it before inserting them
+# Parameters: model -> mapped class, rows -> list of column dicts (updated in place)
+# Returns: N/A
+def _fill_derived_columns(model, rows):
+    if model in STUDY_SCOPED_MODELS:
+        study_ids = study_ids_for_users({row["user_id"] for row in rows if row.get("study_id") is None})
+        for row in rows:
+            if row.get("study_id") is None:
+                row["study_id"] = study_ids.get(row["user_id"])
+    if model in TYPED_ANSWER_COLUMNS:
+        json_attr = TYPED_ANSWER_COLUMNS[model][0]
+        maps = field_maps_for_users({row["user_id"] for row in rows})
+        for row in rows:
+            row.update(typed_answer_values(model, row.get(json_attr), maps[row["user_id"]]))
+
+
+# This function finds the (user_id, day) rollups that bulk-inserted answer rows change
+# Calendar entries alone have no totals, so only Gambling/Drinking rows count
+# Parameters: model -> mapped class, rows -> list of column dicts
+# Returns: set of (user_id, date) pairs
+def _rollup_days(model, rows):
+    if model not in TYPED_ANSWER_COLUMNS:
+        return set()
+    entry_ids = {row["entry_id"] for row in rows if row.get("entry_id") is not None}
+    if not entry_ids:
+        return set()
+    entries = db.session.execute(
+        select(CalendarEntry.user_id, CalendarEntry.entry_date).where(CalendarEntry.id.in_(entry_ids))
+    ).all()
+    return {(user_id, entry_date.date()) for user_id, entry_date in entries if entry_date}
+
+
+def get_active_unit_of_work():
+    return db.session.info.get(_UOW_KEY)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Stage several writes and commit them once. Helpers such as create_user and
+    add_gambling_entry join the active unit of work instead of committing, and
+    nested unit_of_work() blocks join the outermost one. Any exception rolls
+    back everything staged in the block.
+    """
+    active = get_active_unit_of_work()
+    if active is not None:
+        yield active
+        return
+
+    uow = UnitOfWork()
+    db.session.info[_UOW_KEY] = uow
+    try:
+        yield uow
+        uow.flush()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.info.pop(_UOW_KEY, None)
+
 # This function creates a user in the db and commits it
 # Parameters: username, first_name, last_name, password (maybe) -> str
 #             is_admin -> bool
@@ -100,115 +219,219 @@ def get_calendar_entries_for_user(user_id: int):
         CalendarEntry.entry_date
     ).all()
 
+# This function deletes every CalendarEntry a user has on one day, plus their answers,
+# with set-based DELETE statements (one when the DB cascades, three otherwise), then
+# recomputes that day's rollup since these statements bypass the flush hooks
+# Parameters: user_id       -> int
+#             day_start     -> datetime at midnight of the day to clear
+#             keep_entry_id -> int (optional), an entry of that day to leave in place
+# Returns: N/A, the caller commits
+def delete_entries_for_day(user_id: int, day_start, keep_entry_id=None):
+    day_end = day_start + datetime.timedelta(days=1)
+    day_filter = [
+        CalendarEntry.user_id == user_id,
+        CalendarEntry.entry_date >= day_start,
+        CalendarEntry.entry_date < day_end,
+    ]
+    if keep_entry_id is not None:
+        day_filter.append(CalendarEntry.id != keep_entry_id)
+
+    if not cascade_deletes_enforced():
+        day_entry_ids = select(CalendarEntry.id).where(*day_filter)
+        for child in (Drinking, Gambling):
+            db.session.execute(
+                delete(child).where(child.entry_id.in_(day_entry_ids)),
+                execution_options={"synchronize_session": False},
+            )
+    db.session.execute(
+        delete(CalendarEntry).where(*day_filter),
+        execution_options={"synchronize_session": False},
+    )
+    refresh_daily_rollups({(user_id, day_start.date())})
+
+# This function builds a SQL condition matching one stored answer exactly
+# On Postgres it uses jsonb containment (@>), which the GIN indexes on the answer columns serve
+# Parameters: column -> Gambling.gambling_questions or Drinking.drinking_questions
+#             question_id -> str, value -> str
+# Returns: SQLAlchemy boolean expression
+def answer_equals(column, question_id, value):
+    if db.session.get_bind().dialect.name == "postgresql":
+        return type_coerce(column, JSONB).contains({question_id: value})
+    return column[question_id].as_string() == value
+
+# This function turns {question_id: value} report filters into one condition on CalendarEntry.id
+# Parameters: answer_filters -> dict (empty/None for no filtering)
+#             schema -> study schema, used to tell drinking questions from gambling ones
+# Returns: SQLAlchemy boolean expression, or None when there is nothing to filter
+def answer_filter_condition(answer_filters, schema=None):
+    if not answer_filters:
+        return None
+    drinking_ids = {q["id"] for q in (schema or {}).get("drinking", [])}
+    conditions = []
+    for question_id, value in answer_filters.items():
+        if question_id in drinking_ids:
+            model, column = Drinking, Drinking.drinking_questions
+        else:
+            model, column = Gambling, Gambling.gambling_questions
+        conditions.append(CalendarEntry.id.in_(
+            select(model.entry_id).where(answer_equals(column, question_id, value))
+        ))
+    return and_(*conditions)
+
 # This function aggregates gambling data across users for the admin report
 # Parameters: start_date -> str (optional), end_date -> str (optional), user_id -> int (optional)
+#             schema -> study schema; the typed answer columns are already mapped per study on write
+#             answer_filters -> dict (optional), {select question id: required answer}
+#             study_ids -> list or subquery of StudyCode ids (optional), matched on the rows' own study_id
 # Returns: dict of aggregated values
-def get_gambling_aggregates(start_date=None, end_date=None, user_id=None, user_ids=None, schema=None):
-    from database.db_initialization import Gambling, Drinking, CalendarEntry
+def get_gambling_aggregates(start_date=None, end_date=None, user_id=None, user_ids=None, schema=None, answer_filters=None, study_ids=None):
     from datetime import datetime
-    from config.config_helper import field_map_from_schema
-    fm = field_map_from_schema(schema)
+    answer_condition = answer_filter_condition(answer_filters, schema)
+
+    def scoped(query, model):
+        query = query.join(CalendarEntry, model.entry_id == CalendarEntry.id)
+        if user_id:
+            query = query.where(model.user_id == user_id)
+        elif user_ids is not None:
+            query = query.where(model.user_id.in_(user_ids))
+        if study_ids is not None:
+            query = query.where(model.study_id.in_(study_ids))
+        if start_date:
+            query = query.where(CalendarEntry.entry_date >= datetime.fromisoformat(start_date).date())
+        if end_date:
+            query = query.where(CalendarEntry.entry_date <= datetime.fromisoformat(end_date).date())
+        if answer_condition is not None:
+            query = query.where(answer_condition)
+        return query
 
     # --- Gambling aggregates ---
-    gambling_query = db.session.query(Gambling, CalendarEntry).join(
-        CalendarEntry, Gambling.entry_id == CalendarEntry.id
-    )
-
-    if user_id:
-        gambling_query = gambling_query.filter(Gambling.user_id == user_id)
-    elif user_ids is not None:
-        gambling_query = gambling_query.filter(Gambling.user_id.in_(user_ids))
-    if start_date:
-        gambling_query = gambling_query.filter(CalendarEntry.entry_date >= datetime.fromisoformat(start_date).date())
-    if end_date:
-        gambling_query = gambling_query.filter(CalendarEntry.entry_date <= datetime.fromisoformat(end_date).date())
-
-    gambling_results = gambling_query.all()
+    total_intended, total_spent, total_hours = db.session.execute(scoped(
+        select(
+            func.coalesce(func.sum(Gambling.money_intended), 0.0),
+            func.coalesce(func.sum(Gambling.money_spent), 0.0),
+            func.coalesce(func.sum(Gambling.time_spent), 0.0),
+        ).select_from(Gambling),
+        Gambling,
+    )).one()
+
+    # 0 = Sunday on both Postgres and SQLite
+    weekday = extract('dow', CalendarEntry.entry_date)
+    spent_by_weekday = {
+        int(dow): float(spent or 0.0)
+        for dow, spent in db.session.execute(scoped(
+            select(weekday, func.coalesce(func.sum(Gambling.money_spent), 0.0))
+            .select_from(Gambling)
+            .group_by(weekday),
+            Gambling,
+        )).all()
+    }
 
     day_labels = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    by_day = {day: 0.0 for day in day_labels}
-
-    total_intended = 0.0
-    total_spent = 0.0
-    total_hours = 0.0
-    gambling_user_ids = set()
-
-    for gambling, calendar_entry in gambling_results:
-        questions = gambling.gambling_questions or {}
-        gambling_user_ids.add(gambling.user_id)
-
-        try:
-            total_intended += float(questions.get(fm['money_intended']) or 0)
-        except (ValueError, TypeError):
-            pass
-
-        try:
-            total_spent += float(questions.get(fm['money_spent']) or 0)
-        except (ValueError, TypeError):
-            pass
-
-        try:
-            total_hours += float(questions.get(fm['time_spent']) or 0)
-        except (ValueError, TypeError):
-            pass
-
-        try:
-            day_name = calendar_entry.entry_date.strftime("%A")
-            by_day[day_name] += float(questions.get(fm['money_spent']) or 0)
-        except (ValueError, TypeError):
-            pass
+    by_day = {
+        day: spent_by_weekday.get((index + 1) % 7, 0.0)
+        for index, day in enumerate(day_labels)
+    }
 
     # --- Drinking aggregates ---
-    drinking_query = db.session.query(Drinking, CalendarEntry).join(
-        CalendarEntry, Drinking.entry_id == CalendarEntry.id
-    )
-
-    if user_id:
-        drinking_query = drinking_query.filter(Drinking.user_id == user_id)
-    elif user_ids is not None:
-        drinking_query = drinking_query.filter(Drinking.user_id.in_(user_ids))
-    if start_date:
-        drinking_query = drinking_query.filter(CalendarEntry.entry_date >= datetime.fromisoformat(start_date).date())
-    if end_date:
-        drinking_query = drinking_query.filter(CalendarEntry.entry_date <= datetime.fromisoformat(end_date).date())
-
-    drinking_results = drinking_query.all()
-
-    total_drinks = 0.0
-    drinking_user_ids = set()
+    total_drinks = db.session.execute(scoped(
+        select(func.coalesce(func.sum(Drinking.num_drinks), 0.0)).select_from(Drinking),
+        Drinking,
+    )).scalar()
 
-    for drinking, calendar_entry in drinking_results:
-        questions = drinking.drinking_questions or {}
-        drinking_user_ids.add(drinking.user_id)
-
-        try:
-            total_drinks += float(questions.get(fm['num_drinks']) or 0)
-        except (ValueError, TypeError):
-            pass
-
-    all_user_ids = gambling_user_ids | drinking_user_ids
+    logged_users = union(
+        scoped(select(Gambling.user_id).select_from(Gambling), Gambling),
+        scoped(select(Drinking.user_id).select_from(Drinking), Drinking),
+    ).subquery()
+    user_count = db.session.execute(select(func.count()).select_from(logged_users)).scalar()
 
     return {
-        "user_count": len(all_user_ids),
-        "total_intended": round(total_intended, 2),
-        "total_spent": round(total_spent, 2),
-        "total_hours": round(total_hours, 2),
+        "user_count": user_count,
+        "total_intended": round(float(total_intended), 2),
+        "total_spent": round(float(total_spent), 2),
+        "total_hours": round(float(total_hours), 2),
         "by_day": {day: round(by_day[day], 2) for day in day_labels},
-        "total_drinks": round(total_drinks, 2),
+        "total_drinks": round(float(total_drinks), 2),
     }
 
+# This function lists one page of a study's participants with their logging summary
+# Parameters: study_code -> str, the StudyCode.code participants enrolled with
+#             prefix -> str (optional), case-insensitive username prefix
+#             after -> (username, user_id) of the last participant already shown (optional)
+#             limit -> int, page size
+# Returns: (list of {"id", "username", "entry_count", "last_logged"}, True if more participants follow)
+def get_participant_directory(study_code, prefix=None, after=None, limit=50):
+    # The page is picked with the (study_group_code, username) index, then only
+    # those participants' entries are counted, all in one statement.
+    page_users = select(User.id, User.username).where(
+        User.is_admin.is_(False), User.study_group_code == study_code,
+    )
+    prefix = (prefix or "").strip().lower()
+    if prefix:
+        # Usernames are stored lower-case. Postgres serves the LIKE from ix_user_study_username_pattern.
+        page_users = page_users.where(User.username.startswith(prefix, autoescape=True))
+        if db.session.get_bind().dialect.name != "postgresql" and ord(prefix[-1]) < sys.maxunicode:
+            # SQLite's LIKE is case-insensitive, so it can't use the index; under its binary
+            # collation everything starting with prefix sorts before prefix with its last code point bumped.
+            page_users = page_users.where(
+                User.username >= prefix,
+                User.username < prefix[:-1] + chr(ord(prefix[-1]) + 1),
+            )
+    if after is not None:
+        after_username, after_id = after
+        page_users = page_users.where(or_(
+            User.username > after_username,
+            and_(User.username == after_username, User.id > after_id),
+        ))
+    page_users = page_users.order_by(User.username, User.id).limit(limit + 1).subquery()
+
+    rows = db.session.execute(
+        select(
+            page_users.c.id,
+            page_users.c.username,
+            func.count(CalendarEntry.id),
+            func.max(CalendarEntry.entry_date),
+        )
+        .select_from(page_users)
+        .outerjoin(CalendarEntry, CalendarEntry.user_id == page_users.c.id)
+        .group_by(page_users.c.id, page_users.c.username)
+        .order_by(page_users.c.username, page_users.c.id)
+    ).all()
+
+    participants = [
+        {
+            "id": user_id,
+            "username": username,
+            "entry_count": entry_count,
+            "last_logged": last_logged.strftime("%Y-%m-%d") if last_logged else None,
+        }
+        for user_id, username, entry_count, last_logged in rows[:limit]
+    ]
+    return participants, len(rows) > limit
+
 # This function adds any object to the session and commits it to Postgres
 # Parameters: new_entry -> db.Model object (User, CalendarEntry, Gambling, etc.)
 # Returns: The committed object if successful, None if failure
+#          (inside unit_of_work(): the flushed object, or raises on failure)
 def commit_to_db(new_entry):
+    # Inside a unit of work only stage + flush (so callers still get an id);
+    # errors propagate so the whole unit rolls back together.
+    uow = get_active_unit_of_work()
+    if uow is not None:
+        uow.add(new_entry)
+        db.session.flush()
+        return new_entry
+
     # Add and Commit to Postgres
     try:
         db.session.add(new_entry)
         db.session.commit()
-        print(f"Successfully commited {new_entry} to database")
+        logger.info(
+            "Committed %s", type(new_entry).__name__,
+            extra={"model": type(new_entry).__name__, "row_id": getattr(new_entry, "id", None), "sampled": True},
+        )
         return new_entry
     # This super cool rollback makes sure nothing is commited if this goes wrong
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Error creating user: {e}")
+        logger.exception("Error committing %s", type(new_entry).__name__, extra={"model": type(new_entry).__name__})
         return None
@@ -1,6 +1,8 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import DeclarativeBase, Session
 
 
 class Base(DeclarativeBase):
@@ -8,6 +10,9 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+# Answer blobs are JSONB on Postgres so they can be GIN-indexed; plain JSON elsewhere (SQLite)
+AnswerJSON = db.JSON().with_variant(JSONB(), "postgresql")
+
 # creating user table that stores ID, password, items, date borrowed and date due
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,25 +22,59 @@ class User(db.Model):
     onboarding_complete = db.Column(db.Boolean, default=False)
     study_group_code = db.Column(db.VARCHAR(50)) # study group being a mix of char and int stored as str
 
+    # Participant directory: paging within one study, and username prefix search. LIKE 'prefix%'
+    # only uses a Postgres btree under a non-C collation with varchar_pattern_ops.
+    __table_args__ = (
+        db.Index('ix_user_study_username', 'study_group_code', 'username'),
+        db.Index(
+            'ix_user_study_username_pattern', 'study_group_code', 'username',
+            postgresql_ops={'username': 'varchar_pattern_ops'},
+        ).ddl_if(dialect='postgresql'),
+    )
+
 class CalendarEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     entry_date = db.Column(db.DateTime, default=datetime.utcnow)
     entry_type = db.Column(db.String(50))
+    # Participant's study at write time (see study_scoping.py), so study analytics need no user lists
+    study_id = db.Column(db.Integer, db.ForeignKey('study_code.id', ondelete='SET NULL'), index=True)
+
+    # Per-participant scans in date order (report paging, directory summaries)
+    __table_args__ = (db.Index('ix_calendar_entry_user_date', 'user_id', 'entry_date'),)
 
 # create a gambling table that stores all gambling information
+# entry_id cascades so removing a CalendarEntry removes its answers in the same statement
 class Gambling(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    entry_id = db.Column(db.Integer, db.ForeignKey('calendar_entry.id'), nullable=False)
+    entry_id = db.Column(db.Integer, db.ForeignKey('calendar_entry.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    gambling_questions = db.Column(db.JSON)
+    gambling_questions = db.Column(AnswerJSON)
+    study_id = db.Column(db.Integer, db.ForeignKey('study_code.id', ondelete='SET NULL'), index=True)
+    # Typed copies of the study's role-mapped answers, filled on write (see answer_normalization.py)
+    time_spent = db.Column(db.Float, index=True)
+    money_intended = db.Column(db.Float, index=True)
+    money_spent = db.Column(db.Float, index=True)
+    money_earned = db.Column(db.Float, index=True)
+    drinks_while_gambling = db.Column(db.Float, index=True)
+
+    __table_args__ = (
+        db.Index('ix_gambling_questions_gin', 'gambling_questions', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
 # create a drinking table that stores all drinking information
 class Drinking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    entry_id = db.Column(db.Integer, db.ForeignKey('calendar_entry.id'), nullable=False)
+    entry_id = db.Column(db.Integer, db.ForeignKey('calendar_entry.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    drinking_questions = db.Column(db.JSON)
+    drinking_questions = db.Column(AnswerJSON)
+    study_id = db.Column(db.Integer, db.ForeignKey('study_code.id', ondelete='SET NULL'), index=True)
+    # Typed copy of the study's role-mapped answer, filled on write (see answer_normalization.py)
+    num_drinks = db.Column(db.Float, index=True)
+
+    __table_args__ = (
+        db.Index('ix_drinking_questions_gin', 'drinking_questions', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
 # create a personal expense table that stores all personal expense information
 class PersonalExpense(db.Model):
@@ -43,13 +82,81 @@ class PersonalExpense(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     personal_expense_questions = db.Column(db.JSON)
 
+# One row per participant per day with that day's activity totals, kept current on write
+# (see activity_rollups.py) so insights over any window read at most one row per day
+class DailyActivity(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    study_id = db.Column(db.Integer, db.ForeignKey('study_code.id', ondelete='SET NULL'), index=True)
+    day = db.Column(db.Date, nullable=False)
+    gambling_sessions = db.Column(db.Integer, default=0)
+    money_intended = db.Column(db.Float, default=0.0)
+    money_spent = db.Column(db.Float, default=0.0)
+    time_spent = db.Column(db.Float, default=0.0)
+    money_earned = db.Column(db.Float, default=0.0)
+    # Sessions whose wager exceeded the amount intended
+    over_intent_sessions = db.Column(db.Integer, default=0)
+    drinking_sessions = db.Column(db.Integer, default=0)
+    num_drinks = db.Column(db.Float, default=0.0)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='uq_daily_activity_user_day'),)
+
 class StudyCode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(8), unique=True, nullable=False)
     title = db.Column(db.String(200), nullable=False)
     researcher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     questions = db.Column(db.JSON, nullable=False)
+    # Bumped whenever questions change so per-study caches (compiled validators) know to rebuild
+    questions_version = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# Data backfills that have run to completion, so startup runs each one once (see db_upgrades.py)
+class CompletedUpgrade(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Responses of writes sent with an Idempotency-Key, replayed to retries (see routes/idempotency.py).
+# Kept in the database so every worker process sees them; status is NULL while the first attempt runs.
+class IdempotencyKey(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = db.Column(db.String(64), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.Integer)
+    body = db.Column(db.LargeBinary)
+    mimetype = db.Column(db.String(100))
+
+
+# Fill derived columns (study_id, typed answers) on every write path
+@event.listens_for(Session, "before_flush")
+def _normalize_answers_before_flush(session, flush_context, instances):
+    from database.activity_rollups import collect_touched_days
+    from database.answer_normalization import normalize_pending_answers
+    from database.study_scoping import assign_pending_study_ids
+    assign_pending_study_ids(session)
+    normalize_pending_answers(session)
+    collect_touched_days(session)
+
+
+# Recompute the daily rollups of the days the flush just changed
+@event.listens_for(Session, "after_flush")
+def _refresh_rollups_after_flush(session, flush_context):
+    from database.activity_rollups import refresh_touched_days
+    refresh_touched_days(session)
+
+
+# Tell rollup-derived caches about refreshed participants once the refresh is committed
+@event.listens_for(Session, "after_commit")
+def _notify_rollups_after_commit(session):
+    from database.activity_rollups import notify_committed_refreshes
+    notify_committed_refreshes(session)
+
 
+@event.listens_for(Session, "after_rollback")
+def _discard_rollups_after_rollback(session):
+    from database.activity_rollups import discard_refreshes
+    discard_refreshes(session)
@@ -0,0 +1,155 @@
+"""
+Idempotent, in-place schema upgrades for databases created by older versions.
+
+db.create_all() only creates missing tables, so changes to existing tables
+(new constraints, columns, indexes) are applied here at startup. Every step
+inspects the live schema first and is a no-op once it has been applied.
+Full-table data backfills record completion in CompletedUpgrade instead, so a
+restart does not rescan every row.
+"""
+import logging
+import weakref
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from database.db_initialization import CalendarEntry, CompletedUpgrade, Drinking, Gambling, StudyCode, User, db
+
+logger = logging.getLogger(__name__)
+
+# Models whose tables may predate columns or indexes added later (typed answers, ...)
+UPGRADED_MODELS = (User, StudyCode, CalendarEntry, Gambling, Drinking)
+
+# Answer columns stored as jsonb (and GIN-indexed) on Postgres
+JSONB_ANSWER_COLUMNS = (("gambling", "gambling_questions"), ("drinking", "drinking_questions"))
+
+# Child tables whose entry_id must cascade when a CalendarEntry is deleted
+CASCADE_CHILD_TABLES = ("drinking", "gambling")
+
+# CompletedUpgrade names of the data backfills
+STUDY_IDS_BACKFILL = "study_ids"
+TYPED_ANSWERS_BACKFILL = "typed_answers"
+DAILY_ROLLUPS_BACKFILL = "daily_rollups"
+
+# engine -> bool, whether the DB itself removes child rows on parent delete
+_cascade_cache = weakref.WeakKeyDictionary()
+
+
+def _entry_fk(inspector, table):
+    for fk in inspector.get_foreign_keys(table):
+        if fk.get("referred_table") == "calendar_entry" and fk.get("constrained_columns") == ["entry_id"]:
+            return fk
+    return None
+
+
+def _upgrade_cascade_foreign_keys(connection, inspector):
+    # SQLite cannot alter constraints in place; new SQLite files get the cascade from create_all.
+    if connection.dialect.name != "postgresql":
+        return
+    for table in CASCADE_CHILD_TABLES:
+        fk = _entry_fk(inspector, table)
+        if fk is None or (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+            continue
+        name = fk["name"]
+        logger.info("Adding ON DELETE CASCADE to %s.entry_id", table)
+        connection.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"'))
+        connection.execute(text(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" FOREIGN KEY (entry_id) '
+            f'REFERENCES calendar_entry (id) ON DELETE CASCADE'
+        ))
+
+
+def _upgrade_jsonb_columns(connection, inspector):
+    # Answer blobs created as json must become jsonb before a GIN index can cover them.
+    if connection.dialect.name != "postgresql":
+        return
+    for table, column_name in JSONB_ANSWER_COLUMNS:
+        for column in inspector.get_columns(table):
+            if column["name"] == column_name and column["type"].__class__.__name__.upper() == "JSON":
+                logger.info("Converting %s.%s to jsonb", table, column_name)
+                connection.execute(text(
+                    f'ALTER TABLE "{table}" ALTER COLUMN "{column_name}" TYPE jsonb USING "{column_name}"::jsonb'
+                ))
+
+
+def _add_missing_columns(connection, inspector, model):
+    """ALTER TABLE ADD COLUMN for model columns the live table lacks, then their indexes."""
+    table = model.__table__
+    existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        logger.info("Adding column %s.%s", table.name, column.name)
+        connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+        added.append(column.name)
+
+    existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing_indexes:
+            index.create(connection, checkfirst=True)
+    return added
+
+
+def _run_once(name, backfill, rerun=False):
+    """Run a data backfill unless it is recorded as complete (or rerun is set), then record it."""
+    completed = db.session.get(CompletedUpgrade, name)
+    if completed is not None and not rerun:
+        return
+    backfill()
+    if completed is None:
+        db.session.add(CompletedUpgrade(name=name))
+    else:
+        completed.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def upgrade_schema():
+    """Bring an existing database up to date with the models. Call after db.create_all()."""
+    from database.activity_rollups import backfill_daily_rollups
+    from database.answer_normalization import TYPED_ANSWER_COLUMNS, backfill_typed_answers
+    from database.study_scoping import STUDY_SCOPED_MODELS, backfill_study_ids
+
+    engine = db.engine
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        _upgrade_cascade_foreign_keys(connection, inspector)
+        _upgrade_jsonb_columns(connection, inspector)
+        added = {model: _add_missing_columns(connection, inspector, model) for model in UPGRADED_MODELS}
+    _cascade_cache.pop(engine, None)
+
+    # A study_id column added just now is empty on every existing row.
+    study_ids_added = any("study_id" in added[model] for model in STUDY_SCOPED_MODELS)
+    _run_once(STUDY_IDS_BACKFILL, backfill_study_ids, rerun=study_ids_added)
+    # New typed columns are empty on every existing row, so they need the backfill again.
+    typed_columns_added = any(
+        set(added[model]) & set(roles) for model, (_, roles) in TYPED_ANSWER_COLUMNS.items()
+    )
+    _run_once(TYPED_ANSWERS_BACKFILL, backfill_typed_answers, rerun=typed_columns_added)
+    # Writes keep the rollups current from then on.
+    _run_once(DAILY_ROLLUPS_BACKFILL, backfill_daily_rollups)
+
+
+def cascade_deletes_enforced():
+    """
+    True when deleting a calendar_entry row makes the DB delete its drinking and
+    gambling rows. SQLite only enforces foreign keys with PRAGMA foreign_keys=ON.
+    """
+    engine = db.engine
+    cached = _cascade_cache.get(engine)
+    if cached is not None:
+        return cached
+
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        enforced = all(
+            (fk := _entry_fk(inspector, table)) is not None
+            and (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+            for table in CASCADE_CHILD_TABLES
+        )
+        if enforced and connection.dialect.name == "sqlite":
+            enforced = bool(connection.execute(text("PRAGMA foreign_keys")).scalar())
+
+    _cascade_cache[engine] = enforced
+    return enforced
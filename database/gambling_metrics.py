@@ -0,0 +1,183 @@
+"""
+Derived gambling indicators over each participant's ordered gambling days.
+
+Everything is computed in SQL: each participant's gambling answers are first
+collapsed to one row per day, then window functions (LAG, ROW_NUMBER) compare
+each day with the one before it. One participant or a whole study costs the
+same two queries. The typed answer columns are already mapped to each
+participant's study questions on write, so custom studies need no field map here.
+
+Indicators:
+  - wager/intent ratio distribution: how far each day's wager exceeded the
+    amount the participant intended to gamble with
+  - loss days and the longest run of consecutive losing gambling days
+  - chasing: a gambling day that follows a losing gambling day with a larger wager
+  - drinking while gambling: gambling days with drinks reported while gambling
+    or a drinking entry on the same day
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_, select
+
+from database.db_initialization import CalendarEntry, Drinking, Gambling, db
+
+# Upper bounds of the overspend ratio buckets (wagered / intended), after "within intent" (<= 1).
+RATIO_BUCKETS = (("up_to_1_5x", 1.5), ("up_to_2x", 2.0))
+
+
+def _gambling_days(user_ids, study_ids, start_date, end_date):
+    """One row per (participant, gambling day) with that day's totals and same-day drinks."""
+    day = func.date(CalendarEntry.entry_date)
+
+    def scoped(query, model):
+        query = query.join(CalendarEntry, model.entry_id == CalendarEntry.id)
+        if user_ids is not None:
+            query = query.where(model.user_id.in_(user_ids))
+        if study_ids is not None:
+            query = query.where(model.study_id.in_(study_ids))
+        if start_date:
+            query = query.where(CalendarEntry.entry_date >= datetime.strptime(start_date, "%Y-%m-%d"))
+        if end_date:
+            query = query.where(
+                CalendarEntry.entry_date < datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+            )
+        return query
+
+    gambling = scoped(
+        select(
+            Gambling.user_id.label("user_id"),
+            day.label("day"),
+            func.sum(Gambling.money_spent).label("wagered"),
+            func.sum(Gambling.money_intended).label("intended"),
+            func.sum(Gambling.money_earned).label("net"),
+            func.max(Gambling.drinks_while_gambling).label("drinks_while_gambling"),
+        ),
+        Gambling,
+    ).group_by(Gambling.user_id, day).subquery()
+
+    drinking = scoped(
+        select(Drinking.user_id.label("user_id"), day.label("day"), func.sum(Drinking.num_drinks).label("drinks")),
+        Drinking,
+    ).group_by(Drinking.user_id, day).subquery()
+
+    is_loss = case((gambling.c.net < 0, 1), else_=0)
+    by_day = dict(partition_by=gambling.c.user_id, order_by=gambling.c.day)
+    return select(
+        gambling.c.user_id,
+        gambling.c.day,
+        gambling.c.wagered,
+        gambling.c.intended,
+        is_loss.label("is_loss"),
+        case(
+            (or_(func.coalesce(gambling.c.drinks_while_gambling, 0) > 0, func.coalesce(drinking.c.drinks, 0) > 0), 1),
+            else_=0,
+        ).label("drinking"),
+        func.lag(gambling.c.net).over(**by_day).label("prev_net"),
+        func.lag(gambling.c.wagered).over(**by_day).label("prev_wagered"),
+        # Consecutive days with the same outcome share (row_number - row_number by outcome).
+        (
+            func.row_number().over(**by_day)
+            - func.row_number().over(partition_by=(gambling.c.user_id, is_loss), order_by=gambling.c.day)
+        ).label("run"),
+    ).outerjoin(
+        drinking, and_(drinking.c.user_id == gambling.c.user_id, drinking.c.day == gambling.c.day)
+    ).subquery()
+
+
+def compute_gambling_metrics(user_ids=None, study_ids=None, start_date=None, end_date=None):
+    """
+    Return {user_id: indicators} for the participants in user_ids and/or
+    study_ids (lists or subqueries), over an optional inclusive YYYY-MM-DD window.
+    Participants without gambling days are omitted.
+    """
+    days = _gambling_days(user_ids, study_ids, start_date, end_date)
+    has_intent = days.c.intended > 0
+    after_loss = days.c.prev_net < 0
+
+    ratio_columns = [func.sum(case((and_(has_intent, days.c.wagered <= days.c.intended), 1), else_=0))]
+    lower = 1.0
+    for _, upper in RATIO_BUCKETS:
+        ratio_columns.append(func.sum(case(
+            (and_(has_intent, days.c.wagered > days.c.intended * lower, days.c.wagered <= days.c.intended * upper), 1),
+            else_=0,
+        )))
+        lower = upper
+    ratio_columns.append(func.sum(case((and_(has_intent, days.c.wagered > days.c.intended * lower), 1), else_=0)))
+    ratio = case((has_intent, days.c.wagered * 1.0 / days.c.intended))
+
+    rows = db.session.execute(
+        select(
+            days.c.user_id,
+            func.count(),
+            *ratio_columns,
+            func.avg(ratio),
+            func.max(ratio),
+            func.sum(days.c.is_loss),
+            func.sum(case((after_loss, 1), else_=0)),
+            func.sum(case((and_(after_loss, days.c.wagered > days.c.prev_wagered), 1), else_=0)),
+            func.sum(days.c.drinking),
+        ).group_by(days.c.user_id)
+    ).all()
+
+    loss_runs = select(days.c.user_id, func.count().label("length")).where(days.c.is_loss == 1).group_by(
+        days.c.user_id, days.c.run
+    ).subquery()
+    longest_streaks = dict(db.session.execute(
+        select(loss_runs.c.user_id, func.max(loss_runs.c.length)).group_by(loss_runs.c.user_id)
+    ).all())
+
+    bucket_names = ["within_intent"] + [name for name, _ in RATIO_BUCKETS] + [f"over_{int(lower)}x"]
+    metrics = {}
+    for row in rows:
+        user_id, gambling_days, *rest = row
+        buckets, (avg_ratio, max_ratio, loss_days, opportunities, chasing_days, drinking_days) = (
+            rest[:len(bucket_names)], rest[len(bucket_names):]
+        )
+        distribution = {name: int(count or 0) for name, count in zip(bucket_names, buckets)}
+        distribution["no_intent"] = gambling_days - sum(distribution.values())
+        opportunities = int(opportunities or 0)
+        chasing_days = int(chasing_days or 0)
+        drinking_days = int(drinking_days or 0)
+        metrics[user_id] = {
+            "gambling_days": gambling_days,
+            "ratio_distribution": distribution,
+            "average_wager_intent_ratio": round(avg_ratio, 2) if avg_ratio is not None else None,
+            "max_wager_intent_ratio": round(max_ratio, 2) if max_ratio is not None else None,
+            "loss_days": int(loss_days or 0),
+            "longest_loss_streak": int(longest_streaks.get(user_id) or 0),
+            "chasing_opportunities": opportunities,
+            "chasing_days": chasing_days,
+            "chasing_rate": round(chasing_days * 100.0 / opportunities, 1) if opportunities else None,
+            "drinking_gambling_days": drinking_days,
+            "drinking_gambling_rate": round(drinking_days * 100.0 / gambling_days, 1),
+        }
+    return metrics
+
+
+def pool_gambling_metrics(metrics):
+    """Combine per-participant indicators into study-wide totals for the admin report."""
+    pooled = {
+        "participants": len(metrics),
+        "gambling_days": 0,
+        "ratio_distribution": {},
+        "loss_days": 0,
+        "longest_loss_streak": 0,
+        "chasing_opportunities": 0,
+        "chasing_days": 0,
+        "participants_chasing": 0,
+        "drinking_gambling_days": 0,
+    }
+    for item in metrics.values():
+        for key in ("gambling_days", "loss_days", "chasing_opportunities", "chasing_days", "drinking_gambling_days"):
+            pooled[key] += item[key]
+        for name, count in item["ratio_distribution"].items():
+            pooled["ratio_distribution"][name] = pooled["ratio_distribution"].get(name, 0) + count
+        pooled["longest_loss_streak"] = max(pooled["longest_loss_streak"], item["longest_loss_streak"])
+        if item["chasing_days"]:
+            pooled["participants_chasing"] += 1
+
+    opportunities = pooled["chasing_opportunities"]
+    pooled["chasing_rate"] = round(pooled["chasing_days"] * 100.0 / opportunities, 1) if opportunities else None
+    days = pooled["gambling_days"]
+    pooled["drinking_gambling_rate"] = round(pooled["drinking_gambling_days"] * 100.0 / days, 1) if days else None
+    return pooled
@@ -0,0 +1,274 @@
+"""
+Columnar building blocks for the participant insights page.
+
+Insights read the participant's DailyActivity rollups (see activity_rollups.py):
+one query returns at most one row per day of the window, split into parallel,
+date-ordered gambling and drinking columns. Totals, monthly groups,
+day-of-week groups and chart series are then produced with whole-column
+operations (sum over slices, compress) instead of per-row Python loops, so a
+whole-study window costs about the same as the last 30 days.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from itertools import compress, groupby
+
+from sqlalchemy import func, select
+
+from database.db_initialization import DailyActivity, db
+
+DOW_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# "%b" month names, resolved once instead of calling strftime per row.
+MONTH_ABBR = [""] + [date(2000, month, 1).strftime("%b") for month in range(1, 13)]
+MONTH_NAME = [""] + [date(2000, month, 1).strftime("%B") for month in range(1, 13)]
+
+# Selectable insights windows: key -> (label, length in days; None = since the first logged day)
+INSIGHTS_WINDOWS = {
+    "30d": ("past 30 days", 30),
+    "3m": ("past 3 months", 91),
+    "6m": ("past 6 months", 182),
+    "1y": ("past year", 365),
+    "all": ("whole study", None),
+}
+DEFAULT_INSIGHTS_WINDOW = "3m"
+
+# Most points a timeline chart payload carries; app.config["CHART_POINT_BUDGET"] overrides it.
+DEFAULT_CHART_POINT_BUDGET = 120
+
+class _DayColumns:
+    """Parallel, date-ordered columns named by the subclass's __slots__ (dates first)."""
+
+    __slots__ = ()
+
+    def __init__(self, rows):
+        columns = list(map(list, zip(*rows))) if rows else [[] for _ in self.__slots__]
+        for name, column in zip(self.__slots__, columns):
+            setattr(self, name, column)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def between(self, start, end):
+        """The rows dated within [start, end], found by bisecting the sorted dates."""
+        lo, hi = bisect_left(self.dates, start), bisect_right(self.dates, end)
+        sliced = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(sliced, name, getattr(self, name)[lo:hi])
+        return sliced
+
+
+class GamblingColumns(_DayColumns):
+    """One participant's gambling days."""
+
+    __slots__ = ("dates", "sessions", "intended", "wagered", "hours", "net", "over_intent")
+
+
+class DrinkingColumns(_DayColumns):
+    """One participant's drinking days."""
+
+    __slots__ = ("dates", "sessions", "drinks")
+
+
+class InsightsWindow:
+    """An inclusive [start, end] range of days and how to describe it."""
+
+    __slots__ = ("key", "start", "end", "label")
+
+    def __init__(self, key, start, end, label):
+        self.key, self.start, self.end, self.label = key, start, end, label
+
+    @property
+    def days(self):
+        return (self.end - self.start).days + 1
+
+    def query_args(self):
+        """Query string arguments that select this window again."""
+        if self.key == "custom":
+            return {"start": self.start.isoformat(), "end": self.end.isoformat()}
+        return {"window": self.key}
+
+    def as_dict(self):
+        return {
+            "key": self.key,
+            "label": self.label,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "days": self.days,
+        }
+
+
+def first_activity_day(user_id, study_ids=None):
+    """The participant's first logged day or, with study_ids, the first day logged in those studies."""
+    scope = DailyActivity.study_id.in_(study_ids) if study_ids is not None else DailyActivity.user_id == user_id
+    return db.session.execute(select(func.min(DailyActivity.day)).where(scope)).scalar()
+
+
+def resolve_insights_window(user_id, window=None, start_date=None, end_date=None, today=None, study_ids=None):
+    """
+    Build the InsightsWindow for a preset key from INSIGHTS_WINDOWS or, when
+    start_date is given, a custom inclusive YYYY-MM-DD range. Raises ValueError
+    for an unknown key or malformed dates. "all" starts at the participant's
+    first logged day, or the studies' first day when study_ids is given.
+    """
+    today = today or datetime.utcnow().date()
+    if start_date:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else today
+        if start > end:
+            raise ValueError("start_date must not be after end_date")
+        label = f"period from {start:%b} {start.day}, {start.year} to {end:%b} {end.day}, {end.year}"
+        return InsightsWindow("custom", start, end, label)
+
+    key = window or DEFAULT_INSIGHTS_WINDOW
+    if key not in INSIGHTS_WINDOWS:
+        raise ValueError(f"Unknown insights window: {key}")
+    label, length = INSIGHTS_WINDOWS[key]
+    if length is None:
+        start = min(first_activity_day(user_id, study_ids) or today, today)
+    else:
+        start = today - timedelta(days=length - 1)
+    return InsightsWindow(key, start, today, label)
+
+
+def load_daily_columns(user_id, start, end):
+    """The participant's rollups for days in [start, end], as (GamblingColumns, DrinkingColumns)."""
+    rows = db.session.connection().execute(
+        select(
+            DailyActivity.day,
+            DailyActivity.gambling_sessions,
+            DailyActivity.money_intended,
+            DailyActivity.money_spent,
+            DailyActivity.time_spent,
+            DailyActivity.money_earned,
+            DailyActivity.over_intent_sessions,
+            DailyActivity.drinking_sessions,
+            DailyActivity.num_drinks,
+        )
+        .where(DailyActivity.user_id == user_id, DailyActivity.day >= start, DailyActivity.day <= end)
+        .order_by(DailyActivity.day)
+    ).all()
+    gambling = GamblingColumns([row[:7] for row in rows if row[1]])
+    drinking = DrinkingColumns([(row[0], row[7], row[8]) for row in rows if row[7]])
+    return gambling, drinking
+
+
+def month_slices(dates):
+    """[(year, month, start, stop)] for each run of rows in the same calendar month."""
+    slices = []
+    start = 0
+    for (year, month), run in groupby(dates, key=lambda moment: (moment.year, moment.month)):
+        stop = start + sum(1 for _ in run)
+        slices.append((year, month, start, stop))
+        start = stop
+    return slices
+
+
+def range_sum(dates, values, start, stop):
+    """Sum of values whose date falls in [start, stop), found by bisecting the sorted dates."""
+    return sum(values[bisect_left(dates, start):bisect_left(dates, stop)])
+
+
+def weekday_sums(dates, *value_columns):
+    """Per weekday (0=Mon): the sum of each value column."""
+    weekdays = [moment.weekday() for moment in dates]
+    return [
+        [sum(compress(values, map(weekday.__eq__, weekdays))) for weekday in range(7)]
+        for values in value_columns
+    ]
+
+
+def chart_labels(dates):
+    return [f"{MONTH_ABBR[moment.month]} {moment.day}" for moment in dates]
+
+
+def week_buckets(dates, *value_columns):
+    """Sum each value column per Monday-starting week: (week start dates, summed columns)."""
+    week_starts = [moment - timedelta(days=moment.weekday()) for moment in dates]
+    starts = []
+    sums = [[] for _ in value_columns]
+    position = 0
+    for week_start, run in groupby(week_starts):
+        stop = position + sum(1 for _ in run)
+        starts.append(week_start)
+        for bucketed, values in zip(sums, value_columns):
+            bucketed.append(sum(values[position:stop]))
+        position = stop
+    return starts, sums
+
+
+def lttb_indices(xs, ys, budget):
+    """
+    Indices of at most `budget` points chosen by largest-triangle-three-buckets:
+    the first and last points, plus from each bucket in between the point that
+    forms the largest triangle with the previous pick and the next bucket's mean.
+    Spikes make large triangles, so peaks survive the reduction.
+    """
+    count = len(ys)
+    if count <= budget:
+        return list(range(count))
+    if budget < 3:
+        return [0, count - 1][:max(budget, 1)]
+
+    bucket_size = (count - 2) / (budget - 2)
+    picked = [0]
+    for bucket in range(budget - 2):
+        start = int(bucket * bucket_size) + 1
+        stop = int((bucket + 1) * bucket_size) + 1
+        next_start, next_stop = stop, min(int((bucket + 2) * bucket_size) + 1, count)
+        mean_x = sum(xs[next_start:next_stop]) / (next_stop - next_start)
+        mean_y = sum(ys[next_start:next_stop]) / (next_stop - next_start)
+        ax, ay = xs[picked[-1]], ys[picked[-1]]
+        picked.append(max(
+            range(start, stop),
+            key=lambda index: abs((ax - mean_x) * (ys[index] - ay) - (ax - xs[index]) * (mean_y - ay)),
+        ))
+    picked.append(count - 1)
+    return picked
+
+
+def chart_series(columns, budget):
+    """
+    The wagered/intended timeline of a GamblingColumns, reduced to at most
+    `budget` points: daily points when they fit, weekly totals when the weeks
+    fit, otherwise the daily points LTTB keeps (chosen on the wagered series).
+    """
+    dates, intended, wagered = columns.dates, columns.intended, columns.wagered
+    granularity = "day"
+    if len(dates) > budget:
+        weeks, (week_intended, week_wagered) = week_buckets(dates, intended, wagered)
+        if len(weeks) <= budget:
+            granularity = "week"
+            dates, intended, wagered = weeks, week_intended, week_wagered
+        else:
+            granularity = "sample"
+            keep = lttb_indices([moment.toordinal() for moment in dates], wagered, budget)
+            dates = [dates[index] for index in keep]
+            intended = [intended[index] for index in keep]
+            wagered = [wagered[index] for index in keep]
+
+    labels = chart_labels(dates)
+    if granularity == "week":
+        labels = [f"Week of {label}" for label in labels]
+    return {
+        "granularity": granularity,
+        "labels": labels,
+        "intended": [round(value, 2) for value in intended],
+        "wagered": [round(value, 2) for value in wagered],
+    }
+
+
+def monthly_breakdown(columns):
+    """Per-month sessions, intended, wagered, over-intent count and difference, oldest first."""
+    breakdown = []
+    for year, month, start, stop in month_slices(columns.dates):
+        intended = round(sum(columns.intended[start:stop]), 2)
+        wagered = round(sum(columns.wagered[start:stop]), 2)
+        breakdown.append({
+            "label": f"{MONTH_NAME[month]} {year}",
+            "sessions": sum(columns.sessions[start:stop]),
+            "intended": intended,
+            "wagered": wagered,
+            "over_intent": sum(columns.over_intent[start:stop]),
+            "diff": round(wagered - intended, 2),
+        })
+    return breakdown
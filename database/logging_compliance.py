@@ -0,0 +1,107 @@
+"""
+Logging compliance: which days of a study window each participant filled in.
+
+A day counts as logged when the participant has any calendar entry on it,
+including "no drinking or gambling" days. One indexed range scan over the
+study's calendar entries is folded into a per-participant day bitmap (an int
+whose bit i is day start + i), and every figure is then bit arithmetic on that
+int: popcount for logged days, the highest and lowest set bits for the first
+and last logged day, and a shift-and-mask loop for the longest gap.
+"""
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import select
+
+from database.db_initialization import CalendarEntry, StudyCode, User, db
+
+# Fields the compliance table can be sorted by (username is the tie-breaker)
+COMPLIANCE_SORT_KEYS = ("username", "compliance", "logged_days", "missing_days", "longest_gap", "days_since_last_log")
+
+
+def logged_day_bitmaps(study_id, start, end):
+    """{user_id: bitmap of the days in [start, end] with at least one calendar entry}."""
+    rows = db.session.execute(
+        select(CalendarEntry.user_id, CalendarEntry.entry_date).where(
+            CalendarEntry.study_id == study_id,
+            CalendarEntry.entry_date >= datetime.combine(start, time.min),
+            CalendarEntry.entry_date < datetime.combine(end + timedelta(days=1), time.min),
+        )
+    ).all()
+    bitmaps = {}
+    for user_id, entry_date in rows:
+        bitmaps[user_id] = bitmaps.get(user_id, 0) | (1 << (entry_date.date() - start).days)
+    return bitmaps
+
+
+def longest_run(bits):
+    """Length of the longest run of consecutive set bits."""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def compliance_row(bitmap, start, window_days):
+    """Logged/missing figures for one participant's day bitmap over a window of window_days from start."""
+    full = (1 << window_days) - 1
+    logged = bitmap.bit_count()
+    row = {
+        "logged_days": logged,
+        "missing_days": window_days - logged,
+        "compliance": round(logged * 100.0 / window_days, 1),
+        "longest_gap": longest_run(~bitmap & full),
+        "first_logged": None,
+        "last_logged": None,
+        "days_since_last_log": None,
+    }
+    if bitmap:
+        last = bitmap.bit_length() - 1
+        row["first_logged"] = (start + timedelta(days=(bitmap & -bitmap).bit_length() - 1)).isoformat()
+        row["last_logged"] = (start + timedelta(days=last)).isoformat()
+        row["days_since_last_log"] = window_days - 1 - last
+    return row
+
+
+def compute_logging_compliance(study_id, start, end, sort="compliance", descending=False):
+    """
+    One row per participant of the study for the inclusive [start, end] window,
+    sorted by a COMPLIANCE_SORT_KEYS field (participants who never logged sort
+    as if their last log was before the window). Raises ValueError for an
+    unknown sort key.
+    """
+    if sort not in COMPLIANCE_SORT_KEYS:
+        raise ValueError(f"Unknown sort key: {sort}")
+    window_days = (end - start).days + 1
+    roster = db.session.execute(
+        select(User.id, User.username)
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.is_admin.is_(False), StudyCode.id == study_id)
+    ).all()
+    bitmaps = logged_day_bitmaps(study_id, start, end)
+
+    rows = [
+        {"user_id": user_id, "username": username, **compliance_row(bitmaps.get(user_id, 0), start, window_days)}
+        for user_id, username in roster
+    ]
+    rows.sort(key=lambda row: row["username"])
+    if sort != "username":
+        never = window_days if sort == "days_since_last_log" else 0
+        rows.sort(key=lambda row: never if row[sort] is None else row[sort], reverse=descending)
+    elif descending:
+        rows.reverse()
+    return rows
+
+
+def summarize_compliance(rows, window_days):
+    """Study-wide totals for the compliance table header."""
+    expected = len(rows) * window_days
+    logged = sum(row["logged_days"] for row in rows)
+    return {
+        "participants": len(rows),
+        "window_days": window_days,
+        "logged_days": logged,
+        "missing_days": expected - logged,
+        "compliance": round(logged * 100.0 / expected, 1) if expected else None,
+        "fully_compliant": sum(1 for row in rows if row["missing_days"] == 0),
+    }
@@ -0,0 +1,96 @@
+"""
+Participants x days activity grid for a study, in a compact encoding.
+
+One query reads the study's calendar entries in the range, each with whether
+it has drinking and gambling answers. Cells are packed four to a byte (2 bits
+per cell, row-major, first cell in the low bits) and sent base64 encoded, with
+the participant list as the row index and start + day offset as the column
+index. Days with both drinking and gambling are stored as gambling in the grid
+and flagged in a second, 1-bit-per-cell plane. A 500 x 180 grid is about 22 KB
+of cells plus 11 KB for the overlap plane before base64.
+"""
+import base64
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import func, select
+
+from database.db_initialization import CalendarEntry, Drinking, Gambling, StudyCode, User, db
+
+# Cell values, by index
+HEATMAP_STATES = ("missing", "none", "drinking", "gambling")
+MISSING, NO_ACTIVITY, DRINKING, GAMBLING = range(4)
+
+MAX_HEATMAP_DAYS = 366
+
+
+def _logged_days(study_id, start, end):
+    """{(user_id, day offset): (has drinking, has gambling)} for the study's entries in [start, end]."""
+    rows = db.session.execute(
+        select(CalendarEntry.user_id, CalendarEntry.entry_date, func.count(Drinking.id), func.count(Gambling.id))
+        .outerjoin(Drinking, Drinking.entry_id == CalendarEntry.id)
+        .outerjoin(Gambling, Gambling.entry_id == CalendarEntry.id)
+        .where(
+            CalendarEntry.study_id == study_id,
+            CalendarEntry.entry_date >= datetime.combine(start, time.min),
+            CalendarEntry.entry_date < datetime.combine(end + timedelta(days=1), time.min),
+        )
+        .group_by(CalendarEntry.id, CalendarEntry.user_id, CalendarEntry.entry_date)
+    ).all()
+    days = {}
+    for user_id, entry_date, drinking, gambling in rows:
+        key = (user_id, (entry_date.date() - start).days)
+        had_drinking, had_gambling = days.get(key, (False, False))
+        days[key] = (had_drinking or drinking > 0, had_gambling or gambling > 0)
+    return days
+
+
+def _encode(packed):
+    return base64.b64encode(bytes(packed)).decode("ascii")
+
+
+def build_study_heatmap(study_id, start, end):
+    """
+    The study's participants x days grid over the inclusive [start, end] range.
+    Raises ValueError for a range over MAX_HEATMAP_DAYS.
+    """
+    day_count = (end - start).days + 1
+    if day_count > MAX_HEATMAP_DAYS:
+        raise ValueError(f"Range is longer than {MAX_HEATMAP_DAYS} days")
+
+    roster = db.session.execute(
+        select(User.id, User.username)
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.is_admin.is_(False), StudyCode.id == study_id)
+        .order_by(User.username, User.id)
+    ).all()
+    row_of = {user_id: index for index, (user_id, _) in enumerate(roster)}
+
+    cell_count = len(roster) * day_count
+    cells = bytearray((cell_count + 3) // 4)
+    both = bytearray((cell_count + 7) // 8)
+    for (user_id, offset), (drinking, gambling) in _logged_days(study_id, start, end).items():
+        row = row_of.get(user_id)
+        if row is None:
+            continue
+        index = row * day_count + offset
+        state = GAMBLING if gambling else DRINKING if drinking else NO_ACTIVITY
+        cells[index >> 2] |= state << ((index & 3) * 2)
+        if drinking and gambling:
+            both[index >> 3] |= 1 << (index & 7)
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": day_count,
+        "participants": [{"user_id": user_id, "username": username} for user_id, username in roster],
+        "states": list(HEATMAP_STATES),
+        "encoding": "base64, 2 bits per cell, row-major, first cell in the lowest bits",
+        "cells": _encode(cells),
+        "both": _encode(both),
+    }
+
+
+def decode_heatmap_cells(encoded, cell_count):
+    """The cell values of a base64 "cells" payload, as a flat row-major list."""
+    packed = base64.b64decode(encoded)
+    return [(packed[index >> 2] >> ((index & 3) * 2)) & 3 for index in range(cell_count)]
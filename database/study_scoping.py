@@ -0,0 +1,99 @@
+"""
+Study scoping: every CalendarEntry, Gambling and Drinking row carries the id of
+the participant's study, so study-level queries are one indexed predicate
+(`study_id = ?` or `study_id IN (researcher's studies)`) instead of a
+materialised list of participant ids.
+"""
+import logging
+
+from sqlalchemy import select, update
+
+from database.db_initialization import CalendarEntry, Drinking, Gambling, StudyCode, User, db
+
+logger = logging.getLogger(__name__)
+
+STUDY_SCOPED_MODELS = (CalendarEntry, Gambling, Drinking)
+
+
+def study_ids_for_users(user_ids, session=None):
+    """Return {user_id: study id or None} in one query."""
+    session = session or db.session
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    rows = session.execute(
+        select(User.id, StudyCode.id)
+        .outerjoin(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.id.in_(user_ids))
+    ).all()
+    return dict(rows)
+
+
+def assign_pending_study_ids(session):
+    """before_flush hook: stamp new study-scoped rows with their participant's study."""
+    pending = [
+        obj for obj in session.new
+        if isinstance(obj, STUDY_SCOPED_MODELS) and obj.study_id is None and obj.user_id is not None
+    ]
+    if not pending:
+        return
+    with session.no_autoflush:
+        study_ids = study_ids_for_users({obj.user_id for obj in pending}, session)
+    for obj in pending:
+        obj.study_id = study_ids.get(obj.user_id)
+
+
+def backfill_study_ids():
+    """
+    Set study_id on rows written before the column existed, with one
+    set-based UPDATE per table. Returns the number of rows updated.
+    """
+    updated = 0
+    for model in STUDY_SCOPED_MODELS:
+        participant_study = (
+            select(StudyCode.id)
+            .join(User, User.study_group_code == StudyCode.code)
+            .where(User.id == model.user_id)
+            .scalar_subquery()
+        )
+        enrolled_users = select(User.id).join(StudyCode, StudyCode.code == User.study_group_code)
+        result = db.session.execute(
+            update(model)
+            .where(model.study_id.is_(None), model.user_id.in_(enrolled_users))
+            .values(study_id=participant_study)
+            .execution_options(synchronize_session=False)
+        )
+        updated += result.rowcount or 0
+    db.session.commit()
+    if updated:
+        logger.info("Backfilled study ids", extra={"rows": updated})
+    return updated
+
+
+def researcher_study_ids(researcher_id):
+    """Subquery of the ids of every study a researcher owns, for `study_id IN (...)`."""
+    return select(StudyCode.id).where(StudyCode.researcher_id == researcher_id)
+
+
+def participant_in_studies(user_id, study_ids):
+    """Return the participant if they belong to one of study_ids (a list or subquery), else None."""
+    if not user_id:
+        return None
+    return (
+        User.query
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .filter(User.id == user_id, User.is_admin.is_(False), StudyCode.id.in_(study_ids))
+        .first()
+    )
+
+
+def participants_in_studies(user_ids, study_ids):
+    """[(User, StudyCode)] for the user_ids that are participants of study_ids, in one query, by username."""
+    if not user_ids:
+        return []
+    return db.session.execute(
+        select(User, StudyCode)
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .where(User.id.in_(user_ids), User.is_admin.is_(False), StudyCode.id.in_(study_ids))
+        .order_by(User.username, User.id)
+    ).all()
@@ -0,0 +1,184 @@
+"""
+Study-level activity over time for researcher dashboards.
+
+One GROUP BY day over the study's DailyActivity rollups returns the summed
+drinks, hours, intended and wagered amounts; weekly series sum those days per
+Monday-starting week in Python. Participants logging are counted from the
+calendar entries themselves (logged_day_bitmaps), so abstinent "no activity"
+days count the same as they do in the compliance table. Buckets without
+activity are filled with zeros so the columns chart directly.
+
+Results are cached per study, range and granularity. Committed rollup refreshes
+mark their participants; the next read looks up those participants' studies and
+drops the studies' cached series. Entries are otherwise kept for SERIES_MAX_AGE
+seconds so refreshes made by other processes still show up.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from database.activity_rollups import on_rollups_refreshed
+from database.db_initialization import DailyActivity, db
+from database.insights_engine import week_buckets
+from database.logging_compliance import logged_day_bitmaps
+from database.study_scoping import study_ids_for_users
+from monitoring.metrics import record_cache
+
+SERIES_GRANULARITIES = ("day", "week")
+
+# Longest range one request may cover
+MAX_SERIES_DAYS = 3 * 366
+
+SERIES_MAX_AGE = 300
+SERIES_CACHE_SIZE = 256
+
+SERIES_COLUMNS = ("participants", "drinks", "hours", "intended", "wagered")
+
+_series_cache = {}
+_series_lock = threading.Lock()
+# user_id -> sequence number of the last committed rollup refresh that touched the participant
+_refreshed_users = {}
+# study_id -> sequence number of the last refresh resolved to that study
+_study_changed_at = {}
+_refresh_seq = 0
+
+
+class _CachedSeries:
+    __slots__ = ("series", "seq", "built_at")
+
+    def __init__(self, series, seq):
+        self.series = series
+        self.seq = seq
+        self.built_at = time.monotonic()
+
+
+def _mark_refreshed(user_ids):
+    global _refresh_seq
+    with _series_lock:
+        _refresh_seq += 1
+        for user_id in user_ids:
+            _refreshed_users[user_id] = _refresh_seq
+
+
+on_rollups_refreshed(_mark_refreshed)
+
+
+def _resolve_refreshed_studies():
+    """Move pending participant refreshes onto their (current) studies."""
+    with _series_lock:
+        pending = dict(_refreshed_users)
+    if not pending:
+        return
+    studies = study_ids_for_users(pending)
+    with _series_lock:
+        for user_id, seq in pending.items():
+            study_id = studies.get(user_id)
+            if study_id is not None:
+                _study_changed_at[study_id] = max(_study_changed_at.get(study_id, 0), seq)
+            if _refreshed_users.get(user_id) == seq:
+                del _refreshed_users[user_id]
+
+
+def _bucket_starts(start, end, granularity):
+    if granularity == "day":
+        return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    first = start - timedelta(days=start.weekday())
+    return [first + timedelta(weeks=offset) for offset in range((end - first).days // 7 + 1)]
+
+
+def _participants_logging(study_id, start, end, granularity, bucket_count):
+    """Distinct participants with a calendar entry in each bucket."""
+    first = start - timedelta(days=start.weekday()) if granularity == "week" else start
+    shift = (start - first).days
+    width = 1 if granularity == "day" else 7
+    counts = [0] * bucket_count
+    for bitmap in logged_day_bitmaps(study_id, start, end).values():
+        buckets = set()
+        while bitmap:
+            low = bitmap & -bitmap
+            buckets.add((low.bit_length() - 1 + shift) // width)
+            bitmap ^= low
+        for index in buckets:
+            counts[index] += 1
+    return counts
+
+
+def _query_series(study_id, start, end, granularity):
+    days = _bucket_starts(start, end, "day")
+    rows = db.session.execute(
+        select(
+            DailyActivity.day,
+            func.sum(DailyActivity.num_drinks),
+            func.sum(DailyActivity.time_spent),
+            func.sum(DailyActivity.money_intended),
+            func.sum(DailyActivity.money_spent),
+        )
+        .where(DailyActivity.study_id == study_id, DailyActivity.day >= start, DailyActivity.day <= end)
+        .group_by(DailyActivity.day)
+    ).all()
+
+    position = {day: index for index, day in enumerate(days)}
+    sums = [[0] * len(days) for _ in range(4)]
+    for day, *totals in rows:
+        for column, total in zip(sums, totals):
+            column[position[day]] = total or 0
+    buckets = days
+    if granularity == "week":
+        buckets, sums = week_buckets(days, *sums)
+
+    drinks, hours, intended, wagered = sums
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "dates": [bucket_start.isoformat() for bucket_start in buckets],
+        "participants": _participants_logging(study_id, start, end, granularity, len(buckets)),
+        "drinks": [round(value, 1) for value in drinks],
+        "hours": [round(value, 1) for value in hours],
+        "intended": [round(value, 2) for value in intended],
+        "wagered": [round(value, 2) for value in wagered],
+    }
+
+
+def study_time_series(study_id, start, end, granularity="day"):
+    """
+    Per-day or per-week study totals over the inclusive [start, end] date range,
+    as parallel columns keyed by SERIES_COLUMNS plus "dates" (bucket starts).
+    Raises ValueError for an unknown granularity or a range over MAX_SERIES_DAYS.
+    """
+    if granularity not in SERIES_GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    if (end - start).days + 1 > MAX_SERIES_DAYS:
+        raise ValueError(f"Range is longer than {MAX_SERIES_DAYS} days")
+
+    _resolve_refreshed_studies()
+    key = (study_id, start, end, granularity)
+    with _series_lock:
+        cached = _series_cache.get(key)
+        seq = _refresh_seq
+        changed_at = _study_changed_at.get(study_id, 0)
+    hit = (
+        cached is not None and cached.seq >= changed_at
+        and time.monotonic() - cached.built_at < SERIES_MAX_AGE
+    )
+    record_cache("study_series", hit)
+    if hit:
+        return cached.series
+
+    # seq is read before querying, so a refresh committed meanwhile outdates this entry.
+    series = _query_series(study_id, start, end, granularity)
+    with _series_lock:
+        _series_cache.pop(key, None)
+        _series_cache[key] = _CachedSeries(series, seq)
+        while len(_series_cache) > SERIES_CACHE_SIZE:
+            del _series_cache[next(iter(_series_cache))]
+    return series
+
+
+def clear_series_cache():
+    with _series_lock:
+        _series_cache.clear()
+        _refreshed_users.clear()
+        _study_changed_at.clear()
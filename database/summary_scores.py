@@ -0,0 +1,151 @@
+"""
+Standard timeline follow-back summary scores for every participant of a study.
+
+Scores are computed in SQL over the typed answer columns: each activity table is
+first collapsed to one row per (participant, day), then aggregated per
+participant. The whole study costs three queries however many participants it
+has, and the work grows linearly with the number of logged rows.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, select
+
+from database.db_initialization import CalendarEntry, Drinking, Gambling, StudyCode, User, db
+
+# Standard drinks on one day that make it a heavy drinking day (NIAAA threshold for men;
+# studies of women typically pass 4).
+DEFAULT_HEAVY_DRINKING_THRESHOLD = 5
+
+# Window used when the caller does not choose one, ending today.
+DEFAULT_WINDOW_DAYS = 90
+
+SUMMARY_SCORE_COLUMNS = [
+    "user_id",
+    "username",
+    "window_days",
+    "logged_days",
+    "drinking_days",
+    "percent_days_drinking",
+    "total_drinks",
+    "drinks_per_drinking_day",
+    "heavy_drinking_days",
+    "gambling_days",
+    "percent_days_gambling",
+    "total_wagered",
+    "average_wagered_per_gambling_day",
+    "net_loss",
+]
+
+
+def resolve_window(start_date=None, end_date=None):
+    """Parse YYYY-MM-DD bounds (inclusive) into dates, defaulting to the last DEFAULT_WINDOW_DAYS days."""
+    end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date.today()
+    if start_date:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    else:
+        start = end - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    if start > end:
+        raise ValueError("start_date must not be after end_date")
+    return start, end
+
+
+def _percent(part, whole):
+    return round(part * 100.0 / whole, 2) if whole else 0.0
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 2) if denominator else None
+
+
+def _per_day(model, value_column, study_ids, start, end):
+    """Query with one row per (user_id, day) and the day's summed value (or row count)."""
+    day = func.date(CalendarEntry.entry_date)
+    value = func.sum(value_column) if value_column is not None else func.count()
+    query = select(model.user_id.label("user_id"), day.label("day"), value.label("value"))
+    if model is not CalendarEntry:
+        query = query.join(CalendarEntry, model.entry_id == CalendarEntry.id)
+    return (
+        query.where(
+            model.study_id.in_(study_ids),
+            CalendarEntry.entry_date >= datetime.combine(start, datetime.min.time()),
+            CalendarEntry.entry_date < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+        )
+        .group_by(model.user_id, day)
+    )
+
+
+def compute_summary_scores(study_ids, start_date=None, end_date=None,
+                           heavy_threshold=DEFAULT_HEAVY_DRINKING_THRESHOLD):
+    """
+    Return one dict of summary scores per participant of study_ids (list or
+    subquery of StudyCode ids), ordered by username, over [start_date, end_date].
+    Participants with nothing logged are included with zero counts.
+    """
+    start, end = resolve_window(start_date, end_date)
+    window_days = (end - start).days + 1
+
+    # A drinking day is a day with a drinking entry, unless its drinks add up to 0.
+    drinking_days = _per_day(Drinking, Drinking.num_drinks, study_ids, start, end).having(
+        func.coalesce(func.sum(Drinking.num_drinks), 1) > 0
+    ).subquery()
+    drinking = {
+        row.user_id: row for row in db.session.execute(
+            select(
+                drinking_days.c.user_id,
+                func.count().label("days"),
+                func.coalesce(func.sum(drinking_days.c.value), 0.0).label("total"),
+                func.sum(case((drinking_days.c.value >= heavy_threshold, 1), else_=0)).label("heavy"),
+            ).group_by(drinking_days.c.user_id)
+        )
+    }
+
+    gambling_days = _per_day(Gambling, Gambling.money_spent, study_ids, start, end).add_columns(
+        func.sum(Gambling.money_earned).label("earned")
+    ).subquery()
+    gambling = {
+        row.user_id: row for row in db.session.execute(
+            select(
+                gambling_days.c.user_id,
+                func.count().label("days"),
+                func.coalesce(func.sum(gambling_days.c.value), 0.0).label("wagered"),
+                func.coalesce(func.sum(gambling_days.c.earned), 0.0).label("earned"),
+            ).group_by(gambling_days.c.user_id)
+        )
+    }
+
+    logged_days = _per_day(CalendarEntry, None, study_ids, start, end).subquery()
+    participants = db.session.execute(
+        select(User.id, User.username, func.count(logged_days.c.day))
+        .join(StudyCode, StudyCode.code == User.study_group_code)
+        .outerjoin(logged_days, logged_days.c.user_id == User.id)
+        .where(User.is_admin.is_(False), StudyCode.id.in_(study_ids))
+        .group_by(User.id, User.username)
+        .order_by(User.username, User.id)
+    ).all()
+
+    scores = []
+    for user_id, username, logged in participants:
+        drank = drinking.get(user_id)
+        gambled = gambling.get(user_id)
+        drinking_count = drank.days if drank else 0
+        total_drinks = float(drank.total) if drank else 0.0
+        gambling_count = gambled.days if gambled else 0
+        wagered = float(gambled.wagered) if gambled else 0.0
+        scores.append({
+            "user_id": user_id,
+            "username": username,
+            "window_days": window_days,
+            "logged_days": logged,
+            "drinking_days": drinking_count,
+            "percent_days_drinking": _percent(drinking_count, window_days),
+            "total_drinks": round(total_drinks, 2),
+            "drinks_per_drinking_day": _ratio(total_drinks, drinking_count),
+            "heavy_drinking_days": int(drank.heavy or 0) if drank else 0,
+            "gambling_days": gambling_count,
+            "percent_days_gambling": _percent(gambling_count, window_days),
+            "total_wagered": round(wagered, 2),
+            "average_wagered_per_gambling_day": _ratio(wagered, gambling_count),
+            # money_earned is the day's win (+) or loss (-), so a net loss is its negated sum.
+            "net_loss": round(-float(gambled.earned), 2) if gambled else 0.0,
+        })
+    return scores
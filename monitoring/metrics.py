@@ -0,0 +1,423 @@
+"""
+In-process metrics registry exposed in the Prometheus text format.
+
+Every metric guards its own state with a lock so the counters are safe to
+update from the threads of a multi-threaded WSGI worker. Each worker process
+keeps its own registry; scrape every worker (or run one per host) to get the
+full picture.
+"""
+import abc
+import hmac
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Blueprint, Response, current_app, g, request, session
+from sqlalchemy import event
+
+from database.db_initialization import db
+
+# Latency buckets in seconds, tuned for page renders and single queries.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# A participant counts as an active session if they made a request this recently.
+ACTIVE_SESSION_WINDOW_SECONDS = 15 * 60
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape_label(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    @abc.abstractmethod
+    def _samples(self):
+        """The metric's sample lines in the Prometheus text format."""
+
+
+class Counter(_Metric):
+    """Monotonically increasing value, e.g. number of cache hits."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down. Either set directly or, when a callback is
+    given, read lazily at scrape time so nothing is paid on the request path.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), callback=None):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+        self._callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        if self._callback is not None:
+            try:
+                for labels, value in self._callback():
+                    self.set(value, **labels)
+            except Exception:
+                # A failing probe (e.g. no app context) must not break the scrape.
+                pass
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class _HistogramTimer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in fixed buckets. Only the owning bucket is
+    incremented per observation; cumulative counts are produced at scrape time.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time in seconds."""
+        return _HistogramTimer(self, labels)
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for one label set."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if series is None:
+                return 0, 0.0
+            return series[2], series[1]
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        bounds = list(self.buckets) + [float("inf")]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=(), callback=None):
+        return self.register(Gauge(name, documentation, label_names, callback))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class _ActiveSessions:
+    """Tracks the last time each signed-in user made a request."""
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def touch(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[user_id] = now
+
+    def count(self):
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            stale = [uid for uid, seen in self._last_seen.items() if seen < cutoff]
+            for uid in stale:
+                del self._last_seen[uid]
+            return len(self._last_seen)
+
+
+registry = MetricsRegistry()
+_instrumented_engine = None
+active_sessions = _ActiveSessions(ACTIVE_SESSION_WINDOW_SECONDS)
+
+REQUEST_LATENCY = registry.histogram(
+    "tlfb_request_duration_seconds",
+    "Request latency by blueprint endpoint.",
+    ("endpoint", "method", "status"),
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    "tlfb_requests_in_progress",
+    "Requests currently being handled by this worker.",
+)
+DB_QUERY_DURATION = registry.histogram(
+    "tlfb_db_query_duration_seconds",
+    "Time spent executing SQL statements, by request endpoint.",
+    ("endpoint",),
+)
+CACHE_REQUESTS = registry.counter(
+    "tlfb_cache_requests_total",
+    "Cache lookups by cache name and result (hit or miss).",
+    ("cache", "result"),
+)
+EXPORT_DURATION = registry.histogram(
+    "tlfb_export_duration_seconds",
+    "Time spent building CSV exports.",
+    ("kind",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+ACTIVE_SESSIONS = registry.gauge(
+    "tlfb_active_sessions",
+    f"Distinct signed-in users seen in the last {ACTIVE_SESSION_WINDOW_SECONDS // 60} minutes.",
+    callback=lambda: [({}, active_sessions.count())],
+)
+DB_POOL_CONNECTIONS = registry.gauge(
+    "tlfb_db_pool_connections",
+    "Connection pool usage of the SQLAlchemy engine.",
+    ("state",),
+    callback=lambda: _pool_samples(),
+)
+
+
+def record_cache(cache_name, hit):
+    """Count a lookup against one of the in-process caches."""
+    CACHE_REQUESTS.inc(cache=cache_name, result="hit" if hit else "miss")
+
+
+def cache_hit_ratio(cache_name):
+    hits = CACHE_REQUESTS.value(cache=cache_name, result="hit")
+    misses = CACHE_REQUESTS.value(cache=cache_name, result="miss")
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+def _current_endpoint():
+    # Statements run outside a request (startup, CLI) are grouped together.
+    try:
+        return request.endpoint or "unmatched"
+    except RuntimeError:
+        return "background"
+
+
+# The start time lives on the statement's execution context rather than the pooled
+# connection, so a statement that raises (and never reaches after_cursor_execute) leaves nothing behind.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._tlfb_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_tlfb_query_start", None)
+    if start is not None:
+        DB_QUERY_DURATION.observe(time.perf_counter() - start, endpoint=_current_endpoint())
+
+
+def _pool_samples():
+    if _instrumented_engine is None:
+        return []
+    pool = _instrumented_engine.pool
+    samples = []
+    for stat in ("size", "checkedout", "checkedin", "overflow"):
+        probe = getattr(pool, stat, None)
+        if callable(probe):
+            samples.append(({"state": stat}, probe()))
+    return samples
+
+
+def _start_request_timer():
+    g._metrics_start = time.perf_counter()
+    REQUESTS_IN_PROGRESS.inc()
+    user_id = session.get("user_id")
+    if user_id:
+        active_sessions.touch(user_id)
+
+
+def _observe_request(response):
+    start = g.pop("_metrics_start", None)
+    if start is not None:
+        REQUESTS_IN_PROGRESS.dec()
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            endpoint=request.endpoint or "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+def _finish_failed_request(exc):
+    # after_request is skipped when a view raises; keep the in-progress gauge honest.
+    if g.pop("_metrics_start", None) is not None:
+        REQUESTS_IN_PROGRESS.dec()
+
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def _from_loopback():
+    try:
+        return ipaddress.ip_address(request.remote_addr or "").is_loopback
+    except ValueError:
+        return False
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    # Endpoint names, traffic and session counts are not public: without a
+    # METRICS_TOKEN only scrapers on the same host are answered.
+    token = current_app.config.get("METRICS_TOKEN")
+    if not token:
+        if not _from_loopback():
+            return Response("Not Found\n", status=404, mimetype="text/plain")
+    elif not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+def init_metrics(app):
+    """Register the /metrics endpoint, request timing hooks and DB listeners on app."""
+    app.register_blueprint(metrics_bp)
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
+    app.teardown_request(_finish_failed_request)
+
+    global _instrumented_engine
+    with app.app_context():
+        engine = db.engine
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _instrumented_engine = engine
@@ -0,0 +1,177 @@
+"""
+Structured, non-blocking logging for request handlers.
+
+Records are turned into JSON lines, tagged with the current request's
+correlation id and pushed onto a bounded in-memory queue. A background
+QueueListener thread does the actual stdout I/O, so a log call inside a
+request costs a dict build and a queue put. When the queue is full the
+record is dropped (and counted) rather than blocking the participant's write.
+
+High-volume success messages should be logged with ``extra={"sampled": True}``;
+only one in every ``LOG_SUCCESS_SAMPLE_EVERY`` of those is kept per message.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+from monitoring.metrics import registry
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_SAMPLE_EVERY = 10
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "sampled", "taskName",
+}
+
+LOG_RECORDS_DROPPED = registry.counter(
+    "tlfb_log_records_dropped_total",
+    "Log records discarded because the background log queue was full.",
+)
+
+_listener = None
+_atexit_registered = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as one JSON object per line."""
+
+    def format(self, record):
+        document = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            document["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                document[key] = value
+        if record.exc_info:
+            document["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already rendered by NonBlockingQueueHandler.prepare in the request thread.
+            document["exc_info"] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request's correlation id (if any) to the record."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+
+class SuccessSamplingFilter(logging.Filter):
+    """Keep one in every `every` records flagged as sampled, per message template."""
+
+    def __init__(self, every=DEFAULT_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._seen.get(key, 0)
+            self._seen[key] = count + 1
+        return count % self.every == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking on a full queue."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def prepare(self, record):
+        # Defer JSON formatting to the listener thread; only freeze the message
+        # and traceback here since they reference request-local objects.
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def build_queue_handler(log_queue, sample_every=DEFAULT_SAMPLE_EVERY):
+    """Create the request-thread side handler: filters run before the queue put."""
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(SuccessSamplingFilter(sample_every))
+    return handler
+
+
+def _assign_request_id():
+    incoming = request.headers.get(REQUEST_ID_HEADER, "")
+    g.request_id = incoming[:64] if incoming else uuid.uuid4().hex
+
+
+def _echo_request_id(response):
+    request_id = g.get("request_id")
+    if request_id:
+        response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+
+def shutdown_logging():
+    """Flush whatever is still queued and detach the queue handler."""
+    global _listener
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, NonBlockingQueueHandler):
+            root.removeHandler(existing)
+
+
+def init_logging(app, stream=None):
+    """
+    Route all application logging through the background queue and give every
+    request a correlation id (taken from X-Request-ID when the client sends one).
+    """
+    global _listener, _atexit_registered
+
+    level = app.config.get("LOG_LEVEL", "INFO")
+    sample_every = app.config.get("LOG_SUCCESS_SAMPLE_EVERY", DEFAULT_SAMPLE_EVERY)
+    log_queue = queue.Queue(maxsize=app.config.get("LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+    shutdown_logging()
+    _listener = QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(build_queue_handler(log_queue, sample_every))
+    root.setLevel(level)
+
+    app.before_request(_assign_request_id)
+    app.after_request(_echo_request_id)
+    return _listener
@@ -1,18 +1,57 @@
+import logging
 import re
 import secrets
 import string
 
 from flask import Blueprint, render_template, send_file, request, redirect, url_for, session, jsonify
-from csv_formatting.csv_creator import generate_user_csv_report, generate_all_users_csv, build_report_dataset
+from csv_formatting.csv_creator import (
+    generate_user_csv_report, generate_all_users_csv, generate_summary_scores_csv, build_report_page, REPORT_PAGE_SIZE,
+)
 from database.db_initialization import User, StudyCode, CalendarEntry, Drinking, Gambling, db
 from routes.auth import admin_required
-from routes.insights import compute_insights
-from database.db_helper import get_gambling_aggregates, get_calendar_entries_for_user
-from routes.events_handler import extract_fields, qSchema
-from config.config_helper import get_header_label_map
+from routes.insights import INSIGHTS_SECTIONS, insights_section_response, insights_window_from_request
+from database.db_helper import get_gambling_aggregates, get_calendar_entries_for_user, get_participant_directory
+from database.answer_normalization import backfill_typed_answers
+from database.study_scoping import (
+    participant_in_studies, participants_in_studies, researcher_study_ids, study_ids_for_users,
+)
+from database.summary_scores import compute_summary_scores, resolve_window, DEFAULT_HEAVY_DRINKING_THRESHOLD
+from database.gambling_metrics import compute_gambling_metrics, pool_gambling_metrics
+from database.insights_engine import INSIGHTS_WINDOWS
+from database.cohort_insights import compute_cohort_insights, participant_percentiles
+from database.study_series import study_time_series
+from database.study_heatmap import build_study_heatmap
+from database.logging_compliance import COMPLIANCE_SORT_KEYS, compute_logging_compliance, summarize_compliance
+from routes.events_handler import (
+    answers_by_entry, build_calendar_events, calendar_schemas, calendar_schemas_for_user, qSchema,
+)
+from config.config_helper import get_csv_headers, get_header_label_map, get_select_questions, load_questions
 from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin', __name__)
+logger = logging.getLogger(__name__)
+
+# Participant directory page size (default and upper bound)
+PARTICIPANT_PAGE_SIZE = 50
+MAX_PARTICIPANT_PAGE_SIZE = 200
+
+# Participants per bulk calendar events response (default study page and upper bound)
+OVERLAY_PAGE_SIZE = 20
+MAX_OVERLAY_PARTICIPANTS = 50
+
+
+def _cohort_rank_section(inputs):
+    """Percentile ranks of the participant's figures within their study, over the study's window."""
+    study_id = study_ids_for_users([inputs.user_id]).get(inputs.user_id)
+    if study_id is None:
+        return {'ranks': {}}
+    # "all" must span the whole study: the cached distribution is shared by all its participants.
+    window = insights_window_from_request(None, study_ids=[study_id])
+    return {'ranks': participant_percentiles(inputs.user_id, study_id, window)}
+
+
+# The participant's insights sections plus where they rank within their study
+ADMIN_INSIGHTS_SECTIONS = dict(INSIGHTS_SECTIONS, cohort_rank=_cohort_rank_section)
 
 
 def get_report_filters():
@@ -26,24 +65,24 @@ def get_report_filters():
     }
 
 
+def get_answer_filters(schema):
+    # Categorical filters sent as answer_<question id>=<option>, limited to the study's select questions.
+    answer_filters = {}
+    for question in get_select_questions(schema or qSchema):
+        value = request.args.get(f"answer_{question['id']}", '').strip()
+        if value in question['options']:
+            answer_filters[question['id']] = value
+    return answer_filters
+
+
 def generate_study_code():
     characters = string.ascii_letters + string.digits
     return ''.join(secrets.choice(characters) for _ in range(8))
 
 
-def _researcher_user_ids():
-    """Return IDs of all non-admin users enrolled in the current researcher's studies."""
-    researcher_id = session.get('user_id')
-    codes = [
-        sc.code for sc in
-        StudyCode.query.filter_by(researcher_id=researcher_id).with_entities(StudyCode.code).all()
-    ]
-    if not codes:
-        return []
-    return [
-        u.id for u in
-        User.query.filter(User.is_admin.is_(False), User.study_group_code.in_(codes)).all()
-    ]
+def _researcher_study_ids():
+    """Subquery of the current researcher's study ids, for study_id IN (...) predicates."""
+    return researcher_study_ids(session.get('user_id'))
 
 
 def _selected_researcher_study():
@@ -54,6 +93,25 @@ def _selected_researcher_study():
     return StudyCode.query.filter_by(id=study_id, researcher_id=researcher_id).first()
 
 
+def _directory_cursor():
+    """
+    The keyset position of ?cursor= ("<user id>:<username>" of the last participant
+    on the previous page) as (username, user id), or None for the first page.
+    Raises ValueError for a malformed cursor.
+    """
+    cursor = request.args.get('cursor', '')
+    if not cursor:
+        return None
+    user_part, _, username = cursor.partition(':')
+    if not user_part.isdigit():
+        raise ValueError('Invalid cursor')
+    return username, int(user_part)
+
+
+def _next_directory_cursor(page, has_more):
+    return f"{page[-1]['id']}:{page[-1]['username']}" if has_more else None
+
+
 def _study_report_schema(study):
     if not study or not study.questions:
         return None
@@ -169,10 +227,41 @@ def study_questions(study_id):
         return jsonify(study.questions)
 
     study.questions = _parse_questions_from_form()
+    study.questions_version = (study.questions_version or 0) + 1
     db.session.commit()
+    # Question order decides which answer feeds each typed column, so re-derive them.
+    participant_ids = [
+        u.id for u in
+        User.query.filter(User.is_admin.is_(False), User.study_group_code == study.code)
+        .with_entities(User.id).all()
+    ]
+    backfill_typed_answers(user_ids=participant_ids)
     return jsonify({'ok': True})
 
 
+@admin_bp.route('/studies/<int:study_id>/participants')
+@admin_required
+def study_participants(study_id):
+    """Searchable, keyset-paginated participant directory for one of the researcher's studies."""
+    researcher_id = session.get('user_id')
+    study = StudyCode.query.filter_by(id=study_id, researcher_id=researcher_id).first()
+    if not study:
+        return jsonify({'error': 'Not found'}), 404
+
+    limit = request.args.get('limit', PARTICIPANT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PARTICIPANT_PAGE_SIZE))
+
+    try:
+        after = _directory_cursor()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    participants, has_more = get_participant_directory(
+        study.code, prefix=request.args.get('q', ''), after=after, limit=limit,
+    )
+    return jsonify({'participants': participants, 'next_cursor': _next_directory_cursor(participants, has_more)})
+
+
 # ── Insights ─────────────────────────────────────────────────────────────────
 
 @admin_bp.route('/insights')
@@ -187,35 +276,57 @@ def insights():
     selected_study_id = request.args.get('study_id', type=int)
     selected_study = next((s for s in studies if s.id == selected_study_id), None)
 
-    if selected_study:
-        users = (User.query
-                 .filter(User.is_admin.is_(False), User.study_group_code == selected_study.code)
-                 .order_by(User.username)
-                 .all())
-        allowed_ids = {u.id for u in users}
-    else:
-        users = []
-        allowed_ids = set()
-
-    selected_user_id = request.args.get('user_id', type=int)
     selected_user = None
-    insights_data = None
-
-    if selected_user_id and selected_user_id in allowed_ids:
-        selected_user = User.query.get(selected_user_id)
+    window = None
+    cohort = None
+
+    if selected_study and request.args.get('view') == 'cohort':
+        # Every participant of the study side by side, from one batched pass.
+        window = insights_window_from_request(None, study_ids=[selected_study.id])
+        cohort = compute_cohort_insights([selected_study.id], window)
+    elif selected_study:
+        # The participant picker pages through admin.study_participants instead of a full list.
+        selected_user = participant_in_studies(request.args.get('user_id', type=int), [selected_study.id])
         if selected_user:
-            insights_data = compute_insights(selected_user_id)
+            # Only the page shell is rendered here; each section loads from admin.insights_section.
+            window = insights_window_from_request(selected_user.id)
 
     return render_template(
         'admin_insights.html',
-        users=users,
         selected_user=selected_user,
-        insights_data=insights_data,
+        cohort=cohort,
+        window=window,
+        insights_windows=INSIGHTS_WINDOWS,
+        sections=list(ADMIN_INSIGHTS_SECTIONS),
         studies=studies,
         selected_study=selected_study,
     )
 
 
+@admin_bp.route('/insights/sections/<name>')
+@admin_required
+def insights_section(name):
+    """One insights section (JSON data + rendered card) for a participant of the researcher's studies."""
+    participant = participant_in_studies(request.args.get('user_id', type=int), _researcher_study_ids())
+    if not participant:
+        return jsonify({'error': 'Participant not found'}), 404
+    return insights_section_response(
+        participant.id, name, insights_window_from_request(participant.id),
+        sections=ADMIN_INSIGHTS_SECTIONS, selected_user=participant,
+    )
+
+
+@admin_bp.route('/insights/cohort')
+@admin_required
+def cohort_insights():
+    """Insight summaries of every participant in the selected study, with the study's quartiles."""
+    selected_study = _selected_researcher_study()
+    if not selected_study:
+        return jsonify({'error': 'Not found'}), 404
+    window = insights_window_from_request(None, study_ids=[selected_study.id])
+    return jsonify(compute_cohort_insights([selected_study.id], window))
+
+
 # ── Reports ──────────────────────────────────────────────────────────────────
 
 _EMPTY_AGGREGATES = {
@@ -236,33 +347,20 @@ def report():
     selected_study_id = request.args.get('study_id', type=int)
     selected_study = next((s for s in studies if s.id == selected_study_id), None)
 
-    if selected_study:
-        users = (User.query
-                 .filter(User.is_admin.is_(False), User.study_group_code == selected_study.code)
-                 .all())
-        allowed_ids = {u.id for u in users}
-    else:
-        users = []
-        allowed_ids = set()
+    study_ids = [selected_study.id] if selected_study else []
 
     filters = get_report_filters()
     show_table = str(request.args.get('show_table', '')).lower() in {"1", "true", "yes", "on"}
 
-    scoped_user_id = filters["all_user_id"] if filters["all_user_id"] in allowed_ids else None
+    scoped_user = participant_in_studies(filters["all_user_id"], study_ids)
+    scoped_user_id = scoped_user.id if scoped_user else None
 
     report_headers = []
-    report_rows = []
     study_schema = _study_report_schema(selected_study)
+    answer_filters = get_answer_filters(study_schema)
     if show_table and selected_study:
-        report_headers, report_rows = build_report_dataset(
-            user_id=scoped_user_id,
-            user_ids=None if scoped_user_id else list(allowed_ids),
-            start_date=filters["start_date"],
-            end_date=filters["end_date"],
-            report_type=filters["report_type"] or None,
-            num_drinks=filters["num_drinks"],
-            schema=study_schema,
-        )
+        # Rows are streamed into the table by report_table.js from admin.report_rows.
+        report_headers = get_csv_headers(study_schema or load_questions())
 
     label_map = get_header_label_map(study_schema)
     report_header_labels = [
@@ -273,19 +371,30 @@ def report():
         start_date=filters["start_date"],
         end_date=filters["end_date"],
         user_id=scoped_user_id,
-        user_ids=None if scoped_user_id else list(allowed_ids),
+        study_ids=study_ids,
         schema=study_schema,
+        answer_filters=answer_filters,
     ) if selected_study else _EMPTY_AGGREGATES
 
+    gambling_patterns = pool_gambling_metrics(compute_gambling_metrics(
+        user_ids=[scoped_user_id] if scoped_user_id else None,
+        study_ids=study_ids,
+        start_date=filters["start_date"] or None,
+        end_date=filters["end_date"] or None,
+    )) if selected_study else None
+
     return render_template(
         'report.html',
-        users=users,
+        scoped_user=scoped_user,
         report_headers=report_headers,
         report_header_labels=report_header_labels,
-        report_rows=report_rows,
         show_table=show_table,
         filters=filters,
+        answer_questions=get_select_questions(study_schema or qSchema) if selected_study else [],
+        answer_filters=answer_filters,
+        answer_filter_args={f"answer_{qid}": value for qid, value in answer_filters.items()},
         aggregates=aggregates,
+        gambling_patterns=gambling_patterns,
         now=datetime.today().date(),
         timedelta=timedelta,
         studies=studies,
@@ -293,6 +402,183 @@ def report():
     )
 
 
+@admin_bp.route('/report/rows')
+@admin_required
+def report_rows():
+    """One keyset-paginated page of report table rows for the selected study."""
+    selected_study = _selected_researcher_study()
+    if not selected_study:
+        return jsonify({'error': 'Not found'}), 404
+
+    filters = get_report_filters()
+    study_ids = [selected_study.id]
+    scoped_user_id = filters["all_user_id"] if participant_in_studies(filters["all_user_id"], study_ids) else None
+    study_schema = _study_report_schema(selected_study)
+
+    try:
+        page = build_report_page(
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', REPORT_PAGE_SIZE, type=int),
+            user_id=scoped_user_id,
+            study_ids=study_ids,
+            start_date=filters["start_date"],
+            end_date=filters["end_date"],
+            report_type=filters["report_type"] or None,
+            num_drinks=filters["num_drinks"],
+            schema=study_schema,
+            answer_filters=get_answer_filters(study_schema),
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or date'}), 400
+    return jsonify(page)
+
+
+@admin_bp.route('/summary-scores')
+@admin_required
+def summary_scores():
+    """TLFB summary scores for every participant of the selected study (or all the researcher's studies)."""
+    selected_study = _selected_researcher_study()
+    study_ids = [selected_study.id] if selected_study else _researcher_study_ids()
+    heavy_threshold = request.args.get('heavy_threshold', DEFAULT_HEAVY_DRINKING_THRESHOLD, type=float)
+
+    try:
+        start, end = resolve_window(request.args.get('start_date') or None, request.args.get('end_date') or None)
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    scores = compute_summary_scores(
+        study_ids, start_date=start.isoformat(), end_date=end.isoformat(), heavy_threshold=heavy_threshold,
+    )
+    return jsonify({
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'heavy_threshold': heavy_threshold,
+        'participants': scores,
+    })
+
+
+@admin_bp.route('/gambling-metrics')
+@admin_required
+def gambling_metrics():
+    """Per-participant gambling indicators (overspend ratios, loss streaks, chasing) for the selected study."""
+    selected_study = _selected_researcher_study()
+    if not selected_study:
+        return jsonify({'error': 'Not found'}), 404
+
+    try:
+        metrics = compute_gambling_metrics(
+            study_ids=[selected_study.id],
+            start_date=request.args.get('start_date') or None,
+            end_date=request.args.get('end_date') or None,
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+    return jsonify({
+        'study': pool_gambling_metrics(metrics),
+        'participants': [{'user_id': user_id, **values} for user_id, values in metrics.items()],
+    })
+
+
+@admin_bp.route('/study-series')
+@admin_required
+def study_series():
+    """Per-day (or ?granularity=week) study totals over a date range, for trend charts."""
+    selected_study = _selected_researcher_study()
+    if not selected_study:
+        return jsonify({'error': 'Not found'}), 404
+
+    try:
+        start, end = resolve_window(request.args.get('start_date') or None, request.args.get('end_date') or None)
+        series = study_time_series(selected_study.id, start, end, request.args.get('granularity', 'day'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify(series)
+
+
+@admin_bp.route('/study-heatmap')
+@admin_required
+def study_heatmap():
+    """Participants x days grid (missing / none / drinking / gambling) for the selected study, bit-packed."""
+    selected_study = _selected_researcher_study()
+    if not selected_study:
+        return jsonify({'error': 'Not found'}), 404
+
+    try:
+        start, end = resolve_window(request.args.get('start_date') or None, request.args.get('end_date') or None)
+        heatmap = build_study_heatmap(selected_study.id, start, end)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify(heatmap)
+
+
+# ── Logging compliance ───────────────────────────────────────────────────────
+
+def _compliance_for_request(study):
+    """(start, end, rows) for ?start_date=&end_date=&sort=&order=, over the usual TLFB window by default."""
+    start, end = resolve_window(request.args.get('start_date') or None, request.args.get('end_date') or None)
+    rows = compute_logging_compliance(
+        study.id, start, end,
+        sort=request.args.get('sort', 'compliance'),
+        descending=request.args.get('order') == 'desc',
+    )
+    return start, end, rows
+
+
+@admin_bp.route('/compliance')
+@admin_required
+def compliance():
+    """Logged vs. missing calendar days for every participant of the selected study."""
+    researcher_id = session.get('user_id')
+    studies = (StudyCode.query
+               .filter_by(researcher_id=researcher_id)
+               .order_by(StudyCode.created_at.desc())
+               .all())
+    selected_study_id = request.args.get('study_id', type=int)
+    selected_study = next((s for s in studies if s.id == selected_study_id), None)
+
+    context = {}
+    if selected_study:
+        try:
+            start, end, rows = _compliance_for_request(selected_study)
+        except ValueError:
+            return redirect(url_for('admin.compliance', study_id=selected_study.id))
+        context = {
+            'start': start,
+            'end': end,
+            'rows': rows,
+            'summary': summarize_compliance(rows, (end - start).days + 1),
+            'sort': request.args.get('sort', 'compliance'),
+            'order': request.args.get('order', 'asc'),
+        }
+
+    return render_template(
+        'admin_compliance.html',
+        studies=studies,
+        selected_study=selected_study,
+        sort_keys=COMPLIANCE_SORT_KEYS,
+        **context,
+    )
+
+
+@admin_bp.route('/compliance/data')
+@admin_required
+def compliance_data():
+    """JSON form of the compliance table for the selected study."""
+    selected_study = _selected_researcher_study()
+    if not selected_study:
+        return jsonify({'error': 'Not found'}), 404
+    try:
+        start, end, rows = _compliance_for_request(selected_study)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify({
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'study': summarize_compliance(rows, (end - start).days + 1),
+        'participants': rows,
+    })
+
+
 # ── CSV Downloads ────────────────────────────────────────────────────────────
 
 @admin_bp.route('/download_report_user')
@@ -300,19 +586,16 @@ def report():
 def download_report_user():
     selected_study = _selected_researcher_study()
     if selected_study:
-        allowed_ids = [
-            u.id for u in
-            User.query.filter(User.is_admin.is_(False), User.study_group_code == selected_study.code).all()
-        ]
+        study_ids = [selected_study.id]
         schema = _study_report_schema(selected_study)
     else:
-        allowed_ids = _researcher_user_ids()
+        study_ids = _researcher_study_ids()
         schema = None
 
     user_id = request.args.get('user_id', type=int)
     filters = get_report_filters()
 
-    if not user_id or user_id not in allowed_ids:
+    if not participant_in_studies(user_id, study_ids):
         return "User not found or not in your studies", 400
 
     file_path = generate_user_csv_report(
@@ -322,6 +605,7 @@ def download_report_user():
         filters["report_type"] or None,
         filters["num_drinks"],
         schema=schema,
+        answer_filters=get_answer_filters(schema),
     )
     return send_file(file_path, as_attachment=True)
 
@@ -338,24 +622,20 @@ def participant_calendar():
     selected_study_id = request.args.get('study_id', type=int)
     selected_study = next((s for s in studies if s.id == selected_study_id), None)
 
-    users = []
+    participant_count = 0
     selected_user = None
 
     if selected_study:
-        users = (User.query
-                 .filter(User.is_admin.is_(False), User.study_group_code == selected_study.code)
-                 .order_by(User.username)
-                 .all())
-        allowed_ids = {u.id for u in users}
-        selected_user_id = request.args.get('user_id', type=int)
-        if selected_user_id and selected_user_id in allowed_ids:
-            selected_user = User.query.get(selected_user_id)
+        participant_count = (User.query
+                             .filter(User.is_admin.is_(False), User.study_group_code == selected_study.code)
+                             .count())
+        selected_user = participant_in_studies(request.args.get('user_id', type=int), [selected_study.id])
 
     return render_template(
         'researcher_calendar.html',
         studies=studies,
         selected_study=selected_study,
-        users=users,
+        participant_count=participant_count,
         selected_user=selected_user,
     )
 
@@ -363,122 +643,145 @@ def participant_calendar():
 @admin_bp.route('/participant-calendar-events')
 @admin_required
 def participant_calendar_events():
-    researcher_id = session.get('user_id')
     user_id = request.args.get('user_id', type=int)
 
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
 
-    codes = [
-        sc.code for sc in
-        StudyCode.query.filter_by(researcher_id=researcher_id).with_entities(StudyCode.code).all()
-    ]
-    if not codes:
-        return jsonify([]), 200
-
-    participant = User.query.filter(
-        User.id == user_id,
-        User.is_admin.is_(False),
-        User.study_group_code.in_(codes)
-    ).first()
-
+    # Same scoping and payload as the bulk endpoint below.
+    participant = participant_in_studies(user_id, _researcher_study_ids())
     if not participant:
         return jsonify({'error': 'Not found'}), 404
 
     try:
         # Use the participant's study schema so custom question IDs are returned correctly
-        p_study = StudyCode.query.filter_by(code=participant.study_group_code).first() if participant.study_group_code else None
-        if p_study and p_study.questions and (p_study.questions.get('drinking') or p_study.questions.get('gambling')):
-            p_drinking_schema = p_study.questions.get('drinking', [])
-            p_gambling_schema = p_study.questions.get('gambling', [])
-        else:
-            p_drinking_schema = qSchema.get('drinking', [])
-            p_gambling_schema = qSchema.get('gambling', [])
-
-        db_entries = get_calendar_entries_for_user(user_id)
-        db_entries = sorted(db_entries, key=lambda row: (row.entry_date, row.id))
-
-        if not db_entries:
-            return jsonify([]), 200
-
-        entry_ids = [e.id for e in db_entries]
-        drinking_by_entry = {
-            d.entry_id: d
-            for d in Drinking.query.filter(Drinking.entry_id.in_(entry_ids)).all()
-        }
-        gambling_by_entry = {
-            g.entry_id: g
-            for g in Gambling.query.filter(Gambling.entry_id.in_(entry_ids)).all()
-        }
+        db_entries = sorted(get_calendar_entries_for_user(user_id), key=lambda row: (row.entry_date, row.id))
+        events = build_calendar_events(
+            db_entries, *answers_by_entry([e.id for e in db_entries]), *calendar_schemas_for_user(user_id)
+        )
+        return jsonify(events), 200
 
-        events_by_date = {}
-        for e in db_entries:
-            iso_date = e.entry_date.isoformat().split('T')[0]
-            if iso_date not in events_by_date:
-                events_by_date[iso_date] = {
-                    'id': e.id,
-                    'date': iso_date,
-                    'type': e.entry_type,
-                    'has_drinking': False,
-                    'has_gambling': False,
-                    'has_no_activity': False,
-                }
-
-            event = events_by_date[iso_date]
-            if e.id > event['id']:
-                event['id'] = e.id
-
-            if not e.entry_type or e.entry_type == 'drinking':
-                drinking = drinking_by_entry.get(e.id)
-                if drinking:
-                    event['has_drinking'] = True
-                if drinking and drinking.drinking_questions:
-                    event.update(extract_fields(p_drinking_schema, drinking.drinking_questions))
-
-            if not e.entry_type or e.entry_type == 'gambling':
-                gambling = gambling_by_entry.get(e.id)
-                if gambling:
-                    event['has_gambling'] = True
-                if gambling and gambling.gambling_questions:
-                    event.update(extract_fields(p_gambling_schema, gambling.gambling_questions))
-                    if not e.entry_type:
-                        event['type'] = 'gambling'
-
-        for event in events_by_date.values():
-            if not event['has_drinking'] and not event['has_gambling']:
-                event['has_no_activity'] = True
-
-        return jsonify(sorted(events_by_date.values(), key=lambda x: x['date'])), 200
-
-    except Exception as exc:
-        print(f'Error retrieving participant calendar events: {exc}')
+    except Exception:
+        logger.exception('Error retrieving participant calendar events', extra={'participant_id': user_id})
         return jsonify({'error': 'Failed to retrieve events'}), 500
 
 
+@admin_bp.route('/participant-calendar-events/bulk')
+@admin_required
+def bulk_participant_calendar_events():
+    """
+    Calendar events of several participants in one response, for overlaying or
+    flipping through calendars: either ?user_ids=1,2,3 or a page of a study's
+    participant directory (?study_id=&cursor=&limit=), optionally limited to
+    ?start_date=&end_date=. Participants outside the researcher's studies are left out.
+    """
+    next_cursor = None
+    selected_study = _selected_researcher_study()
+    if selected_study:
+        limit = max(1, min(request.args.get('limit', OVERLAY_PAGE_SIZE, type=int), MAX_OVERLAY_PARTICIPANTS))
+        try:
+            after = _directory_cursor()
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        page, has_more = get_participant_directory(selected_study.code, after=after, limit=limit)
+        user_ids = [participant['id'] for participant in page]
+        next_cursor = _next_directory_cursor(page, has_more)
+    else:
+        raw_ids = [part for part in request.args.get('user_ids', '').split(',') if part.strip()]
+        if not raw_ids or not all(part.strip().isdigit() for part in raw_ids):
+            return jsonify({'error': 'user_ids or study_id required'}), 400
+        if len(raw_ids) > MAX_OVERLAY_PARTICIPANTS:
+            return jsonify({'error': f'At most {MAX_OVERLAY_PARTICIPANTS} participants per request'}), 400
+        user_ids = list(dict.fromkeys(int(part) for part in raw_ids))
+
+    entry_filter = []
+    try:
+        if request.args.get('start_date'):
+            entry_filter.append(CalendarEntry.entry_date >= datetime.strptime(request.args['start_date'], '%Y-%m-%d'))
+        if request.args.get('end_date'):
+            entry_filter.append(
+                CalendarEntry.entry_date < datetime.strptime(request.args['end_date'], '%Y-%m-%d') + timedelta(days=1)
+            )
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    # One membership check for the whole list, which also brings each participant's study questions.
+    participants = participants_in_studies(user_ids, _researcher_study_ids())
+    if not participants:
+        return jsonify({'participants': [], 'next_cursor': next_cursor})
+    entry_filter.append(CalendarEntry.user_id.in_([user.id for user, _ in participants]))
+
+    entries_by_user = {}
+    for entry in CalendarEntry.query.filter(*entry_filter).order_by(
+        CalendarEntry.user_id, CalendarEntry.entry_date, CalendarEntry.id
+    ):
+        entries_by_user.setdefault(entry.user_id, []).append(entry)
+    drinking_by_entry = {
+        d.entry_id: d
+        for d in Drinking.query.join(CalendarEntry, Drinking.entry_id == CalendarEntry.id).filter(*entry_filter)
+    }
+    gambling_by_entry = {
+        g.entry_id: g
+        for g in Gambling.query.join(CalendarEntry, Gambling.entry_id == CalendarEntry.id).filter(*entry_filter)
+    }
+
+    schemas = {}
+    results = []
+    for user, study in participants:
+        if study.id not in schemas:
+            schemas[study.id] = calendar_schemas(study.questions)
+        results.append({
+            'user_id': user.id,
+            'username': user.username,
+            'study_id': study.id,
+            'events': build_calendar_events(
+                entries_by_user.get(user.id, []), drinking_by_entry, gambling_by_entry, *schemas[study.id]
+            ),
+        })
+    return jsonify({'participants': results, 'next_cursor': next_cursor})
+
+
 @admin_bp.route('/download_report_full')
 @admin_required
 def download_report_full():
     selected_study = _selected_researcher_study()
     if selected_study:
-        allowed_ids = [
-            u.id for u in
-            User.query.filter(User.is_admin.is_(False), User.study_group_code == selected_study.code).all()
-        ]
+        study_ids = [selected_study.id]
         schema = _study_report_schema(selected_study)
     else:
-        allowed_ids = _researcher_user_ids()
+        study_ids = _researcher_study_ids()
         schema = None
 
     filters = get_report_filters()
 
-    scoped_user_id = filters["all_user_id"] if filters["all_user_id"] in allowed_ids else None
+    scoped_user_id = filters["all_user_id"] if participant_in_studies(filters["all_user_id"], study_ids) else None
 
     file_path = generate_all_users_csv(
         start_date=filters["start_date"],
         end_date=filters["end_date"],
         report_type=filters["report_type"] or None,
         num_drinks=filters["num_drinks"],
-        user_ids=[scoped_user_id] if scoped_user_id else allowed_ids,
+        user_ids=[scoped_user_id] if scoped_user_id else None,
+        study_ids=study_ids,
         schema=schema,
+        answer_filters=get_answer_filters(schema),
     )
     return send_file(file_path, as_attachment=True)
+
+
+@admin_bp.route('/download_summary_scores')
+@admin_required
+def download_summary_scores():
+    selected_study = _selected_researcher_study()
+    study_ids = [selected_study.id] if selected_study else _researcher_study_ids()
+
+    try:
+        file_path = generate_summary_scores_csv(
+            study_ids,
+            start_date=request.args.get('start_date') or None,
+            end_date=request.args.get('end_date') or None,
+            heavy_threshold=request.args.get('heavy_threshold', type=float),
+        )
+    except ValueError:
+        return "Invalid date range", 400
+    return send_file(file_path, as_attachment=True)
@@ -1,13 +1,22 @@
 from flask import Blueprint, request, jsonify, session
-from database.db_helper import create_calendar_entry, get_calendar_entries_for_user
+from database.db_helper import (
+    create_calendar_entry,
+    delete_entries_for_day,
+    get_calendar_entries_for_user,
+    unit_of_work,
+)
 from database.db_initialization import CalendarEntry, Drinking, Gambling, User, StudyCode, db
+from config.schema_validation import validator_for_user
+from routes.idempotency import idempotent
 from pathlib import Path
 import json
+import logging
 from datetime import datetime, timedelta
 
 
 # Create a blueprint to handle events, this will be called in app.py
 events_handler_bp = Blueprint('events_handler', __name__)
+logger = logging.getLogger(__name__)
 
 # Read the questions.json
 with open(Path(__file__).parent.parent / "config" / "questions.json", "r", encoding="utf-8") as f:
@@ -38,6 +47,7 @@ def get_entries_for_user_day(user_id: int, day_str: str):
 # Parameters: N/A
 # Returns: A JSON file containing all answers to the input fields
 @events_handler_bp.route('/log-activity', methods=['POST'])
+@idempotent
 def log_activity():
     data = request.get_json()
     # Error handling
@@ -45,22 +55,19 @@ def log_activity():
         return jsonify({"status": "error", "message": "No data received"}), 400
 
     if not data.get("no_activity"):
-        valid, error_msg = validate_activity_data(data)
+        valid, error_msg = validate_activity_data(data, session.get('user_id') or 1)
         if not valid:
             return jsonify({"status": "error", "message": error_msg}), 400
 
     # save entry to database
     success = save_activity(data)
 
-    # Printing in JSON style to verify
-    print(f"JSON Data: {data}")
-
     # checking success
     if success:
-        return jsonify({
-            "status": "success",
-            "message": "Activity logged successfully"
-        }), 200
+        return jsonify(with_day_event(
+            {"status": "success", "message": "Activity logged successfully"},
+            session.get('user_id') or 1, data.get("date"),
+        )), 200
     else:
         return jsonify({
             "status": "error",
@@ -88,130 +95,90 @@ def save_activity(activity: dict):
         if not drinking_logged and not gambling_logged and not no_activity:
             raise Exception("No activity selected")
 
-        # Keep exactly one logical entry per day. If duplicates exist, operate on the latest.
-        day_entries = get_entries_for_user_day(user_id, entry_date)
-
-        if day_entries:
-            primary_entry = day_entries[0]
-        else:
-            parsed_entry_date = parse_iso_day(entry_date)
-            if not parsed_entry_date:
-                raise Exception("Invalid date format. Expected YYYY-MM-DD")
-            primary_entry = create_calendar_entry(user_id, parsed_entry_date)
-            if not primary_entry:
-                raise Exception("Failed to create CalendarEntry")
-
-        print(f"Created calendar entry: {user_id}, {entry_date}")
-
-        # Remove metadata fields
-        activity_payload = {
-            k: v for k, v in activity.items()
-            if k not in ["date", "drinking_logged", "gambling_logged"]
-        }
-
-        primary_entry_id = primary_entry.id
-        # Child tables are keyed by entry_id; query by entry_id only.
-        drinking_rows = Drinking.query.filter_by(entry_id=primary_entry_id).all()
-        gambling_rows = Gambling.query.filter_by(entry_id=primary_entry_id).all()
+        # Stage the entry and its child rows so the whole day is one transaction.
+        with unit_of_work():
+            # Keep exactly one logical entry per day. If duplicates exist, operate on the latest.
+            day_entries = get_entries_for_user_day(user_id, entry_date)
 
-        if drinking_logged:
-            if drinking_rows:
-                drinking_rows[0].drinking_questions = activity_payload
-                for extra in drinking_rows[1:]:
-                    db.session.delete(extra)
+            if day_entries:
+                primary_entry = day_entries[0]
             else:
-                db.session.add(
-                    Drinking(
-                        entry_id=primary_entry_id,
-                        user_id=user_id,
-                        drinking_questions=activity_payload
+                parsed_entry_date = parse_iso_day(entry_date)
+                if not parsed_entry_date:
+                    raise Exception("Invalid date format. Expected YYYY-MM-DD")
+                primary_entry = create_calendar_entry(user_id, parsed_entry_date)
+                if not primary_entry:
+                    raise Exception("Failed to create CalendarEntry")
+
+            # Remove metadata fields
+            activity_payload = {
+                k: v for k, v in activity.items()
+                if k not in ["date", "drinking_logged", "gambling_logged"]
+            }
+
+            primary_entry_id = primary_entry.id
+            # Child tables are keyed by entry_id; query by entry_id only.
+            drinking_rows = Drinking.query.filter_by(entry_id=primary_entry_id).all()
+            gambling_rows = Gambling.query.filter_by(entry_id=primary_entry_id).all()
+
+            if drinking_logged:
+                if drinking_rows:
+                    drinking_rows[0].drinking_questions = activity_payload
+                    for extra in drinking_rows[1:]:
+                        db.session.delete(extra)
+                else:
+                    db.session.add(
+                        Drinking(
+                            entry_id=primary_entry_id,
+                            user_id=user_id,
+                            drinking_questions=activity_payload
+                        )
                     )
-                )
-        else:
-            for drinking in drinking_rows:
-                db.session.delete(drinking)
-
-        if gambling_logged:
-            if gambling_rows:
-                gambling_rows[0].gambling_questions = activity_payload
-                for extra in gambling_rows[1:]:
-                    db.session.delete(extra)
             else:
-                db.session.add(
-                    Gambling(
-                        entry_id=primary_entry_id,
-                        user_id=user_id,
-                        gambling_questions=activity_payload
+                for drinking in drinking_rows:
+                    db.session.delete(drinking)
+
+            if gambling_logged:
+                if gambling_rows:
+                    gambling_rows[0].gambling_questions = activity_payload
+                    for extra in gambling_rows[1:]:
+                        db.session.delete(extra)
+                else:
+                    db.session.add(
+                        Gambling(
+                            entry_id=primary_entry_id,
+                            user_id=user_id,
+                            gambling_questions=activity_payload
+                        )
                     )
-                )
-        else:
-            for gambling in gambling_rows:
-                db.session.delete(gambling)
+            else:
+                for gambling in gambling_rows:
+                    db.session.delete(gambling)
 
-        # Remove duplicate entries from same date if any already exist.
-        for duplicate_entry in day_entries[1:]:
-            duplicate_drinking_rows = Drinking.query.filter_by(entry_id=duplicate_entry.id).all()
-            duplicate_gambling_rows = Gambling.query.filter_by(entry_id=duplicate_entry.id).all()
-            for drinking in duplicate_drinking_rows:
-                db.session.delete(drinking)
-            for gambling in duplicate_gambling_rows:
-                db.session.delete(gambling)
-            # Flush child deletes before deleting parent to avoid FK violations.
-            db.session.flush()
-            db.session.delete(duplicate_entry)
+            # Remove duplicate entries from same date if any already exist.
+            if len(day_entries) > 1:
+                delete_entries_for_day(user_id, parse_iso_day(entry_date), keep_entry_id=primary_entry_id)
 
-        db.session.commit()
+        logger.info(
+            "Saved activity",
+            extra={"user_id": user_id, "entry_id": primary_entry_id, "day": entry_date, "sampled": True},
+        )
 
         return True
 
-    except Exception as e:
-        print(f"Save Error: {e}")
+    except Exception:
+        db.session.rollback()
+        logger.exception("Save error", extra={"user_id": session.get('user_id'), "day": activity.get("date")})
         return False
 
-def validate_activity_data(data: dict) -> tuple:
+def validate_activity_data(data: dict, user_id=None) -> tuple:
     """
-    Validate that numeric fields contain actual numbers and meet constraints.
+    Validate an activity payload against the participant's study questions
+    (number ranges, decimal places, select options, required answers).
+    The validator is compiled once per study schema version and cached.
     Returns (True, "") on success or (False, error_message) on failure.
     """
-    drinking_logged = data.get("drinking_logged")
-    gambling_logged = data.get("gambling_logged")
-
-    # Fields that must be non-negative numbers
-    non_negative_fields = {
-        "num_drinks": "Number of drinks",
-        "time_spent": "Time spent gambling",
-        "money_intended": "Money intended to gamble",
-        "money_spent": "Money wagered",
-        "drinks_while_gambling": "Drinks while gambling",
-    }
-    # Fields that must be a number but can be negative (e.g. a loss)
-    any_number_fields = {
-        "money_earned": "Money won/lost",
-    }
-
-    fields_to_check = {}
-    if drinking_logged:
-        fields_to_check["num_drinks"] = non_negative_fields["num_drinks"]
-    if gambling_logged:
-        for field in ["time_spent", "money_intended", "money_spent", "drinks_while_gambling"]:
-            fields_to_check[field] = non_negative_fields[field]
-        fields_to_check["money_earned"] = any_number_fields["money_earned"]
-
-    for field, label in fields_to_check.items():
-        value = data.get(field)
-        if value is None or str(value).strip() == "":
-            continue  # Fields are optional; skip if blank
-        try:
-            num = float(value)
-        except (ValueError, TypeError):
-            return False, f"{label} must be a number."
-        if field != "money_earned" and num < 0:
-            return False, f"{label} cannot be negative."
-        str_val = str(value).strip()
-        if '.' in str_val and len(str_val.split('.')[1]) > 2:
-            return False, f"{label} can have at most 2 decimal places."
-
-    return True, ""
+    return validator_for_user(user_id, qSchema).validate(data)
 
 
 def extract_fields(schema_section, answers_dict):
@@ -227,6 +194,124 @@ def extract_fields(schema_section, answers_dict):
     return result
 
 
+def calendar_schemas(questions):
+    """(drinking, gambling) question lists of a study, or those of questions.json for studies without custom ones."""
+    if questions and (questions.get('drinking') or questions.get('gambling')):
+        return questions.get('drinking', []), questions.get('gambling', [])
+    return qSchema.get('drinking', []), qSchema.get('gambling', [])
+
+
+def calendar_schemas_for_user(user_id):
+    """The participant's study question lists (see calendar_schemas)."""
+    user_obj = db.session.get(User, user_id)
+    study = None
+    if user_obj and user_obj.study_group_code:
+        study = StudyCode.query.filter_by(code=user_obj.study_group_code).first()
+    return calendar_schemas(study.questions if study else None)
+
+
+def build_calendar_events(entries, drinking_by_entry, gambling_by_entry, drinking_schema, gambling_schema):
+    """
+    Collapse a participant's entries (sorted by date, then id) and their answers
+    into one API event per date, sorted by date.
+    """
+    events_by_date = {}
+    for e in entries:
+        iso_date = e.entry_date.isoformat().split('T')[0]
+        if iso_date not in events_by_date:
+            events_by_date[iso_date] = {
+                "id": e.id,
+                "date": iso_date,
+                "type": e.entry_type,
+                "has_drinking": False,
+                "has_gambling": False,
+                "has_no_activity": False
+            }
+
+        event = events_by_date[iso_date]
+        if e.id > event["id"]:
+            event["id"] = e.id
+
+        if not e.entry_type or e.entry_type == "drinking":
+            drinking = drinking_by_entry.get(e.id)
+            if drinking:
+                event["has_drinking"] = True
+            if drinking and drinking.drinking_questions:
+                event.update(extract_fields(drinking_schema, drinking.drinking_questions))
+
+        if not e.entry_type or e.entry_type == "gambling":
+            gambling = gambling_by_entry.get(e.id)
+            if gambling:
+                event["has_gambling"] = True
+            if gambling and gambling.gambling_questions:
+                event.update(extract_fields(gambling_schema, gambling.gambling_questions))
+                if not e.entry_type:
+                    event["type"] = "gambling"
+
+    for event in events_by_date.values():
+        if not event["has_drinking"] and not event["has_gambling"]:
+            event["has_no_activity"] = True
+
+    return sorted(events_by_date.values(), key=lambda item: item["date"])
+
+
+def answers_by_entry(entry_ids):
+    # Bulk-load all drinking and gambling records in two queries instead of one per entry.
+    drinking_by_entry = {
+        d.entry_id: d
+        for d in Drinking.query.filter(Drinking.entry_id.in_(entry_ids)).all()
+    }
+    gambling_by_entry = {
+        g.entry_id: g
+        for g in Gambling.query.filter(Gambling.entry_id.in_(entry_ids)).all()
+    }
+    return drinking_by_entry, gambling_by_entry
+
+
+def day_event(user_id: int, day_str: str):
+    """
+    The canonical calendar event of one day, as /calendar-events would list it,
+    or a tombstone {"date": ..., "deleted": True} when the day has no entries.
+    Write endpoints return it so the calendar can patch that day in place.
+    """
+    entries = sorted(get_entries_for_user_day(user_id, day_str), key=lambda row: (row.entry_date, row.id))
+    if not entries:
+        return {"date": day_str, "deleted": True}
+    events = build_calendar_events(
+        entries, *answers_by_entry([e.id for e in entries]), *calendar_schemas_for_user(user_id)
+    )
+    return events[0]
+
+
+def with_day_event(body: dict, user_id: int, day_str: str):
+    """
+    body plus the day's "event", built after the write has committed. If building
+    it fails the write still succeeded, so "event" is left out and the client reloads.
+    """
+    try:
+        body["event"] = day_event(user_id, day_str)
+    except Exception:
+        db.session.rollback()
+        logger.exception("Could not build day event", extra={"user_id": user_id, "date": day_str})
+    return body
+
+
+def month_calendar_events(user_id: int, year: int, month: int, drinking_schema, gambling_schema):
+    """The participant's events in one calendar month, built like /calendar-events (for embedding in the page)."""
+    start_of_month = datetime(year, month, 1)
+    next_month = datetime(year + month // 12, month % 12 + 1, 1)
+    entries = CalendarEntry.query.filter(
+        CalendarEntry.user_id == user_id,
+        CalendarEntry.entry_date >= start_of_month,
+        CalendarEntry.entry_date < next_month,
+    ).order_by(CalendarEntry.entry_date, CalendarEntry.id).all()
+    if not entries:
+        return []
+    return build_calendar_events(
+        entries, *answers_by_entry([e.id for e in entries]), drinking_schema, gambling_schema,
+    )
+
+
 # This function retrieves all saved calendar entries for a user with full details and returns them as JSON
 # Called by: Frontend (app.js) on page load to populate the calendar with existing entries
 # Parameters: user_id from session (or query param as fallback)
@@ -245,18 +330,7 @@ def get_calendar_events():
 
     try:
         # Use the user's study schema if available, otherwise fall back to questions.json
-        user_obj = User.query.get(user_id)
-        if user_obj and user_obj.study_group_code:
-            study = StudyCode.query.filter_by(code=user_obj.study_group_code).first()
-            if study and study.questions and (study.questions.get('drinking') or study.questions.get('gambling')):
-                effective_drinking_schema = study.questions.get('drinking', [])
-                effective_gambling_schema = study.questions.get('gambling', [])
-            else:
-                effective_drinking_schema = qSchema.get('drinking', [])
-                effective_gambling_schema = qSchema.get('gambling', [])
-        else:
-            effective_drinking_schema = qSchema.get('drinking', [])
-            effective_gambling_schema = qSchema.get('gambling', [])
+        effective_drinking_schema, effective_gambling_schema = calendar_schemas_for_user(user_id)
 
         entries = get_calendar_entries_for_user(user_id)
         entries = sorted(entries, key=lambda row: (row.entry_date, row.id))
@@ -264,63 +338,21 @@ def get_calendar_events():
         if not entries:
             return jsonify([]), 200
 
-        # Bulk-load all drinking and gambling records in two queries instead of one per entry.
-        entry_ids = [e.id for e in entries]
-        drinking_by_entry = {
-            d.entry_id: d
-            for d in Drinking.query.filter(Drinking.entry_id.in_(entry_ids)).all()
-        }
-        gambling_by_entry = {
-            g.entry_id: g
-            for g in Gambling.query.filter(Gambling.entry_id.in_(entry_ids)).all()
-        }
+        drinking_by_entry, gambling_by_entry = answers_by_entry([e.id for e in entries])
 
         # Collapse multiple DB rows from the same date into one API event.
-        events_by_date = {}
-        for e in entries:
-            iso_date = e.entry_date.isoformat().split('T')[0]
-            if iso_date not in events_by_date:
-                events_by_date[iso_date] = {
-                    "id": e.id,
-                    "date": iso_date,
-                    "type": e.entry_type,
-                    "has_drinking": False,
-                    "has_gambling": False,
-                    "has_no_activity": False
-                }
-
-            event = events_by_date[iso_date]
-            if e.id > event["id"]:
-                event["id"] = e.id
-
-            if not e.entry_type or e.entry_type == "drinking":
-                drinking = drinking_by_entry.get(e.id)
-                if drinking:
-                    event["has_drinking"] = True
-                if drinking and drinking.drinking_questions:
-                    event.update(extract_fields(effective_drinking_schema, drinking.drinking_questions))
-
-            if not e.entry_type or e.entry_type == "gambling":
-                gambling = gambling_by_entry.get(e.id)
-                if gambling:
-                    event["has_gambling"] = True
-                if gambling and gambling.gambling_questions:
-                    event.update(extract_fields(effective_gambling_schema, gambling.gambling_questions))
-                    if not e.entry_type:
-                        event["type"] = "gambling"
-
-        for event in events_by_date.values():
-            if not event["has_drinking"] and not event["has_gambling"]:
-                event["has_no_activity"] = True
-
-        return jsonify(sorted(events_by_date.values(), key=lambda item: item["date"])), 200
-
-    except Exception as exc:
-        print(f"Error retrieving calendar events: {exc}")
+        events = build_calendar_events(
+            entries, drinking_by_entry, gambling_by_entry, effective_drinking_schema, effective_gambling_schema,
+        )
+        return jsonify(events), 200
+
+    except Exception:
+        logger.exception("Error retrieving calendar events", extra={"user_id": user_id})
         return jsonify({"status": "error", "message": "Failed to retrieve events"}), 500
 
 
 @events_handler_bp.route('/activity/<int:entry_id>', methods=['PUT'])
+@idempotent
 def update_activity(entry_id):
     data = request.get_json()
     if not data:
@@ -337,7 +369,7 @@ def update_activity(entry_id):
         return jsonify({"status": "error", "message": "No activity selected"}), 400
 
     if not no_activity:
-        valid, error_msg = validate_activity_data(data)
+        valid, error_msg = validate_activity_data(data, user_id)
         if not valid:
             return jsonify({"status": "error", "message": error_msg}), 400
 
@@ -345,8 +377,7 @@ def update_activity(entry_id):
     if not entry:
         return jsonify({"status": "error", "message": "Entry not found"}), 404
 
-    day_iso = entry.entry_date.isoformat().split('T')[0]
-    same_day_entries = get_entries_for_user_day(user_id, day_iso)
+    day_start = parse_iso_day(entry.entry_date.isoformat().split('T')[0])
 
     activity_payload = {
         k: v for k, v in data.items()
@@ -392,31 +423,23 @@ def update_activity(entry_id):
                 db.session.delete(gambling)
 
         # Keep only the edited entry for that day; remove stale duplicates.
-        for day_entry in same_day_entries:
-            if day_entry.id == entry_id:
-                continue
-
-            duplicate_drinking_rows = Drinking.query.filter_by(entry_id=day_entry.id).all()
-            duplicate_gambling_rows = Gambling.query.filter_by(entry_id=day_entry.id).all()
-
-            for drinking in duplicate_drinking_rows:
-                db.session.delete(drinking)
-            for gambling in duplicate_gambling_rows:
-                db.session.delete(gambling)
-            # Flush child deletes before deleting parent to satisfy FK constraints.
-            db.session.flush()
-            db.session.delete(day_entry)
+        delete_entries_for_day(user_id, day_start, keep_entry_id=entry_id)
 
         db.session.commit()
-        return jsonify({"status": "success", "message": "Activity updated successfully"}), 200
 
-    except Exception as exc:
+    except Exception:
         db.session.rollback()
-        print(f"Update Error: {exc}")
+        logger.exception("Update error", extra={"user_id": user_id, "entry_id": entry_id})
         return jsonify({"status": "error", "message": "Failed to update activity"}), 500
 
+    return jsonify(with_day_event(
+        {"status": "success", "message": "Activity updated successfully"},
+        user_id, day_start.strftime("%Y-%m-%d"),
+    )), 200
+
 
 @events_handler_bp.route('/activity/<int:entry_id>', methods=['DELETE'])
+@idempotent
 def delete_activity(entry_id):
     user_id = session.get('user_id')
     if not user_id:
@@ -426,27 +449,19 @@ def delete_activity(entry_id):
     if not entry:
         return jsonify({"status": "error", "message": "Entry not found"}), 404
 
-    day_iso = entry.entry_date.isoformat().split('T')[0]
-    same_day_entries = get_entries_for_user_day(user_id, day_iso)
+    day_start = parse_iso_day(entry.entry_date.isoformat().split('T')[0])
 
     try:
         # Delete all entries for the same date so duplicates are removed too.
-        for day_entry in same_day_entries:
-            drinking_rows = Drinking.query.filter_by(entry_id=day_entry.id).all()
-            gambling_rows = Gambling.query.filter_by(entry_id=day_entry.id).all()
-
-            for drinking in drinking_rows:
-                db.session.delete(drinking)
-            for gambling in gambling_rows:
-                db.session.delete(gambling)
-            # Flush child deletes before deleting parent to satisfy FK constraints.
-            db.session.flush()
-            db.session.delete(day_entry)
-
+        delete_entries_for_day(user_id, day_start)
         db.session.commit()
-        return jsonify({"status": "success", "message": "Entry deleted successfully"}), 200
+        return jsonify({
+            "status": "success",
+            "message": "Entry deleted successfully",
+            "event": {"date": day_start.strftime("%Y-%m-%d"), "deleted": True},
+        }), 200
 
-    except Exception as exc:
+    except Exception:
         db.session.rollback()
-        print(f"Delete Error: {exc}")
+        logger.exception("Delete error", extra={"user_id": user_id, "entry_id": entry_id})
         return jsonify({"status": "error", "message": "Failed to delete entry"}), 500
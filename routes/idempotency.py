@@ -0,0 +1,125 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that may retry a write (flaky mobile connections) sends the same
+Idempotency-Key header with every attempt. The first attempt runs the view and
+its response is kept in the IdempotencyKey table for IDEMPOTENCY_TTL_SECONDS;
+retries with the same key from the same user get that stored response back
+(marked with Idempotent-Replayed: true) without the view running again. The
+table is shared by every worker process, so a retry routed to another worker
+is replayed too. Server errors (5xx) are not stored, so those attempts can be
+retried for real. A key reused for a different request (method, path or body)
+is rejected with 422, and a retry that arrives while the first attempt is
+still running gets 409.
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, jsonify, make_response, request, session
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from database.db_initialization import IdempotencyKey, db
+from monitoring.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+DEFAULT_IDEMPOTENCY_TTL_SECONDS = 3600
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """Responses by (user_id, key) in the IdempotencyKey table, each expiring after its TTL."""
+
+    @staticmethod
+    def _row(user_id, key):
+        return (IdempotencyKey.user_id == user_id) & (IdempotencyKey.key == key)
+
+    def begin(self, user_id, key, fingerprint, ttl):
+        """
+        The stored IdempotencyKey if there is a live one, else None after reserving
+        (user_id, key) for this request. The reservation is committed at once so
+        other workers see it while the view runs.
+        """
+        now = datetime.utcnow()
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
+        try:
+            db.session.execute(insert(IdempotencyKey).values(
+                user_id=user_id, key=key, fingerprint=fingerprint, expires_at=now + timedelta(seconds=ttl),
+            ))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+        stored = db.session.get(IdempotencyKey, (user_id, key), populate_existing=True)
+        # Released by a failed first attempt in between: report it as still running so the client retries.
+        return stored or IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint)
+
+    def complete(self, user_id, key, status, body, mimetype):
+        # Anything the view left uncommitted would be rolled back at teardown anyway.
+        db.session.rollback()
+        db.session.execute(
+            update(IdempotencyKey).where(self._row(user_id, key)).values(status=status, body=body, mimetype=mimetype)
+        )
+        db.session.commit()
+
+    def release(self, user_id, key):
+        db.session.rollback()
+        db.session.execute(delete(IdempotencyKey).where(self._row(user_id, key)))
+        db.session.commit()
+
+    def clear(self):
+        db.session.execute(delete(IdempotencyKey))
+        db.session.commit()
+
+
+store = IdempotencyStore()
+
+
+def idempotent(view):
+    """Replay the stored response of a request that repeats an earlier Idempotency-Key."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER, "").strip()
+        user_id = session.get("user_id")
+        if not key or user_id is None:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"status": "error", "message": f"{IDEMPOTENCY_HEADER} is too long"}), 400
+
+        digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+        digest.update(request.get_data())
+        fingerprint = digest.hexdigest()
+        ttl = current_app.config.get("IDEMPOTENCY_TTL_SECONDS", DEFAULT_IDEMPOTENCY_TTL_SECONDS)
+
+        stored = store.begin(user_id, key, fingerprint, ttl)
+        record_cache("idempotency_keys", stored is not None)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return jsonify({
+                    "status": "error",
+                    "message": f"{IDEMPOTENCY_HEADER} was already used for a different request",
+                }), 422
+            if stored.status is None:
+                return jsonify({"status": "error", "message": "This request is still being processed"}), 409
+            logger.info("Replayed idempotent request", extra={"path": request.path})
+            replay = Response(stored.body, status=stored.status, mimetype=stored.mimetype)
+            replay.headers["Idempotent-Replayed"] = "true"
+            return replay
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            store.release(user_id, key)
+            raise
+        if response.status_code >= 500:
+            store.release(user_id, key)
+        else:
+            store.complete(user_id, key, response.status_code, response.get_data(), response.mimetype)
+        return response
+
+    return wrapper
@@ -1,59 +1,73 @@
-import json
 from datetime import datetime, timedelta
+from functools import cached_property
 
-from flask import Blueprint, redirect, render_template, session, url_for
+from flask import Blueprint, abort, current_app, jsonify, redirect, render_template, request, session, url_for
 from sqlalchemy.exc import NoSuchTableError
-from sqlalchemy import asc
 
-from database.db_initialization import CalendarEntry, Drinking, Gambling, User, StudyCode, db
-from config.config_helper import field_map_from_schema
+from database.db_initialization import User
+from database.gambling_metrics import compute_gambling_metrics
+from database.insights_engine import (
+    DEFAULT_CHART_POINT_BUDGET,
+    DOW_NAMES,
+    INSIGHTS_WINDOWS,
+    chart_series,
+    load_daily_columns,
+    monthly_breakdown as build_monthly_breakdown,
+    range_sum,
+    resolve_insights_window,
+    weekday_sums,
+)
 
 insights_bp = Blueprint("insights", __name__)
 
 
-def _get_expense_snapshot(user_id):
+def _reflect_expense_table():
     try:
-        from routes.personal_expense import (
-            calculate_totals,
-            read_expense_snapshot,
-            reflect_personal_expense_table,
-        )
+        from routes.personal_expense import reflect_personal_expense_table
+
+        return reflect_personal_expense_table()
+    except (NoSuchTableError, Exception):
+        return None
+
+
+def _get_expense_snapshot(table, user_id):
+    empty = {}, {
+        "income": 0.0,
+        "expense_total": 0.0,
+        "savings": 0.0,
+        "allocation_total": 0.0,
+        "remaining": 0.0,
+    }
+    if table is None:
+        return empty
+    try:
+        from routes.personal_expense import calculate_totals, read_expense_snapshot
 
-        table = reflect_personal_expense_table()
         _, payload = read_expense_snapshot(table, user_id)
         return payload, calculate_totals(payload)
     except (NoSuchTableError, Exception):
-        return {}, {
-            "income": 0.0,
-            "expense_total": 0.0,
-            "savings": 0.0,
-            "allocation_total": 0.0,
-            "remaining": 0.0,
-        }
-
-
-def _get_three_month_income(user_id):
-    """Estimate 3 months of income using the saved expense profile, with old monthly data as fallback."""
-    _, expense_totals = _get_expense_snapshot(user_id)
-    monthly_income = expense_totals.get("income", 0.0)
-    if monthly_income > 0:
-        return monthly_income * 3
+        return empty
 
-    try:
-        from routes.personal_expense import (
-            month_context,
-            read_payload_for_month,
-            reflect_personal_expense_table,
-        )
 
-        table = reflect_personal_expense_table()
-    except (NoSuchTableError, Exception):
+# Average month length, to express an insights window as a number of months of income
+AVERAGE_MONTH_DAYS = 365.25 / 12
+
+
+def _get_window_income(table, user_id, window_days, expense_totals):
+    """Estimate income over a window of window_days using the saved expense profile, with old monthly data as fallback."""
+    months = max(1, round(window_days / AVERAGE_MONTH_DAYS))
+    monthly_income = expense_totals.get("income", 0.0)
+    if monthly_income > 0:
+        return monthly_income * months
+    if table is None:
         return 0.0
 
+    from routes.personal_expense import month_context, read_payload_for_month
+
     today = datetime.utcnow()
     total_income = 0.0
 
-    for months_back in range(3):
+    for months_back in range(months):
         month = today.month - months_back
         year = today.year
         while month <= 0:
@@ -66,217 +80,240 @@ def _get_three_month_income(user_id):
     return total_income
 
 
-def _get_field_map(user_id):
-    user = User.query.get(user_id)
-    if not user or not user.study_group_code:
-        return field_map_from_schema(None)
-    study = StudyCode.query.filter_by(code=user.study_group_code).first()
-    if not study or not study.questions:
-        return field_map_from_schema(None)
-    return field_map_from_schema(study.questions)
-
-
-def compute_insights(user_id):
-    """Compute all insights data for a given user_id. Returns a dict of template variables."""
-    fm = _get_field_map(user_id)
-    three_months_ago = datetime.utcnow() - timedelta(days=91)
-    current_month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    last_month_end = current_month_start
-    last_month_start = (current_month_start - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    last_month_label = last_month_start.strftime("%B %Y")
-
-    rows = (
-        db.session.query(Gambling, CalendarEntry.entry_date)
-        .join(CalendarEntry, Gambling.entry_id == CalendarEntry.id)
-        .filter(
-            Gambling.user_id == user_id,
-            CalendarEntry.entry_date >= three_months_ago,
-        )
-        .order_by(asc(CalendarEntry.entry_date))
-        .all()
-    )
+class InsightsInputs:
+    """
+    A participant and insights window, plus the data several sections share
+    (the window's day columns, the expense profile, income), each loaded at
+    most once however many sections are built from it.
+    """
+
+    def __init__(self, user_id, window):
+        self.user_id = user_id
+        self.window = window
+
+    @cached_property
+    def columns(self):
+        """(GamblingColumns, DrinkingColumns) of the window."""
+        return load_daily_columns(self.user_id, self.window.start, self.window.end)
+
+    @cached_property
+    def expense_table(self):
+        return _reflect_expense_table()
+
+    @cached_property
+    def expense_totals(self):
+        return _get_expense_snapshot(self.expense_table, self.user_id)[1]
 
-    total_sessions = len(rows)
-    total_intended = 0.0
-    total_wagered = 0.0
-    total_hours = 0.0
-    total_net_earned = 0.0
-    sessions_over_intent = 0
-    last_month_gambling_total = 0.0
-
-    chart_labels = []
-    chart_intended = []
-    chart_wagered = []
-
-    # month_key -> {label, sessions, intended, wagered, over_intent}
-    monthly = {}
-
-    for gambling, entry_date in rows:
-        questions = gambling.gambling_questions or {}
-        intended = float(questions.get(fm['money_intended']) or 0)
-        wagered = float(questions.get(fm['money_spent']) or 0)
-        total_intended += intended
-        total_wagered += wagered
-        total_hours += float(questions.get(fm['time_spent']) or 0)
-        total_net_earned += float(questions.get(fm['money_earned']) or 0)
-        if wagered > intended:
-            sessions_over_intent += 1
-
-        entry_moment = entry_date if isinstance(entry_date, datetime) else datetime.combine(entry_date, datetime.min.time())
-        if last_month_start <= entry_moment < last_month_end:
-            last_month_gambling_total += wagered
-
-        chart_labels.append(entry_date.strftime("%b") + " " + str(entry_date.day))
-        chart_intended.append(round(intended, 2))
-        chart_wagered.append(round(wagered, 2))
-
-        mk = entry_date.strftime("%Y-%m")
-        if mk not in monthly:
-            monthly[mk] = {
-                "label": entry_date.strftime("%B %Y"),
-                "sessions": 0,
-                "intended": 0.0,
-                "wagered": 0.0,
-                "over_intent": 0,
-            }
-        monthly[mk]["sessions"] += 1
-        monthly[mk]["intended"] += intended
-        monthly[mk]["wagered"] += wagered
-        if wagered > intended:
-            monthly[mk]["over_intent"] += 1
-
-    # sorted list for the template
-    monthly_breakdown = [monthly[k] for k in sorted(monthly)]
-    for m in monthly_breakdown:
-        m["intended"] = round(m["intended"], 2)
-        m["wagered"] = round(m["wagered"], 2)
-        m["diff"] = round(m["wagered"] - m["intended"], 2)
-
-    # monthly chart arrays (one bar pair per month)
-    monthly_labels   = json.dumps([m["label"] for m in monthly_breakdown])
-    monthly_intended = json.dumps([m["intended"] for m in monthly_breakdown])
-    monthly_wagered  = json.dumps([m["wagered"] for m in monthly_breakdown])
-
-    # ── Day-of-week breakdown ─────────────────────────────────────────────
-    DOW_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-
-    dow_gambling = [{"day": d, "sessions": 0, "wagered": 0.0} for d in DOW_NAMES]
-    for gambling, entry_date in rows:
-        dow = entry_date.weekday()  # 0=Mon … 6=Sun
-        questions = gambling.gambling_questions or {}
-        dow_gambling[dow]["sessions"] += 1
-        dow_gambling[dow]["wagered"] += float(questions.get(fm['money_spent']) or 0)
-
-    dow_drinking_rows = (
-        db.session.query(Drinking, CalendarEntry.entry_date)
-        .join(CalendarEntry, Drinking.entry_id == CalendarEntry.id)
-        .filter(
-            Drinking.user_id == user_id,
-            CalendarEntry.entry_date >= three_months_ago,
+    @cached_property
+    def window_income(self):
+        return _get_window_income(self.expense_table, self.user_id, self.window.days, self.expense_totals)
+
+
+def insights_window_from_request(user_id, study_ids=None):
+    """The window picked with ?window= (or ?start=&end=), falling back to the default on bad input."""
+    try:
+        return resolve_insights_window(
+            user_id, request.args.get("window"), request.args.get("start"), request.args.get("end"),
+            study_ids=study_ids,
         )
-        .all()
-    )
+    except ValueError:
+        return resolve_insights_window(user_id, study_ids=study_ids)
 
-    dow_drinking = [{"day": d, "sessions": 0, "drinks": 0.0} for d in DOW_NAMES]
-    for drinking, entry_date in dow_drinking_rows:
-        dow = entry_date.weekday()
-        questions = drinking.drinking_questions or {}
-        dow_drinking[dow]["sessions"] += 1
-        dow_drinking[dow]["drinks"] += float(questions.get(fm['num_drinks']) or 0)
-
-    # round wagered/drinks totals
-    for d in dow_gambling:
-        d["wagered"] = round(d["wagered"], 2)
-    for d in dow_drinking:
-        d["drinks"] = round(d["drinks"], 1)
-
-    dow_labels             = json.dumps(DOW_NAMES)
-    dow_gambling_sessions  = json.dumps([d["sessions"] for d in dow_gambling])
-    dow_gambling_wagered   = json.dumps([d["wagered"]  for d in dow_gambling])
-    dow_drinking_sessions  = json.dumps([d["sessions"] for d in dow_drinking])
-    dow_drinking_drinks    = json.dumps([d["drinks"]   for d in dow_drinking])
-
-    total_hours_rounded = round(total_hours, 1)
-    total_days = int(total_hours_rounded // 24)
-    remaining_hours = round(total_hours_rounded % 24, 1)
-
-    total_losses = round(abs(total_net_earned), 2) if total_net_earned < 0 else 0.0
-
-    # Projected losses (extrapolate 3-month loss rate)
-    projected_1yr  = round(total_losses * 4)
-    projected_5yr  = round(total_losses * 20)
-    projected_10yr = round(total_losses * 40)
-    projected_25yr = round(total_losses * 100)
 
-    # Hourly comparison
-    MIN_WAGE = 7.25
-    min_wage_earnings = round(MIN_WAGE * total_hours_rounded, 2) if total_hours_rounded else 0.0
-    loss_per_hour     = round(total_losses / total_hours_rounded, 2) if total_hours_rounded > 0 else 0.0
+def _total_losses(gambling):
+    total_net_earned = sum(gambling.net)
+    return round(abs(total_net_earned), 2) if total_net_earned < 0 else 0.0
+
+
+def _hours(gambling):
+    return round(sum(gambling.hours), 1)
 
-    excess_wagered = total_wagered - total_intended
-    total_income = _get_three_month_income(user_id)
-    _, expense_totals = _get_expense_snapshot(user_id)
-    monthly_expense_total = round(expense_totals.get("expense_total", 0.0), 2)
-    last_month_gambling_total = round(last_month_gambling_total, 2)
-    expense_vs_gambling_has_data = monthly_expense_total > 0 or last_month_gambling_total > 0
-    if monthly_expense_total > 0:
-        expense_vs_gambling_pct = round((last_month_gambling_total / monthly_expense_total) * 100)
-    else:
-        expense_vs_gambling_pct = None
 
+def summary_section(inputs):
+    """Totals for the window, with intent and wager as a share of income."""
+    gambling, _ = inputs.columns
+    total_sessions = sum(gambling.sessions)
+    total_intended = sum(gambling.intended)
+    total_wagered = sum(gambling.wagered)
+    total_hours_rounded = _hours(gambling)
+
+    total_income = inputs.window_income
     if total_income > 0:
         intent_pct  = round((total_intended / total_income) * 100)
         risk_pct    = round((total_wagered  / total_income) * 100)
-        loss_pct    = round((total_losses   / total_income) * 100) if total_losses > 0 else None
     else:
         intent_pct = None
         risk_pct   = None
-        loss_pct   = None
 
     return dict(
         total_sessions=total_sessions,
         total_intended=total_intended,
         total_wagered=total_wagered,
-        sessions_over_intent=sessions_over_intent,
-        excess_wagered=excess_wagered,
+        sessions_over_intent=sum(gambling.over_intent),
+        excess_wagered=total_wagered - total_intended,
         total_income=total_income,
         intent_pct=intent_pct,
         risk_pct=risk_pct,
         total_hours=total_hours_rounded,
-        total_days=total_days,
-        remaining_hours=remaining_hours,
+        total_days=int(total_hours_rounded // 24),
+        remaining_hours=round(total_hours_rounded % 24, 1),
+        total_losses=_total_losses(gambling),
+    )
+
+
+def projections_section(inputs):
+    """Losses over the window extrapolated to years, and compared with minimum wage."""
+    window = inputs.window
+    gambling, _ = inputs.columns
+    total_losses = _total_losses(gambling)
+    total_hours_rounded = _hours(gambling)
+
+    # Projected losses (extrapolate the window's daily loss rate)
+    yearly_losses  = total_losses * 365 / window.days
+
+    # Hourly comparison
+    MIN_WAGE = 7.25
+    min_wage_earnings = round(MIN_WAGE * total_hours_rounded, 2) if total_hours_rounded else 0.0
+    loss_per_hour     = round(total_losses / total_hours_rounded, 2) if total_hours_rounded > 0 else 0.0
+
+    loss_pct = None
+    if total_losses > 0:
+        total_income = inputs.window_income
+        if total_income > 0:
+            loss_pct = round((total_losses / total_income) * 100)
+
+    return dict(
+        total_sessions=sum(gambling.sessions),
         total_losses=total_losses,
         loss_pct=loss_pct,
-        projected_1yr=projected_1yr,
-        projected_5yr=projected_5yr,
-        projected_10yr=projected_10yr,
-        projected_25yr=projected_25yr,
+        projected_1yr=round(yearly_losses),
+        projected_5yr=round(yearly_losses * 5),
+        projected_10yr=round(yearly_losses * 10),
+        projected_25yr=round(yearly_losses * 25),
         min_wage_earnings=min_wage_earnings,
         loss_per_hour=loss_per_hour,
-        chart_labels=json.dumps(chart_labels),
-        chart_intended=json.dumps(chart_intended),
-        chart_wagered=json.dumps(chart_wagered),
+    )
+
+
+def monthly_section(inputs):
+    gambling, _ = inputs.columns
+    monthly_breakdown = build_monthly_breakdown(gambling)
+    return dict(
+        total_sessions=sum(gambling.sessions),
         monthly_breakdown=monthly_breakdown,
-        monthly_labels=monthly_labels,
-        monthly_intended=monthly_intended,
-        monthly_wagered=monthly_wagered,
+        monthly_labels=[m["label"] for m in monthly_breakdown],
+        monthly_intended=[m["intended"] for m in monthly_breakdown],
+        monthly_wagered=[m["wagered"] for m in monthly_breakdown],
+    )
+
+
+def dow_section(inputs):
+    gambling, drinking = inputs.columns
+    gambling_sessions, gambling_wagered = weekday_sums(gambling.dates, gambling.sessions, gambling.wagered)
+    drinking_sessions, drinking_drinks = weekday_sums(drinking.dates, drinking.sessions, drinking.drinks)
+    dow_gambling = [
+        {"day": day, "sessions": sessions, "wagered": round(wagered, 2)}
+        for day, sessions, wagered in zip(DOW_NAMES, gambling_sessions, gambling_wagered)
+    ]
+    dow_drinking = [
+        {"day": day, "sessions": sessions, "drinks": round(drinks, 1)}
+        for day, sessions, drinks in zip(DOW_NAMES, drinking_sessions, drinking_drinks)
+    ]
+    return dict(
+        total_sessions=sum(gambling.sessions),
         dow_gambling=dow_gambling,
         dow_drinking=dow_drinking,
-        dow_labels=dow_labels,
-        dow_gambling_sessions=dow_gambling_sessions,
-        dow_gambling_wagered=dow_gambling_wagered,
-        dow_drinking_sessions=dow_drinking_sessions,
-        dow_drinking_drinks=dow_drinking_drinks,
+        dow_labels=DOW_NAMES,
+        dow_gambling_sessions=gambling_sessions,
+        dow_gambling_wagered=[d["wagered"] for d in dow_gambling],
+        dow_drinking_sessions=drinking_sessions,
+        dow_drinking_drinks=[d["drinks"] for d in dow_drinking],
+    )
+
+
+def expense_section(inputs):
+    """Last calendar month's gambling against the monthly expenses in the saved profile (window-independent)."""
+    current_month_start = datetime.utcnow().date().replace(day=1)
+    last_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
+    gambling, _ = load_daily_columns(inputs.user_id, last_month_start, current_month_start - timedelta(days=1))
+    last_month_gambling_total = round(
+        range_sum(gambling.dates, gambling.wagered, last_month_start, current_month_start), 2,
+    )
+
+    monthly_expense_total = round(inputs.expense_totals.get("expense_total", 0.0), 2)
+    if monthly_expense_total > 0:
+        expense_vs_gambling_pct = round((last_month_gambling_total / monthly_expense_total) * 100)
+    else:
+        expense_vs_gambling_pct = None
+
+    return dict(
         monthly_expense_total=monthly_expense_total,
         last_month_gambling_total=last_month_gambling_total,
         expense_vs_gambling_pct=expense_vs_gambling_pct,
-        expense_vs_gambling_period_label=last_month_label,
-        expense_vs_gambling_has_data=expense_vs_gambling_has_data,
-        expense_vs_gambling_labels=json.dumps(["Expenses", "Gambling"]),
-        expense_vs_gambling_values=json.dumps([monthly_expense_total, last_month_gambling_total]),
+        expense_vs_gambling_period_label=last_month_start.strftime("%B %Y"),
+        expense_vs_gambling_has_data=monthly_expense_total > 0 or last_month_gambling_total > 0,
+        expense_vs_gambling_labels=["Expenses", "Gambling"],
+        expense_vs_gambling_values=[monthly_expense_total, last_month_gambling_total],
     )
 
 
+def patterns_section(inputs):
+    window = inputs.window
+    gambling_metrics = compute_gambling_metrics(
+        user_ids=[inputs.user_id], start_date=window.start.isoformat(), end_date=window.end.isoformat(),
+    ).get(inputs.user_id)
+    return dict(gambling_metrics=gambling_metrics)
+
+
+def timeline_section(inputs):
+    """Wagered vs intended per day, reduced to the configured chart point budget."""
+    gambling, _ = inputs.columns
+    timeline = chart_series(gambling, current_app.config.get("CHART_POINT_BUDGET", DEFAULT_CHART_POINT_BUDGET))
+    return dict(
+        total_sessions=sum(gambling.sessions),
+        chart_granularity=timeline["granularity"],
+        chart_labels=timeline["labels"],
+        chart_intended=timeline["intended"],
+        chart_wagered=timeline["wagered"],
+    )
+
+
+# Page order of the sections; each is built from an InsightsInputs, has a partial under
+# templates/partials/insights/ (shared by the participant and researcher views; the researcher
+# view passes `selected_user`) and is served as JSON on its own.
+INSIGHTS_SECTIONS = {
+    "expense": expense_section,
+    "summary": summary_section,
+    "projections": projections_section,
+    "patterns": patterns_section,
+    "timeline": timeline_section,
+    "monthly": monthly_section,
+    "dow": dow_section,
+}
+
+
+def compute_insights(user_id, window=None):
+    """
+    Compute every insights section for a given user_id over an InsightsWindow
+    (default: the past 3 months), merged into one dict.
+    """
+    window = window or resolve_insights_window(user_id)
+    inputs = InsightsInputs(user_id, window)
+    insights = dict(window=window, insights_windows=INSIGHTS_WINDOWS)
+    for build in INSIGHTS_SECTIONS.values():
+        insights.update(build(inputs))
+    return insights
+
+
+def insights_section_response(user_id, name, window, sections=INSIGHTS_SECTIONS, **template_vars):
+    """JSON for one lazily loaded section: its data and its card rendered from partials/insights/<name>.html."""
+    if name not in sections:
+        abort(404)
+    data = sections[name](InsightsInputs(user_id, window))
+    html = render_template(f"partials/insights/{name}.html", d=data, window=window, **template_vars)
+    return jsonify({"section": name, "window": window.as_dict(), "data": data, "html": html})
+
+
 @insights_bp.route("/insights")
 def insights():
     user_id = session.get("user_id")
@@ -287,4 +324,22 @@ def insights():
     if not user or user.is_admin:
         return redirect(url_for("calendar"))
 
-    return render_template("insights.html", **compute_insights(user_id))
+    return render_template(
+        "insights.html",
+        window=insights_window_from_request(user_id),
+        insights_windows=INSIGHTS_WINDOWS,
+        sections=list(INSIGHTS_SECTIONS),
+    )
+
+
+@insights_bp.route("/insights/sections/<name>")
+def insights_section(name):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Not logged in"}), 401
+
+    user = User.query.get(user_id)
+    if not user or user.is_admin:
+        return jsonify({"error": "Insights are only available to participants"}), 403
+
+    return insights_section_response(user_id, name, insights_window_from_request(user_id))
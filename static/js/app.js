@@ -244,6 +244,34 @@ const initCalendar = () => {
         }
     };
 
+    // Replace the local entries with an /api/calendar-events style list (one event per day).
+    const ingestEvents = (events) => {
+        Object.keys(entries).forEach((key) => delete entries[key]);
+
+        const { drinking: dqs, gambling: gqs } = getQs();
+        const allFieldIds = [...dqs, ...gqs].map((q) => q.id);
+
+        events.forEach((event) => {
+            const dateKey = event.date;
+            if (!entries[dateKey]) {
+                entries[dateKey] = [event];
+                return;
+            }
+
+            const merged = entries[dateKey][0];
+            merged.id = Math.max(merged.id || 0, event.id || 0);
+            merged.has_drinking = Boolean(merged.has_drinking) || Boolean(event.has_drinking);
+            merged.has_gambling = Boolean(merged.has_gambling) || Boolean(event.has_gambling);
+
+            allFieldIds.forEach((field) => {
+                if (hasValue(event[field])) merged[field] = event[field];
+            });
+        });
+    };
+
+    // Set once every event has been fetched; until then only the bootstrapped month is known.
+    let allEventsLoaded = false;
+
     const loadEvents = async () => {
         try {
             const eventsUrl = window.CALENDAR_EVENTS_URL || '/api/calendar-events';
@@ -258,28 +286,8 @@ const initCalendar = () => {
                 return;
             }
 
-            Object.keys(entries).forEach((key) => delete entries[key]);
-
-            const { drinking: dqs, gambling: gqs } = getQs();
-            const allFieldIds = [...dqs, ...gqs].map((q) => q.id);
-
-            events.forEach((event) => {
-                const dateKey = event.date;
-                if (!entries[dateKey]) {
-                    entries[dateKey] = [event];
-                    return;
-                }
-
-                const merged = entries[dateKey][0];
-                merged.id = Math.max(merged.id || 0, event.id || 0);
-                merged.has_drinking = Boolean(merged.has_drinking) || Boolean(event.has_drinking);
-                merged.has_gambling = Boolean(merged.has_gambling) || Boolean(event.has_gambling);
-
-                allFieldIds.forEach((field) => {
-                    if (hasValue(event[field])) merged[field] = event[field];
-                });
-            });
-
+            ingestEvents(events);
+            allEventsLoaded = true;
             render();
         } catch (error) {
             console.error('Error fetching calendar events:', error);
@@ -287,6 +295,53 @@ const initCalendar = () => {
         }
     };
 
+    // calendar.html may embed the current month's events (window.CALENDAR_BOOTSTRAP);
+    // other months are fetched the first time the user navigates away from it.
+    const bootstrap = window.CALENDAR_BOOTSTRAP;
+    const isBootstrappedMonth = (year, month) => Boolean(bootstrap)
+        && Array.isArray(bootstrap.events)
+        && bootstrap.year === year
+        && bootstrap.month === month + 1;
+
+    // One Idempotency-Key per distinct write: resubmitting the same write after a failed or
+    // dropped response reuses the key, so the server replays its result instead of writing twice.
+    let pendingWrite = null;
+    const newIdempotencyKey = () => (window.crypto && window.crypto.randomUUID)
+        ? window.crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+
+    const sendWrite = async (endpoint, method, payload) => {
+        const body = payload === undefined ? undefined : JSON.stringify(payload);
+        const signature = `${method} ${endpoint} ${body || ''}`;
+        if (!pendingWrite || pendingWrite.signature !== signature) {
+            pendingWrite = { signature, key: newIdempotencyKey() };
+        }
+        const headers = { 'Idempotency-Key': pendingWrite.key };
+        if (body !== undefined) headers['Content-Type'] = 'application/json';
+
+        const response = await fetch(endpoint, { method, headers, body });
+        // Keep the key after a 5xx or a 409 (first attempt still running) so the resubmit is deduplicated.
+        if (response.status < 500 && response.status !== 409) pendingWrite = null;
+        return response;
+    };
+
+    // Write endpoints return the day's canonical event (or a tombstone with deleted: true),
+    // so one day is patched in place instead of refetching every event.
+    const applyDayEvent = async (response) => {
+        const body = await response.json().catch(() => ({}));
+        const event = body.event;
+        if (!event || !event.date) {
+            await loadEvents();
+            return;
+        }
+        if (event.deleted) {
+            delete entries[event.date];
+        } else {
+            entries[event.date] = [event];
+        }
+        render();
+    };
+
     const monthNames = [
         'January', 'February', 'March', 'April', 'May', 'June',
         'July', 'August', 'September', 'October', 'November', 'December',
@@ -311,6 +366,9 @@ const initCalendar = () => {
         state.viewYear = target.getFullYear();
         state.viewMonth = target.getMonth();
         render();
+        if (!allEventsLoaded && !isBootstrappedMonth(state.viewYear, state.viewMonth)) {
+            loadEvents();
+        }
     };
 
     const changeMonth = (delta) => {
@@ -563,10 +621,10 @@ const initCalendar = () => {
             const endpoint = activeEntryId ? `/api/activity/${activeEntryId}` : '/api/log-activity';
             const method = activeEntryId ? 'PUT' : 'POST';
             try {
-                const response = await fetch(endpoint, { method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(payload) });
+                const response = await sendWrite(endpoint, method, payload);
                 if (!response.ok) { alert('Unable to save. Please try again.'); return; }
                 closeModal();
-                await loadEvents();
+                await applyDayEvent(response);
             } catch (err) { console.error(err); alert('Unable to save. Please try again.'); }
             return;
         }
@@ -641,11 +699,7 @@ const initCalendar = () => {
             const endpoint = activeEntryId ? `/api/activity/${activeEntryId}` : '/api/log-activity';
             const method = activeEntryId ? 'PUT' : 'POST';
 
-            const response = await fetch(endpoint, {
-                method,
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(payload)
-            });
+            const response = await sendWrite(endpoint, method, payload);
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({}));
@@ -655,7 +709,7 @@ const initCalendar = () => {
             }
 
             closeModal();
-            await loadEvents();
+            await applyDayEvent(response);
         } catch (error) {
             console.error('Error saving data:', error);
         }
@@ -670,9 +724,7 @@ const initCalendar = () => {
             if (!confirmed) return;
 
             try {
-                const response = await fetch(`/api/activity/${activeEntryId}`, {
-                    method: 'DELETE'
-                });
+                const response = await sendWrite(`/api/activity/${activeEntryId}`, 'DELETE');
 
                 if (!response.ok) {
                     const errorData = await response.json().catch(() => ({}));
@@ -682,7 +734,7 @@ const initCalendar = () => {
                 }
 
                 closeModal();
-                await loadEvents();
+                await applyDayEvent(response);
             } catch (error) {
                 console.error('Error deleting data:', error);
             }
@@ -694,8 +746,13 @@ const initCalendar = () => {
     nextBtn.addEventListener('click', () => changeMonth(1));
 
     resetFormState();
-    render();
-    loadEvents();
+    if (isBootstrappedMonth(state.viewYear, state.viewMonth)) {
+        ingestEvents(bootstrap.events);
+        render();
+    } else {
+        render();
+        loadEvents();
+    }
 };
 
 mountApp();
@@ -0,0 +1,224 @@
+// Loads the insights page one section at a time. Every [data-insights-section]
+// placeholder fetches its own JSON (rendered card + chart data) from data-url in
+// parallel, so a slow section such as the expense comparison never holds up the rest.
+
+const INSIGHTS_FONT = "'Source Sans 3', sans-serif";
+const INSIGHTS_MUTED = "#6b7178";
+const INSIGHTS_GRID = "rgba(27,31,35,0.07)";
+
+function formatDollars(value) {
+    return "$" + Number(value).toLocaleString(undefined, {minimumFractionDigits: 2, maximumFractionDigits: 2});
+}
+
+function drawExpenseChart(section, data) {
+    const canvas = section.querySelector("#expenseVsGamblingChart");
+    if (!canvas) return;
+
+    new Chart(canvas, {
+        type: "doughnut",
+        data: {
+            labels: data.expense_vs_gambling_labels,
+            datasets: [{
+                data: data.expense_vs_gambling_values,
+                backgroundColor: ["#102a43", "#c62828"],
+                borderColor: ["#102a43", "#c62828"],
+                borderWidth: 1,
+                hoverOffset: 8,
+            }],
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            cutout: "62%",
+            plugins: {
+                legend: { display: false },
+                tooltip: {
+                    callbacks: {
+                        label: function (ctx) {
+                            return ctx.label + ": " + formatDollars(ctx.parsed);
+                        },
+                    },
+                },
+            },
+        },
+    });
+}
+
+// Intended vs wagered datasets shared by the monthly bars and the timeline
+function intendedWageredChart(canvas, type, labels, intended, wagered) {
+    const line = type === "line";
+    new Chart(canvas, {
+        type: type,
+        data: {
+            labels: labels,
+            datasets: [
+                {
+                    label: "Intended ($)",
+                    data: intended,
+                    backgroundColor: "rgba(31, 138, 112, 0.80)",
+                    borderColor:     "rgba(31, 138, 112, 1)",
+                    borderWidth: line ? 2 : 1,
+                    borderRadius: 5,
+                    pointRadius: line ? 0 : undefined,
+                },
+                {
+                    label: "Wagered ($)",
+                    data: wagered,
+                    backgroundColor: "rgba(192, 57, 43, 0.75)",
+                    borderColor:     "rgba(192, 57, 43, 1)",
+                    borderWidth: line ? 2 : 1,
+                    borderRadius: 5,
+                    pointRadius: line ? 0 : undefined,
+                },
+            ],
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            interaction: { mode: "index", intersect: false },
+            plugins: {
+                legend: { display: false },
+                tooltip: {
+                    callbacks: {
+                        label: function (ctx) {
+                            return ctx.dataset.label + ": " + formatDollars(ctx.parsed.y);
+                        },
+                    },
+                },
+            },
+            scales: {
+                x: {
+                    grid: { display: false },
+                    ticks: {
+                        font: { family: INSIGHTS_FONT, size: 13 },
+                        color: INSIGHTS_MUTED,
+                        autoSkip: true,
+                        maxRotation: 0,
+                    },
+                },
+                y: {
+                    beginAtZero: true,
+                    grid: { color: INSIGHTS_GRID },
+                    ticks: {
+                        font: { family: INSIGHTS_FONT, size: 12 },
+                        color: INSIGHTS_MUTED,
+                        callback: function (val) { return "$" + val.toLocaleString(); },
+                    },
+                },
+            },
+        },
+    });
+}
+
+function drawMonthlyChart(section, data) {
+    const canvas = section.querySelector("#monthlyChart");
+    if (!canvas) return;
+    intendedWageredChart(canvas, "bar", data.monthly_labels, data.monthly_intended, data.monthly_wagered);
+}
+
+function drawTimelineChart(section, data) {
+    const canvas = section.querySelector("#timelineChart");
+    if (!canvas) return;
+    intendedWageredChart(canvas, "line", data.chart_labels, data.chart_intended, data.chart_wagered);
+}
+
+function makeDowChart(canvas, labels, data, color, yLabel, tooltipPrefix) {
+    if (!canvas) return;
+    new Chart(canvas, {
+        type: "bar",
+        data: {
+            labels: labels,
+            datasets: [{
+                label: yLabel,
+                data: data,
+                backgroundColor: labels.map(function () { return color; }),
+                borderRadius: 5,
+                borderWidth: 0,
+            }],
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: { display: false },
+                tooltip: {
+                    callbacks: {
+                        label: function (ctx) {
+                            return tooltipPrefix + ctx.parsed.y;
+                        },
+                    },
+                },
+            },
+            scales: {
+                x: {
+                    grid: { display: false },
+                    ticks: {
+                        font: { family: INSIGHTS_FONT, size: 12 },
+                        color: INSIGHTS_MUTED,
+                    },
+                },
+                y: {
+                    beginAtZero: true,
+                    grid: { color: INSIGHTS_GRID },
+                    ticks: {
+                        font: { family: INSIGHTS_FONT, size: 11 },
+                        color: INSIGHTS_MUTED,
+                        precision: 0,
+                    },
+                },
+            },
+        },
+    });
+}
+
+function drawDowCharts(section, data) {
+    makeDowChart(
+        section.querySelector("#dowGamblingChart"),
+        data.dow_labels,
+        data.dow_gambling_sessions,
+        "rgba(31, 138, 112, 0.85)",
+        "Gambling Sessions",
+        "Sessions: "
+    );
+    makeDowChart(
+        section.querySelector("#dowDrinkingChart"),
+        data.dow_labels,
+        data.dow_drinking_sessions,
+        "rgba(69, 123, 157, 0.85)",
+        "Drinking Days",
+        "Days: "
+    );
+}
+
+const INSIGHTS_CHARTS = {
+    expense: drawExpenseChart,
+    monthly: drawMonthlyChart,
+    timeline: drawTimelineChart,
+    dow: drawDowCharts,
+};
+
+async function loadInsightsSection(section) {
+    try {
+        const response = await fetch(section.dataset.url, {
+            credentials: "same-origin",
+            headers: { Accept: "application/json" },
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const payload = await response.json();
+        section.innerHTML = payload.html;
+        const draw = INSIGHTS_CHARTS[payload.section];
+        if (draw && typeof Chart !== "undefined") {
+            draw(section, payload.data);
+        }
+    } catch (error) {
+        section.innerHTML = '<article class="report-card" style="margin-bottom: 24px;">'
+            + '<p class="insights-no-data">This section could not be loaded. Refresh the page to try again.</p>'
+            + "</article>";
+    }
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    document.querySelectorAll("[data-insights-section]").forEach(loadInsightsSection);
+});
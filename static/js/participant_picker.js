@@ -0,0 +1,104 @@
+// Fills participant <select>s from the paginated participant directory API.
+// Markup: <select data-participants-url="..."> plus an optional
+// <input data-participant-search="<select id>"> for username prefix search.
+
+const PARTICIPANT_SEARCH_DELAY_MS = 250;
+
+function participantLabel(participant) {
+    const entries = `${participant.entry_count} entr${participant.entry_count === 1 ? "y" : "ies"}`;
+    const last = participant.last_logged ? `last ${participant.last_logged}` : "nothing logged";
+    return `${participant.username} (${entries}, ${last})`;
+}
+
+function setupParticipantPicker(select) {
+    const baseUrl = select.dataset.participantsUrl;
+    const search = document.querySelector(`[data-participant-search="${select.id}"]`);
+
+    // The placeholder and the server-rendered selection survive every reload of the list.
+    const placeholder = select.options[0];
+    const initial = select.selectedIndex > 0 ? select.options[select.selectedIndex] : null;
+
+    const moreOption = document.createElement("option");
+    moreOption.value = "";
+    moreOption.textContent = "Load more participants…";
+
+    let query = "";
+    let cursor = null;
+    let requestId = 0;
+    let lastValue = select.value;
+
+    async function loadPage(reset) {
+        const thisRequest = ++requestId;
+        const params = new URLSearchParams();
+        if (query) {
+            params.set("q", query);
+        }
+        if (!reset && cursor) {
+            params.set("cursor", cursor);
+        }
+
+        try {
+            const response = await fetch(`${baseUrl}?${params}`, { cache: "no-store" });
+            if (!response.ok) {
+                throw new Error(`participant directory failed: ${response.status}`);
+            }
+            const page = await response.json();
+            if (thisRequest !== requestId) {
+                return;
+            }
+
+            if (reset) {
+                select.replaceChildren(placeholder);
+                if (initial) {
+                    select.appendChild(initial);
+                }
+            }
+            moreOption.remove();
+
+            page.participants.forEach((participant) => {
+                if (initial && String(participant.id) === initial.value) {
+                    initial.textContent = participantLabel(participant);
+                    return;
+                }
+                const option = document.createElement("option");
+                option.value = participant.id;
+                option.textContent = participantLabel(participant);
+                select.appendChild(option);
+            });
+
+            cursor = page.next_cursor;
+            if (cursor) {
+                select.appendChild(moreOption);
+            }
+            select.value = lastValue;
+        } catch (err) {
+            console.error(err);
+        }
+    }
+
+    select.addEventListener("change", () => {
+        if (select.selectedOptions[0] === moreOption) {
+            select.value = lastValue;
+            loadPage(false);
+            return;
+        }
+        lastValue = select.value;
+    });
+
+    if (search) {
+        let timer = null;
+        search.addEventListener("input", () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => {
+                query = search.value.trim();
+                loadPage(true);
+            }, PARTICIPANT_SEARCH_DELAY_MS);
+        });
+    }
+
+    loadPage(true);
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    document.querySelectorAll("select[data-participants-url]").forEach(setupParticipantPicker);
+});
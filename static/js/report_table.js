@@ -0,0 +1,108 @@
+// Fills the report table one page at a time from the keyset-paginated rows API,
+// so the page paints immediately regardless of how large the study is.
+
+function formatReportCell(value) {
+    if (value === true) {
+        return "Yes";
+    }
+    if (value === false) {
+        return "No";
+    }
+    if (value === null || value === undefined || value === "") {
+        return "—";
+    }
+    return String(value);
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const table = document.getElementById("reportTable");
+    if (!table) {
+        return;
+    }
+
+    const headers = JSON.parse(table.dataset.headers);
+    const rowsUrl = table.dataset.rowsUrl;
+    const tbody = table.querySelector("tbody");
+    const status = document.getElementById("reportTableStatus");
+    const empty = document.getElementById("reportTableEmpty");
+    const more = document.getElementById("reportTableMore");
+    const loadMoreButton = document.getElementById("reportLoadMore");
+
+    let cursor = null;
+    let loaded = 0;
+    let totalLabel = "";
+    let loading = false;
+    let finished = false;
+
+    function appendRows(rows) {
+        const fragment = document.createDocumentFragment();
+        rows.forEach((row) => {
+            const tr = document.createElement("tr");
+            headers.forEach((header) => {
+                const td = document.createElement("td");
+                td.textContent = formatReportCell(row[header]);
+                tr.appendChild(td);
+            });
+            fragment.appendChild(tr);
+        });
+        tbody.appendChild(fragment);
+    }
+
+    function updateStatus() {
+        const shown = `${loaded} row${loaded === 1 ? "" : "s"}`;
+        status.textContent = finished
+            ? `${shown} matching the current filters.`
+            : `Showing ${shown} of ${totalLabel} matching the current filters.`;
+    }
+
+    async function loadPage() {
+        if (loading || finished) {
+            return;
+        }
+        loading = true;
+        loadMoreButton.disabled = true;
+
+        try {
+            const url = cursor ? `${rowsUrl}&cursor=${encodeURIComponent(cursor)}` : rowsUrl;
+            const response = await fetch(url, { cache: "no-store" });
+            if (!response.ok) {
+                throw new Error(`report rows failed: ${response.status}`);
+            }
+            const page = await response.json();
+
+            if (page.total_estimate !== undefined) {
+                totalLabel = page.total_is_estimate ? `about ${page.total_estimate}` : String(page.total_estimate);
+            }
+            appendRows(page.rows);
+            loaded += page.rows.length;
+            cursor = page.next_cursor;
+            finished = !cursor;
+
+            updateStatus();
+            empty.hidden = !(finished && loaded === 0);
+            table.hidden = finished && loaded === 0;
+            more.hidden = finished;
+        } catch (err) {
+            console.error(err);
+            status.textContent = "Unable to load report rows. Please try again.";
+            more.hidden = false;
+        } finally {
+            loading = false;
+            loadMoreButton.disabled = false;
+        }
+    }
+
+    loadMoreButton.addEventListener("click", loadPage);
+
+    // Keep loading as the admin scrolls near the end of the table.
+    if ("IntersectionObserver" in window) {
+        const observer = new IntersectionObserver((observed) => {
+            if (observed.some((item) => item.isIntersecting)) {
+                loadPage();
+            }
+        }, { rootMargin: "400px" });
+        observer.observe(more);
+    }
+
+    loadPage();
+});
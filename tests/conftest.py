@@ -2,7 +2,7 @@
 import pytest
 from flask import Flask
 
-from database.db_initialization import db
+from database.db_initialization import CalendarEntry, Drinking, Gambling, StudyCode, User, db
 
 '''
     To run all test cases use the following command:
@@ -32,3 +32,56 @@ def app_context(app):
     """Provide an active application context for tests."""
     with app.app_context():
         yield
+
+
+@pytest.fixture
+def make_study():
+    """make_study(code, researcher=None, questions=None): a committed study, with a new researcher if none is given."""
+    def make(code, researcher=None, questions=None):
+        if researcher is None:
+            researcher = User(username=f"r-{code}@test.com", password="x", is_admin=True)
+            db.session.add(researcher)
+            db.session.commit()
+        study = StudyCode(code=code, title=code, researcher_id=researcher.id, questions=questions or {})
+        db.session.add(study)
+        db.session.commit()
+        return study
+    return make
+
+
+@pytest.fixture
+def make_participant():
+    """make_participant(username="p@test.com", study_code=None): a committed participant."""
+    def make(username="p@test.com", study_code=None):
+        user = User(username=username, password="x", is_admin=False, study_group_code=study_code)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def log_day():
+    """log_day(user, day, gambling=None, drinking=None): a committed calendar entry with those answers."""
+    def log(user, day, gambling=None, drinking=None):
+        entry = CalendarEntry(user_id=user.id, entry_date=day)
+        db.session.add(entry)
+        db.session.flush()
+        if gambling is not None:
+            db.session.add(Gambling(user_id=user.id, entry_id=entry.id, gambling_questions=gambling))
+        if drinking is not None:
+            db.session.add(Drinking(user_id=user.id, entry_id=entry.id, drinking_questions=drinking))
+        db.session.commit()
+        return entry
+    return log
+
+
+@pytest.fixture
+def client_for(app):
+    """client_for(user): a test client whose session is logged in as user."""
+    def make(user):
+        client = app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session["user_id"] = user.id
+        return client
+    return make
@@ -0,0 +1,113 @@
+"""Tests for the per-day DailyActivity rollups kept current on write."""
+from datetime import date, datetime
+
+from database.activity_rollups import (
+    _refresh_listeners, backfill_daily_rollups, on_rollups_refreshed, refresh_daily_rollups,
+)
+from database.db_helper import delete_entries_for_day
+from database.db_initialization import CalendarEntry, CompletedUpgrade, DailyActivity, Gambling, db
+from database.db_upgrades import DAILY_ROLLUPS_BACKFILL, upgrade_schema
+
+
+def _rollups():
+    return {row.day: row for row in DailyActivity.query.order_by(DailyActivity.day)}
+
+
+def test_writes_keep_the_day_rollup_current(app_context, make_participant, log_day):
+    """Inserts, edits and moved entries refresh the affected days only."""
+    user = make_participant()
+    entry = log_day(user, datetime(2026, 4, 6), gambling={"money_intended": "10", "money_spent": "25"},
+                    drinking={"num_drinks": 2})
+    log_day(user, datetime(2026, 4, 6), gambling={"money_intended": "5", "money_spent": "5"})
+
+    day = _rollups()[date(2026, 4, 6)]
+    assert (day.gambling_sessions, day.money_spent, day.over_intent_sessions) == (2, 30.0, 1)
+    assert (day.drinking_sessions, day.num_drinks) == (1, 2.0)
+
+    Gambling.query.filter_by(entry_id=entry.id).one().gambling_questions = {"money_intended": "10", "money_spent": "1"}
+    db.session.commit()
+    assert _rollups()[date(2026, 4, 6)].money_spent == 6.0
+
+    entry.entry_date = datetime(2026, 4, 7)
+    db.session.commit()
+    rollups = _rollups()
+    assert rollups[date(2026, 4, 6)].money_spent == 5.0
+    assert (rollups[date(2026, 4, 7)].money_spent, rollups[date(2026, 4, 7)].num_drinks) == (1.0, 2.0)
+
+
+def test_set_based_day_delete_clears_the_rollup(app_context, make_participant, log_day):
+    """delete_entries_for_day bypasses the flush hooks, so it refreshes the day itself."""
+    user = make_participant()
+    log_day(user, datetime(2026, 4, 6), gambling={"money_spent": "25"})
+    log_day(user, datetime(2026, 4, 8), drinking={"num_drinks": 3})
+
+    delete_entries_for_day(user.id, datetime(2026, 4, 6))
+    db.session.commit()
+
+    assert list(_rollups()) == [date(2026, 4, 8)]
+
+
+def test_refreshing_an_existing_day_updates_it_in_place(app_context, make_participant, log_day):
+    """A (user, day) row already written, e.g. by a concurrent save, is upserted rather than re-inserted."""
+    user = make_participant()
+    entry = log_day(user, datetime(2026, 4, 6), gambling={"money_spent": "25"})
+    db.session.execute(Gambling.__table__.insert().values(
+        user_id=user.id, entry_id=entry.id, gambling_questions={}, money_spent=5.0,
+    ))
+
+    refresh_daily_rollups({(user.id, date(2026, 4, 6))})
+    refresh_daily_rollups({(user.id, date(2026, 4, 6))})
+    db.session.commit()
+
+    assert DailyActivity.query.count() == 1
+    day = _rollups()[date(2026, 4, 6)]
+    assert (day.gambling_sessions, day.money_spent) == (2, 30.0)
+
+
+def test_backfill_builds_missing_rollups(app_context, make_participant, log_day):
+    """Participants logged before the table existed get their rollups rebuilt once."""
+    user = make_participant()
+    log_day(user, datetime(2026, 4, 6), gambling={"money_spent": "25"})
+    DailyActivity.query.delete()
+    db.session.commit()
+
+    assert backfill_daily_rollups() == 1
+    assert _rollups()[date(2026, 4, 6)].money_spent == 25.0
+    assert backfill_daily_rollups() == 0
+
+
+def test_rollup_backfill_runs_once_across_startups(app_context, monkeypatch):
+    """Startup doesn't repeat the full-history aggregation the rollups exist to avoid."""
+    calls = []
+    monkeypatch.setattr("database.activity_rollups.backfill_daily_rollups", lambda: calls.append(1) or 0)
+
+    upgrade_schema()
+    upgrade_schema()
+    assert len(calls) == 1
+    assert db.session.get(CompletedUpgrade, DAILY_ROLLUPS_BACKFILL) is not None
+
+
+def test_listeners_hear_of_refreshes_only_once_committed(app_context, make_participant, log_day):
+    """A cache invalidated before commit could be refilled from the old rows, so listeners wait for it."""
+    user = make_participant()
+    heard = []
+    listener = on_rollups_refreshed(heard.append)
+    try:
+        entry = CalendarEntry(user_id=user.id, entry_date=datetime(2026, 4, 6))
+        db.session.add(entry)
+        db.session.flush()
+        db.session.add(Gambling(user_id=user.id, entry_id=entry.id, gambling_questions={"money_spent": "25"}))
+        db.session.flush()
+        assert heard == []
+        db.session.commit()
+        assert heard == [{user.id}]
+
+        log_day(user, datetime(2026, 4, 7), gambling={"money_spent": "5"})
+        heard.clear()
+        Gambling.query.filter_by(entry_id=entry.id).one().gambling_questions = {"money_spent": "50"}
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert heard == []
+    finally:
+        _refresh_listeners.remove(listener)
@@ -0,0 +1,68 @@
+"""Tests for the researcher calendar events endpoints (single participant and bulk)."""
+from datetime import datetime
+
+import pytest
+
+from database.db_initialization import User, db
+from routes.admin import admin_bp
+
+
+@pytest.fixture
+def overlay(app, make_study, make_participant, log_day, client_for):
+    """
+    (client logged in as the researcher, ids) for a three-participant study,
+    plus another researcher's participant; everyone logged May 1 and 15.
+    """
+    if 'admin' not in app.blueprints:
+        app.register_blueprint(admin_bp, url_prefix='/admin/api')
+    study, other = make_study("overlay1"), make_study("overlay2")
+    users = [make_participant(name, study.code) for name in ("a@test.com", "b@test.com", "c@test.com")]
+    outsider = make_participant("z@test.com", other.code)
+    for user in (*users, outsider):
+        for day in (1, 15):
+            log_day(user, datetime(2026, 5, day), drinking={"num_drinks": "2"})
+    ids = {"study": study.id, "users": [user.id for user in users], "outsider": outsider.id}
+    return client_for(db.session.get(User, study.researcher_id)), ids
+
+
+def test_study_pages_follow_the_directory_cursor(overlay):
+    client, ids = overlay
+    url = f'/admin/api/participant-calendar-events/bulk?study_id={ids["study"]}&limit=2'
+
+    first = client.get(url).get_json()
+    assert [row["username"] for row in first["participants"]] == ["a@test.com", "b@test.com"]
+    assert first["next_cursor"] == f'{ids["users"][1]}:b@test.com'
+    assert [len(row["events"]) for row in first["participants"]] == [2, 2]
+
+    second = client.get(f'{url}&cursor={first["next_cursor"]}').get_json()
+    assert [row["username"] for row in second["participants"]] == ["c@test.com"]
+    assert second["next_cursor"] is None
+
+    assert client.get(f'{url}&cursor=nope').status_code == 400
+
+
+def test_user_ids_drop_outsiders_and_dates_filter_events(overlay):
+    client, ids = overlay
+    user_ids = ",".join(str(user_id) for user_id in (ids["users"][0], ids["outsider"]))
+
+    response = client.get(f'/admin/api/participant-calendar-events/bulk?user_ids={user_ids}'
+                          '&start_date=2026-05-10&end_date=2026-05-31').get_json()
+    assert [row["user_id"] for row in response["participants"]] == [ids["users"][0]]
+    assert [event["date"] for event in response["participants"][0]["events"]] == ["2026-05-15"]
+
+    only_outsider = client.get(f'/admin/api/participant-calendar-events/bulk?user_ids={ids["outsider"]}')
+    assert only_outsider.get_json() == {"participants": [], "next_cursor": None}
+    assert client.get('/admin/api/participant-calendar-events/bulk?user_ids=1,x').status_code == 400
+    assert client.get('/admin/api/participant-calendar-events/bulk?user_ids=1&start_date=May').status_code == 400
+
+
+def test_single_participant_route_matches_the_bulk_payload(overlay):
+    client, ids = overlay
+    user_id = ids["users"][0]
+
+    single = client.get(f'/admin/api/participant-calendar-events?user_id={user_id}').get_json()
+    bulk = client.get(f'/admin/api/participant-calendar-events/bulk?user_ids={user_id}').get_json()
+    assert single == bulk["participants"][0]["events"]
+    assert [event["date"] for event in single] == ["2026-05-01", "2026-05-15"]
+
+    assert client.get(f'/admin/api/participant-calendar-events?user_id={ids["outsider"]}').status_code == 404
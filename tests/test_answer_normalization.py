@@ -0,0 +1,103 @@
+"""Tests for typed answer columns extracted from the JSON question blobs."""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from database.answer_normalization import backfill_typed_answers
+from database.db_helper import get_gambling_aggregates
+from database.db_initialization import CompletedUpgrade, Drinking, Gambling, db
+from database.db_upgrades import TYPED_ANSWERS_BACKFILL, upgrade_schema
+
+
+CUSTOM_SCHEMA = {
+    "drinking": [{"id": "beers", "label": "Beers", "type": "number"}],
+    "gambling": [
+        {"id": "game", "label": "Game", "type": "select", "options": ["Slots"]},
+        {"id": "hours", "label": "Hours", "type": "number"},
+        {"id": "budget", "label": "Budget", "type": "number"},
+        {"id": "wager", "label": "Wager", "type": "number"},
+        {"id": "net", "label": "Net", "type": "number"},
+    ],
+}
+
+
+def test_typed_columns_follow_study_field_map(app_context, make_study, make_participant, log_day):
+    """Custom study question ids are mapped to the canonical typed columns on write."""
+    make_study("custom01", questions=CUSTOM_SCHEMA)
+    user = make_participant(study_code="custom01")
+    log_day(user, datetime(2026, 4, 1), drinking={"beers": "3"},
+            gambling={"game": "Slots", "hours": "1.5", "budget": "20", "wager": "45.25", "net": "-10"})
+
+    gambling = Gambling.query.one()
+    assert (gambling.time_spent, gambling.money_intended, gambling.money_spent, gambling.money_earned) == (
+        1.5, 20.0, 45.25, -10.0,
+    )
+    assert gambling.drinks_while_gambling is None
+    assert Drinking.query.one().num_drinks == 3.0
+
+
+def test_edits_and_bad_values_are_normalized(app_context, make_participant, log_day):
+    """Editing the JSON refreshes the typed values; non-numeric answers become NULL."""
+    user = make_participant()
+    log_day(user, datetime(2026, 4, 1), gambling={"money_spent": "abc"})
+    gambling = Gambling.query.one()
+    assert gambling.money_spent is None
+
+    gambling.gambling_questions = {"money_spent": "12"}
+    db.session.commit()
+    assert Gambling.query.one().money_spent == 12.0
+
+
+def test_aggregates_sum_typed_columns(app_context, make_participant, log_day):
+    """get_gambling_aggregates should total the typed columns in SQL."""
+    user = make_participant()
+    log_day(user, datetime(2026, 4, 4), drinking={"num_drinks": "2"},
+            gambling={"money_intended": "10", "money_spent": "15", "time_spent": "2"})
+    log_day(user, datetime(2026, 4, 5), gambling={"money_intended": "5", "money_spent": "not a number"})
+
+    aggregates = get_gambling_aggregates(user_ids=[user.id])
+
+    assert aggregates["user_count"] == 1
+    assert aggregates["total_intended"] == 15.0
+    assert aggregates["total_spent"] == 15.0
+    assert aggregates["total_hours"] == 2.0
+    assert aggregates["total_drinks"] == 2.0
+    assert aggregates["by_day"]["Saturday"] == 15.0
+
+
+def test_upgrade_adds_columns_and_backfills_legacy_rows(app_context):
+    """Tables created before the typed columns existed are altered and backfilled."""
+    db.drop_all()
+    with db.engine.begin() as connection:
+        connection.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, password VARCHAR, is_admin BOOLEAN, '
+                                'username VARCHAR, onboarding_complete BOOLEAN, study_group_code VARCHAR(50))'))
+        connection.execute(text('CREATE TABLE calendar_entry (id INTEGER PRIMARY KEY, user_id INTEGER, '
+                                'entry_date DATETIME, entry_type VARCHAR(50))'))
+        connection.execute(text('CREATE TABLE gambling (id INTEGER PRIMARY KEY, entry_id INTEGER, user_id INTEGER, '
+                                'gambling_questions JSON)'))
+        connection.execute(text('CREATE TABLE drinking (id INTEGER PRIMARY KEY, entry_id INTEGER, user_id INTEGER, '
+                                'drinking_questions JSON)'))
+        connection.execute(text("INSERT INTO \"user\" (id, username, is_admin) VALUES (1, 'legacy', 0)"))
+        connection.execute(text("INSERT INTO calendar_entry (id, user_id, entry_date) VALUES (1, 1, '2026-01-01')"))
+        connection.execute(text("INSERT INTO gambling VALUES (1, 1, 1, '{\"money_spent\": \"40\"}')"))
+        connection.execute(text("INSERT INTO drinking VALUES (1, 1, 1, '{\"num_drinks\": 4}')"))
+    db.create_all()
+
+    upgrade_schema()
+
+    columns = {c["name"] for c in inspect(db.engine).get_columns("gambling")}
+    assert {"money_spent", "money_intended", "time_spent"} <= columns
+    assert Gambling.query.one().money_spent == 40.0
+    assert Drinking.query.one().num_drinks == 4.0
+    assert backfill_typed_answers() == 0
+
+
+def test_typed_answer_backfill_runs_once_across_startups(app_context, monkeypatch):
+    """Rows whose answers parse to all-NULL typed columns are not rescanned on every start."""
+    calls = []
+    monkeypatch.setattr("database.answer_normalization.backfill_typed_answers", lambda: calls.append(1) or 0)
+
+    upgrade_schema()
+    upgrade_schema()
+    assert len(calls) == 1
+    assert db.session.get(CompletedUpgrade, TYPED_ANSWERS_BACKFILL) is not None
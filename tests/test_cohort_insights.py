@@ -0,0 +1,94 @@
+"""Tests for study-wide cohort insights (per-participant summaries and quartiles)."""
+from datetime import date, datetime
+
+from database import cohort_insights
+from database.cohort_insights import (
+    clear_distribution_cache,
+    cohort_distribution,
+    compute_cohort_insights,
+    distribution,
+    participant_percentiles,
+)
+from database.insights_engine import resolve_insights_window
+from routes.admin import _cohort_rank_section
+from routes.insights import InsightsInputs
+
+
+def test_distribution_quartiles_skip_missing_values():
+    assert distribution([4, None, 1, 3, 2]) == {"n": 4, "min": 1, "q1": 1.75, "median": 2.5, "q3": 3.25, "max": 4}
+    assert distribution([5])["median"] == 5
+    assert distribution([None])["n"] == 0
+
+
+def test_cohort_summarises_every_participant_of_the_study(app_context, make_study, make_participant, log_day):
+    """Each enrolled participant gets a summary row (zeros when idle); other studies are excluded."""
+    study = make_study("cohort01")
+    other = make_study("cohort02")
+
+    alice = make_participant("alice@test.com", study.code)
+    bob = make_participant("bob@test.com", study.code)
+    make_participant("carol@test.com", study.code)
+    outsider = make_participant("dave@test.com", other.code)
+
+    log_day(alice, datetime(2026, 5, 1), gambling={"money_intended": "10", "money_spent": "30", "money_earned": "-20"})
+    log_day(alice, datetime(2026, 5, 2), gambling={"money_intended": "10", "money_spent": "40", "money_earned": "-5"},
+            drinking={"num_drinks": "4"})
+    log_day(bob, datetime(2026, 5, 3), gambling={"money_intended": "50", "money_spent": "20", "money_earned": "10"})
+    log_day(outsider, datetime(2026, 5, 3), gambling={"money_spent": "999"})
+
+    window = resolve_insights_window(None, "all", today=date(2026, 5, 10), study_ids=[study.id])
+    assert window.start == date(2026, 5, 1)
+
+    cohort = compute_cohort_insights([study.id], window)
+    rows = {row["username"]: row for row in cohort["participants"]}
+
+    assert list(rows) == ["alice@test.com", "bob@test.com", "carol@test.com"]
+    assert (rows["alice@test.com"]["total_wagered"], rows["alice@test.com"]["total_losses"]) == (70.0, 25.0)
+    assert rows["alice@test.com"]["over_intent_rate"] == 100.0
+    assert rows["alice@test.com"]["longest_loss_streak"] == 2
+    assert rows["alice@test.com"]["drinks_per_drinking_day"] == 4.0
+    assert rows["bob@test.com"]["total_losses"] == 0.0
+    assert rows["carol@test.com"]["total_sessions"] == 0
+    assert rows["carol@test.com"]["over_intent_rate"] is None
+
+    wagered = cohort["distributions"]["total_wagered"]
+    assert (wagered["n"], wagered["min"], wagered["median"], wagered["max"]) == (3, 0.0, 20.0, 70.0)
+    assert cohort["distributions"]["over_intent_rate"]["n"] == 2
+
+
+def test_percentile_ranks_follow_writes_incrementally(app_context, make_study, make_participant, log_day):
+    """Ranks come from the cached sorted columns, patched for just the participants who logged since."""
+    study = make_study("ranks001")
+    users = [make_participant(f"u{index}@test.com", study.code) for index in range(4)]
+    for index, user in enumerate(users):
+        log_day(user, datetime(2026, 5, 1), gambling={"money_spent": str(10 * (index + 1))})
+
+    clear_distribution_cache()
+    window = resolve_insights_window(None, "30d", today=date(2026, 5, 10), study_ids=[study.id])
+    ranks = participant_percentiles(users[0].id, study.id, window)
+    assert (ranks["total_wagered"]["percentile"], ranks["total_wagered"]["median"]) == (12.5, 25.0)
+
+    log_day(users[0], datetime(2026, 5, 2), gambling={"money_spent": "100"})
+    cached = cohort_distribution(study.id, window)
+    assert cached.columns["total_wagered"] == [20.0, 30.0, 40.0, 110.0]
+    assert cohort_insights._changed_users == {}
+    assert participant_percentiles(users[0].id, study.id, window)["total_wagered"]["percentile"] == 87.5
+
+    newcomer = make_participant("u9@test.com", study.code)
+    assert participant_percentiles(newcomer.id, study.id, window)["total_wagered"]["percentile"] == 10.0
+    clear_distribution_cache()
+
+
+def test_cohort_rank_uses_the_study_window(app, make_study, make_participant, log_day):
+    """"all" spans the study, not the ranked participant's own history, since every participant shares the cache."""
+    study = make_study("ranks002")
+    early, late = make_participant("early@test.com", study.code), make_participant("late@test.com", study.code)
+    log_day(early, datetime(2026, 5, 1), gambling={"money_spent": "80"})
+    log_day(late, datetime(2026, 5, 20), gambling={"money_spent": "20"})
+    clear_distribution_cache()
+
+    with app.test_request_context("/?window=all"):
+        own_window = resolve_insights_window(late.id, "all")
+        ranks = _cohort_rank_section(InsightsInputs(late.id, own_window))["ranks"]
+    assert (ranks["total_wagered"]["n"], ranks["total_wagered"]["median"]) == (2, 50.0)
+    clear_distribution_cache()
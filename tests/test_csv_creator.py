@@ -2,7 +2,9 @@
 import csv
 from datetime import datetime
 
-from csv_formatting.csv_creator import build_report_dataset, generate_all_users_csv
+from sqlalchemy import event
+
+from csv_formatting.csv_creator import build_report_dataset, build_report_page, generate_all_users_csv
 from database.db_initialization import CalendarEntry, Drinking, Gambling, User, db
 
 
@@ -85,3 +87,66 @@ def test_all_users_csv_uses_custom_study_schema(app_context, tmp_path):
     assert rows[0]["beer_count"] == "3"
     assert rows[0]["casino_game"] == "Slots"
     assert rows[0]["cash_wagered"] == "50"
+
+
+def test_report_dataset_filters_by_select_answer(app_context):
+    """answer_filters should keep only days whose stored answer matches."""
+    user = _create_custom_activity_user()
+    other_entry = CalendarEntry(user_id=user.id, entry_date=datetime(2026, 4, 16))
+    db.session.add(other_entry)
+    db.session.commit()
+    db.session.add(Gambling(
+        user_id=user.id,
+        entry_id=other_entry.id,
+        gambling_questions={"casino_game": "Poker", "cash_wagered": "10"},
+    ))
+    db.session.commit()
+
+    _, rows = build_report_dataset(
+        user_ids=[user.id], schema=CUSTOM_SCHEMA, answer_filters={"casino_game": "Poker"},
+    )
+
+    assert [row["date"] for row in rows] == ["2026-04-16"]
+    assert rows[0]["cash_wagered"] == "10"
+
+
+def test_report_page_walks_every_day_once(app_context, log_day):
+    """Keyset pages cover all (user, day) rows in order, merging same-day entries."""
+    user = _create_custom_activity_user()
+    for day in (15, 16, 17):
+        log_day(user, datetime(2026, 4, day, 12))
+
+    page = build_report_page(limit=2, schema=CUSTOM_SCHEMA)
+    assert page["total_estimate"] == 3
+    assert [row["date"] for row in page["rows"]] == ["2026-04-15", "2026-04-16"]
+    assert page["rows"][0]["beer_count"] == "3"
+
+    page = build_report_page(cursor=page["next_cursor"], limit=2, schema=CUSTOM_SCHEMA)
+    assert [row["date"] for row in page["rows"]] == ["2026-04-17"]
+    assert page["next_cursor"] is None
+
+
+def test_study_dataset_reads_every_participant_in_one_entry_query(app_context, make_study, make_participant, log_day):
+    """Study mode costs the same handful of queries however many participants there are."""
+    study = make_study("report01")
+    users = [make_participant(f"{name}@test.com", study.code) for name in ("b", "a", "c")]
+    for user in users:
+        for day in (2, 1):
+            log_day(user, datetime(2026, 4, day), drinking={"num_drinks": "2"})
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        _, rows = build_report_dataset(study_ids=[study.id], schema=CUSTOM_SCHEMA)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    by_id = {user.id: user.username for user in users}
+    assert [(by_id[row["user_id"]], row["date"]) for row in rows] == [
+        (name, f"2026-04-0{day}") for name in ("a@test.com", "b@test.com", "c@test.com") for day in (1, 2)
+    ]
+    assert sum("FROM calendar_entry" in statement.split("WHERE")[0] for statement in statements) == 1
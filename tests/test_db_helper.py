@@ -9,9 +9,12 @@ from database.db_helper import (
     commit_to_db,
     create_calendar_entry,
     create_user,
+    delete_entries_for_day,
     get_calendar_entries_for_user,
+    get_participant_directory,
+    unit_of_work,
 )
-from database.db_initialization import CalendarEntry, User, db
+from database.db_initialization import CalendarEntry, DailyActivity, Drinking, Gambling, User, db
 
 
 class TestCreateUser:
@@ -229,3 +232,152 @@ class TestCommitToDb:
             )
             result = commit_to_db(user2)
             assert result is None
+
+
+class TestUnitOfWork:
+    """Tests for the unit_of_work batching context manager."""
+
+    def test_helpers_commit_once_at_block_exit(self, app_context, app):
+        """Helpers inside a unit of work get ids but are committed together."""
+        with app.app_context():
+            commits = []
+            original_commit = db.session.commit
+            db.session.commit = lambda: (commits.append(1), original_commit())
+            try:
+                with unit_of_work():
+                    user = create_user(username="uow@test.com", password="x")
+                    entry = create_calendar_entry(user.id, datetime(2025, 3, 1))
+                    add_gambling_entry(user.id, entry, {"money_spent": "5"})
+                    add_alcohol_entry(user.id, entry, {"num_drinks": "2"})
+                    assert entry.id is not None
+            finally:
+                db.session.commit = original_commit
+
+            assert len(commits) == 1
+            assert Gambling.query.filter_by(entry_id=entry.id).count() == 1
+
+    def test_exception_rolls_back_everything(self, app_context, app):
+        """An error anywhere in the block discards every staged write."""
+        with app.app_context():
+            with pytest.raises(RuntimeError):
+                with unit_of_work():
+                    create_user(username="rollback@test.com", password="x")
+                    raise RuntimeError("boom")
+
+            assert User.query.filter_by(username="rollback@test.com").first() is None
+
+    def test_bulk_insert_and_nested_blocks(self, app_context, app):
+        """Bulk rows are inserted on exit and nested blocks join the outer one."""
+        with app.app_context():
+            user = create_user(username="bulk@test.com", password="x")
+            with unit_of_work() as outer:
+                with unit_of_work() as inner:
+                    assert inner is outer
+                    inner.bulk_insert(CalendarEntry, [
+                        {"user_id": user.id, "entry_date": datetime(2025, 4, day)}
+                        for day in range(1, 11)
+                    ])
+
+            assert len(get_calendar_entries_for_user(user.id)) == 10
+
+    def test_bulk_rows_get_the_columns_flush_hooks_derive(self, app_context, app, make_study):
+        """Bulk rows skip the ORM hooks, so study ids, typed answers and rollups are filled on flush."""
+        with app.app_context():
+            study = make_study("bulk0001")
+            user = create_user(username="bulk-p@test.com", password="x", study_group_code=study.code)
+            entry = create_calendar_entry(user.id, datetime(2025, 4, 2))
+            with unit_of_work() as uow:
+                uow.bulk_insert(CalendarEntry, [{"user_id": user.id, "entry_date": datetime(2025, 4, 3)}])
+                uow.bulk_insert(Gambling, [
+                    {"user_id": user.id, "entry_id": entry.id, "gambling_questions": {"money_spent": "50"}},
+                ])
+
+            gambling = Gambling.query.filter_by(entry_id=entry.id).one()
+            assert (gambling.money_spent, gambling.study_id) == (50.0, study.id)
+            assert {row.study_id for row in CalendarEntry.query.filter_by(user_id=user.id)} == {study.id}
+            assert DailyActivity.query.filter_by(user_id=user.id).one().money_spent == 50.0
+
+
+class TestDeleteEntriesForDay:
+    """Tests for the set-based same-day delete helper."""
+
+    def _day_with_duplicates(self, user):
+        entries = [create_calendar_entry(user.id, datetime(2025, 5, 2, hour)) for hour in (0, 8, 20)]
+        for entry in entries:
+            add_gambling_entry(user.id, entry, {"money_spent": "1"})
+            add_alcohol_entry(user.id, entry, {"num_drinks": "1"})
+        create_calendar_entry(user.id, datetime(2025, 5, 3))
+        return entries
+
+    def test_removes_day_and_children_only(self, app_context, app):
+        """All entries of the day and their answers go; other days stay."""
+        with app.app_context():
+            user = create_user(username="del@test.com", password="x")
+            self._day_with_duplicates(user)
+
+            delete_entries_for_day(user.id, datetime(2025, 5, 2))
+            db.session.commit()
+
+            remaining = get_calendar_entries_for_user(user.id)
+            assert [e.entry_date.day for e in remaining] == [3]
+            assert Gambling.query.count() == 0
+            assert Drinking.query.count() == 0
+
+    def test_keep_entry_id_survives(self, app_context, app):
+        """keep_entry_id leaves one entry of the day and its answers intact."""
+        with app.app_context():
+            user = create_user(username="keep@test.com", password="x")
+            entries = self._day_with_duplicates(user)
+            keep_id = entries[-1].id
+
+            delete_entries_for_day(user.id, datetime(2025, 5, 2), keep_entry_id=keep_id)
+            db.session.commit()
+
+            day_ids = [e.id for e in get_calendar_entries_for_user(user.id) if e.entry_date.day == 2]
+            assert day_ids == [keep_id]
+            assert [g.entry_id for g in Gambling.query.all()] == [keep_id]
+            assert [d.entry_id for d in Drinking.query.all()] == [keep_id]
+
+
+class TestGetParticipantDirectory:
+    """Tests for the paged participant directory."""
+
+    def _enroll(self, *usernames):
+        users = [create_user(username=name, password="x", study_group_code="dir00001") for name in usernames]
+        create_user(username="other@test.com", password="x", study_group_code="other001")
+        return users
+
+    def test_summary_columns(self, app_context, app):
+        """Each participant carries their entry count and last logged date."""
+        alice, bob = self._enroll("alice@test.com", "bob@test.com")
+        create_calendar_entry(alice.id, datetime(2026, 3, 1))
+        create_calendar_entry(alice.id, datetime(2026, 3, 4))
+
+        participants, has_more = get_participant_directory("dir00001")
+
+        assert not has_more
+        assert [(p["username"], p["entry_count"], p["last_logged"]) for p in participants] == [
+            ("alice@test.com", 2, "2026-03-04"),
+            ("bob@test.com", 0, None),
+        ]
+
+    def test_prefix_search_and_keyset_pages(self, app_context, app):
+        """Prefix search is case-insensitive and pages resume after the cursor."""
+        self._enroll("ann@test.com", "anna@test.com", "annie@test.com", "ben@test.com")
+
+        first, has_more = get_participant_directory("dir00001", prefix="AN", limit=2)
+        assert [p["username"] for p in first] == ["ann@test.com", "anna@test.com"]
+        assert has_more
+
+        last = first[-1]
+        rest, has_more = get_participant_directory("dir00001", prefix="an", after=(last["username"], last["id"]), limit=2)
+        assert [p["username"] for p in rest] == ["annie@test.com"]
+        assert not has_more
+
+
+    def test_prefix_matches_characters_beyond_the_bmp(self, app_context, app):
+        """The range bound follows the prefix's last code point, so astral characters still match."""
+        self._enroll("an\U0001F600@test.com", "ao@test.com")
+
+        participants, _ = get_participant_directory("dir00001", prefix="an")
+        assert [p["username"] for p in participants] == ["an\U0001F600@test.com"]
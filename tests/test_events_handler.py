@@ -0,0 +1,119 @@
+"""Tests for the calendar write endpoints returning the affected day's event."""
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.db_initialization import Drinking, IdempotencyKey, db
+from routes.events_handler import calendar_schemas, events_handler_bp, month_calendar_events
+from routes.idempotency import store
+
+
+@pytest.fixture
+def writer(make_participant):
+    """A participant without a study."""
+    return make_participant("writer@test.com")
+
+
+@pytest.fixture
+def client(app, writer, client_for):
+    if 'events_handler' not in app.blueprints:
+        app.register_blueprint(events_handler_bp, url_prefix='/api')
+    return client_for(writer)
+
+
+def test_writes_return_the_canonical_day_event(client):
+    logged = client.post('/api/log-activity', json={
+        "date": "2026-05-04", "drinking_logged": True, "num_drinks": "3",
+    }).get_json()["event"]
+    listed = client.get('/api/calendar-events').get_json()
+    assert listed == [logged]
+    assert (logged["date"], logged["has_drinking"], logged["num_drinks"]) == ("2026-05-04", True, "3")
+
+    updated = client.put(f'/api/activity/{logged["id"]}', json={"no_activity": True}).get_json()["event"]
+    assert updated["has_no_activity"] is True
+    assert client.get('/api/calendar-events').get_json() == [updated]
+
+    deleted = client.delete(f'/api/activity/{logged["id"]}').get_json()["event"]
+    assert deleted == {"date": "2026-05-04", "deleted": True}
+    assert client.get('/api/calendar-events').get_json() == []
+
+
+def test_committed_write_succeeds_when_the_event_cannot_be_built(client, monkeypatch):
+    logged = client.post('/api/log-activity', json={"date": "2026-05-04", "no_activity": True}).get_json()["event"]
+
+    def broken_day_event(user_id, day_str):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("routes.events_handler.day_event", broken_day_event)
+    response = client.put(f'/api/activity/{logged["id"]}', json={"drinking_logged": True, "num_drinks": "2"})
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "success" and "event" not in response.get_json()
+    assert client.post('/api/log-activity', json={"date": "2026-05-09", "no_activity": True}).status_code == 200
+    monkeypatch.undo()
+    assert [event["date"] for event in client.get('/api/calendar-events').get_json()] == ["2026-05-04", "2026-05-09"]
+
+
+def test_month_events_match_the_full_list(client, writer):
+    for day in ("2026-04-30", "2026-05-01", "2026-05-31", "2026-06-01"):
+        client.post('/api/log-activity', json={"date": day, "no_activity": True})
+
+    may = month_calendar_events(writer.id, 2026, 5, *calendar_schemas(None))
+    december = month_calendar_events(writer.id, 2026, 12, *calendar_schemas(None))
+
+    listed = client.get('/api/calendar-events').get_json()
+    assert may == [event for event in listed if event["date"].startswith("2026-05")]
+    assert [event["date"] for event in may] == ["2026-05-01", "2026-05-31"]
+    assert december == []
+
+
+def test_retried_write_with_same_idempotency_key_is_replayed(client):
+    store.clear()
+    payload = {"date": "2026-05-04", "drinking_logged": True, "num_drinks": "3"}
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post('/api/log-activity', json=payload, headers=headers)
+    # An edit lands between the attempts; running the POST again would undo it.
+    entry_id = first.get_json()["event"]["id"]
+    client.put(f'/api/activity/{entry_id}', json={"drinking_logged": True, "num_drinks": "7"})
+    retry = client.post('/api/log-activity', json=payload, headers=headers)
+    assert retry.status_code == first.status_code
+    assert retry.get_json() == first.get_json()
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert Drinking.query.one().drinking_questions["num_drinks"] == "7"
+
+    reused = client.post('/api/log-activity', json=dict(payload, num_drinks="5"), headers=headers)
+    assert reused.status_code == 422
+
+    fresh = client.post('/api/log-activity', json=dict(payload, date="2026-05-05"),
+                        headers={"Idempotency-Key": "retry-2"})
+    assert fresh.status_code == 200 and "Idempotent-Replayed" not in fresh.headers
+    store.clear()
+
+
+def test_idempotency_keys_are_shared_through_the_database(client, writer):
+    """A key reserved by another worker is honoured; once it expires the write runs again."""
+    store.clear()
+    body = '{"date": "2026-05-04", "no_activity": true}'
+    fingerprint = hashlib.sha256(f"POST /api/log-activity\n{body}".encode()).hexdigest()
+    # Another worker is still running the first attempt of this key.
+    db.session.add(IdempotencyKey(
+        user_id=writer.id, key="elsewhere", fingerprint=fingerprint, expires_at=datetime.utcnow() + timedelta(hours=1),
+    ))
+    db.session.commit()
+
+    def send():
+        return client.post('/api/log-activity', data=body, content_type="application/json",
+                           headers={"Idempotency-Key": "elsewhere"})
+
+    def stored():
+        return db.session.get(IdempotencyKey, (writer.id, "elsewhere"), populate_existing=True)
+
+    assert send().status_code == 409
+    stored().expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    first = send()
+    assert first.status_code == 200 and "Idempotent-Replayed" not in first.headers
+    assert stored().status == 200
+    assert send().headers.get("Idempotent-Replayed") == "true"
+    store.clear()
@@ -0,0 +1,40 @@
+"""Tests for derived gambling indicators (overspend ratio, loss streaks, chasing)."""
+from datetime import datetime
+
+from database.gambling_metrics import compute_gambling_metrics, pool_gambling_metrics
+
+
+def _answers(intended, wagered, net, drinks_while=None):
+    return {
+        "money_intended": intended, "money_spent": wagered, "money_earned": net,
+        "drinks_while_gambling": drinks_while,
+    }
+
+
+def test_indicators_follow_the_ordered_history(app_context, make_participant, log_day):
+    """Ratios are bucketed, losing runs measured and chasing counted after losing days."""
+    user = make_participant("g@test.com")
+    for day, answers in (
+        (1, _answers("10", "20", "-5", drinks_while="0")),  # 2x intent, loss
+        (2, _answers("10", "30", "-10")),                   # 3x, loss, bet more after a loss
+        (3, _answers("10", "12", "-1", drinks_while="2")),  # 1.2x, loss
+        (4, _answers("0", "5", "4")),                       # no intent given, win
+        (5, _answers("10", "8", "-2")),                     # within intent, loss
+    ):
+        log_day(user, datetime(2026, 5, day), gambling=answers)
+    log_day(user, datetime(2026, 5, 5, 20), drinking={"num_drinks": "2"})
+
+    metrics = compute_gambling_metrics(user_ids=[user.id])[user.id]
+
+    assert metrics["ratio_distribution"] == {
+        "within_intent": 1, "up_to_1_5x": 1, "up_to_2x": 1, "over_2x": 1, "no_intent": 1,
+    }
+    assert metrics["max_wager_intent_ratio"] == 3.0
+    assert metrics["loss_days"] == 4
+    assert metrics["longest_loss_streak"] == 3
+    assert (metrics["chasing_days"], metrics["chasing_opportunities"]) == (1, 3)
+    assert metrics["drinking_gambling_days"] == 2
+
+    pooled = pool_gambling_metrics({user.id: metrics})
+    assert pooled["participants_chasing"] == 1
+    assert pooled["gambling_days"] == 5
@@ -0,0 +1,115 @@
+"""Tests for the columnar helpers behind the participant insights page."""
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from flask import render_template
+from jinja2 import FileSystemLoader
+
+from database.db_initialization import User, db
+from database.insights_engine import (
+    GamblingColumns,
+    chart_series,
+    load_daily_columns,
+    monthly_breakdown,
+    range_sum,
+    resolve_insights_window,
+    weekday_sums,
+)
+from routes.insights import INSIGHTS_SECTIONS, InsightsInputs, compute_insights, insights_bp, summary_section
+
+
+def test_rollup_columns_group_by_month_and_weekday(app_context, make_participant, log_day):
+    """Monthly and weekday groups come from slices of the date-ordered day columns."""
+    user = make_participant()
+    log_day(user, datetime(2026, 5, 4), gambling={"money_intended": "10", "money_spent": "25"})
+    log_day(user, datetime(2026, 4, 6), gambling={"money_intended": "20", "money_spent": "5"},
+            drinking={"num_drinks": 3})
+    log_day(user, datetime(2026, 4, 6), gambling={"money_spent": "7"})
+    log_day(user, datetime(2026, 1, 1), gambling={"money_spent": "99"})
+
+    gambling, drinking = load_daily_columns(user.id, date(2026, 3, 1), date(2026, 5, 31))
+
+    assert gambling.dates == [date(2026, 4, 6), date(2026, 5, 4)]
+    assert (gambling.sessions, gambling.wagered, gambling.over_intent) == ([2, 1], [12.0, 25.0], [1, 1])
+    assert drinking.drinks == [3.0]
+    assert gambling.between(date(2026, 5, 1), date(2026, 5, 31)).wagered == [25.0]
+
+    assert [(m["label"], m["sessions"], m["wagered"], m["over_intent"]) for m in monthly_breakdown(gambling)] == [
+        ("April 2026", 2, 12.0, 1),
+        ("May 2026", 1, 25.0, 1),
+    ]
+    assert range_sum(gambling.dates, gambling.wagered, date(2026, 4, 1), date(2026, 5, 1)) == 12.0
+
+    sessions, wagered = weekday_sums(gambling.dates, gambling.sessions, gambling.wagered)
+    assert sessions == [3, 0, 0, 0, 0, 0, 0]
+    assert wagered == [37.0, 0, 0, 0, 0, 0, 0]
+
+
+def test_insights_window_scales_projections(app_context, make_participant, log_day):
+    """Any window is served from the rollups and projections annualise its own length."""
+    user = make_participant()
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    log_day(user, today, gambling={"money_spent": "10", "money_earned": "-10"})
+    log_day(user, today - timedelta(days=200), gambling={"money_spent": "50", "money_earned": "-50"})
+
+    month = compute_insights(user.id, resolve_insights_window(user.id, "30d"))
+    assert (month["total_sessions"], month["total_losses"]) == (1, 10.0)
+    assert month["projected_1yr"] == round(10.0 * 365 / 30)
+
+    whole = compute_insights(user.id, resolve_insights_window(user.id, "all"))
+    assert whole["window"].days == 201
+    assert (whole["total_sessions"], whole["total_losses"]) == (2, 60.0)
+
+    custom = resolve_insights_window(user.id, start_date="2026-01-01", end_date="2026-01-31")
+    assert custom.days == 31
+
+
+def test_chart_series_fits_the_point_budget_and_keeps_peaks():
+    """Short series stay daily; longer ones become weekly totals, then LTTB samples."""
+    start = date(2026, 1, 5)
+    rows = [(start + timedelta(days=offset), 1, 10.0, 5.0, 0.0, 0.0, 0) for offset in range(70)]
+    rows[40] = (rows[40][0], 1, 10.0, 500.0, 0.0, 0.0, 1)
+    columns = GamblingColumns(rows)
+
+    assert chart_series(columns, 100)["granularity"] == "day"
+
+    weekly = chart_series(columns, 20)
+    assert weekly["granularity"] == "week"
+    assert weekly["labels"][0] == "Week of Jan 5"
+    assert len(weekly["wagered"]) == 10 and sum(weekly["wagered"]) == sum(row[3] for row in rows)
+
+    sampled = chart_series(columns, 6)
+    assert sampled["granularity"] == "sample"
+    assert len(sampled["wagered"]) == 6
+    assert 500.0 in sampled["wagered"]
+
+
+def test_sections_are_served_as_json_with_their_card(app, make_participant, log_day, client_for):
+    """Each section endpoint returns its data and the card rendered for it."""
+    app.jinja_loader = FileSystemLoader(str(Path(__file__).resolve().parents[1] / "templates"))
+    app.register_blueprint(insights_bp, url_prefix="/user")
+    user = make_participant()
+    log_day(user, datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+            gambling={"money_intended": "10", "money_spent": "25", "money_earned": "-15"})
+    user_id = user.id
+    client = client_for(user)
+
+    for name in INSIGHTS_SECTIONS:
+        response = client.get(f"/user/insights/sections/{name}?window=30d")
+        assert response.status_code == 200
+        assert response.get_json()["section"] == name
+        assert response.get_json()["window"]["days"] == 30
+
+    summary = client.get("/user/insights/sections/summary?window=30d").get_json()
+    assert summary["data"]["total_wagered"] == 25.0
+    assert "$25.00" in summary["html"]
+    assert client.get("/user/insights/sections/nope").status_code == 404
+
+    # The researcher view renders the same partial about the selected participant.
+    with app.test_request_context():
+        participant = db.session.get(User, user_id)
+        window = resolve_insights_window(user_id, "30d")
+        html = render_template("partials/insights/summary.html", d=summary_section(InsightsInputs(user_id, window)),
+                               window=window, selected_user=participant)
+    assert "Over the past 30 days p@test.com gambled" in " ".join(html.split())
+    assert "Over the past 30 days you gambled" in " ".join(summary["html"].split())
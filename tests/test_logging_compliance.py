@@ -0,0 +1,39 @@
+"""Tests for per-participant logging compliance over a study window."""
+from datetime import date, datetime
+
+import pytest
+
+from database.logging_compliance import compliance_row, compute_logging_compliance, longest_run, summarize_compliance
+
+
+def test_bitmap_figures():
+    # Days 0, 1 and 5 of a 10-day window logged.
+    row = compliance_row(0b100011, date(2026, 5, 1), 10)
+    assert (row["logged_days"], row["missing_days"], row["compliance"]) == (3, 7, 30.0)
+    assert (row["first_logged"], row["last_logged"]) == ("2026-05-01", "2026-05-06")
+    assert (row["longest_gap"], row["days_since_last_log"]) == (4, 4)
+    assert longest_run(0) == 0
+    assert compliance_row(0, date(2026, 5, 1), 3)["longest_gap"] == 3
+
+
+def test_study_compliance_includes_idle_participants_and_sorts(app_context, make_study, make_participant, log_day):
+    study = make_study("comply01")
+    steady, patchy, idle = (
+        make_participant(name, study.code) for name in ("steady@test.com", "patchy@test.com", "idle@test.com")
+    )
+    for day in range(1, 8):
+        log_day(steady, datetime(2026, 5, day, 9))
+    for when in (datetime(2026, 5, 2), datetime(2026, 5, 2, 18), datetime(2026, 4, 30)):
+        log_day(patchy, when)
+
+    rows = compute_logging_compliance(study.id, date(2026, 5, 1), date(2026, 5, 7))
+    assert [row["username"] for row in rows] == ["idle@test.com", "patchy@test.com", "steady@test.com"]
+    assert [row["logged_days"] for row in rows] == [0, 1, 7]
+    assert rows[1]["longest_gap"] == 5
+
+    by_recency = compute_logging_compliance(study.id, date(2026, 5, 1), date(2026, 5, 7), "days_since_last_log", True)
+    assert [row["username"] for row in by_recency] == ["idle@test.com", "patchy@test.com", "steady@test.com"]
+
+    assert summarize_compliance(rows, 7)["compliance"] == round(8 * 100 / 21, 1)
+    with pytest.raises(ValueError):
+        compute_logging_compliance(study.id, date(2026, 5, 1), date(2026, 5, 7), "bogus")
@@ -0,0 +1,108 @@
+"""Tests for the in-process metrics registry and /metrics endpoint."""
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database.db_initialization import User, db
+from monitoring.metrics import (
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    cache_hit_ratio,
+    init_metrics,
+    record_cache,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Buckets should be cumulative and end with +Inf, sum and count."""
+    registry = MetricsRegistry()
+    hist = registry.register(Histogram("demo_seconds", "Demo.", ("endpoint",), buckets=(0.1, 1.0)))
+    hist.observe(0.05, endpoint="a")
+    hist.observe(0.5, endpoint="a")
+    hist.observe(3.0, endpoint="a")
+
+    text = registry.render()
+
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{endpoint="a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{endpoint="a",le="1"} 2' in text
+    assert 'demo_seconds_bucket{endpoint="a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{endpoint="a"} 3' in text
+
+
+def test_counter_is_thread_safe():
+    """Concurrent increments from many threads should not lose updates."""
+    counter = Counter("demo_total", "Demo.")
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert counter.value() == 8000
+
+
+def test_cache_hit_ratio():
+    """record_cache should feed the hit ratio for a named cache."""
+    record_cache("test-ratio", True)
+    record_cache("test-ratio", True)
+    record_cache("test-ratio", False)
+    assert round(cache_hit_ratio("test-ratio"), 2) == 0.67
+
+
+def test_metrics_endpoint_reports_request_and_db_time(app):
+    """Requests should be timed per endpoint and SQL time recorded."""
+    init_metrics(app)
+
+    @app.route('/count-users')
+    def count_users():
+        return str(User.query.count())
+
+    client = app.test_client()
+    assert client.get('/count-users').status_code == 200
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'tlfb_request_duration_seconds_count{endpoint="count_users",method="GET",status="200"} 1' in text
+    assert 'tlfb_db_query_duration_seconds_count{endpoint="count_users"}' in text
+    assert 'tlfb_db_pool_connections' in text
+    assert 'tlfb_active_sessions' in text
+
+
+def test_metrics_endpoint_requires_token_when_configured(app):
+    """A configured METRICS_TOKEN must be presented as a bearer token."""
+    app.config["METRICS_TOKEN"] = "s3cret"
+    init_metrics(app)
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_metrics_endpoint_without_token_answers_loopback_only(app):
+    """With no METRICS_TOKEN configured, remote scrapers get a 404."""
+    init_metrics(app)
+    client = app.test_client()
+
+    assert client.get('/metrics', environ_base={"REMOTE_ADDR": "127.0.0.1"}).status_code == 200
+    assert client.get('/metrics', environ_base={"REMOTE_ADDR": "::1"}).status_code == 200
+    assert client.get('/metrics', environ_base={"REMOTE_ADDR": "203.0.113.7"}).status_code == 404
+
+
+def test_failed_statement_leaves_no_timer_on_the_pooled_connection(app):
+    """A statement that raises never reaches after_cursor_execute; nothing of it may linger."""
+    init_metrics(app)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM no_such_table"))
+            assert all("start" not in str(key) for key in connection.info)
+            connection.rollback()
+            assert connection.execute(text("SELECT 1")).scalar() == 1
@@ -0,0 +1,59 @@
+"""Tests for activity validators compiled from study question schemas."""
+import pytest
+
+from config.schema_validation import ActivityValidator, clear_validator_cache, validator_for_user
+from database.db_initialization import db
+
+DEFAULT_SCHEMA = {
+    "drinking": [{"id": "num_drinks", "label": "Drinks", "type": "number", "min": 1.0}],
+    "gambling": [],
+}
+
+STUDY_SCHEMA = {
+    "drinking": [],
+    "gambling": [
+        {"id": "game", "label": "Game", "type": "select", "options": ["Slots", "Poker"]},
+        {"id": "stake", "label": "Stake", "type": "number", "min": 0, "max": 500, "decimals": 0},
+        {"id": "notes", "label": "Notes", "type": "text", "required": False},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    clear_validator_cache()
+    yield
+    clear_validator_cache()
+
+
+def test_rules_come_from_the_schema():
+    """Custom ranges, precision, options and optional questions are enforced."""
+    validator = ActivityValidator(STUDY_SCHEMA)
+    ok = {"gambling_logged": True, "game": "Slots", "stake": "20"}
+
+    assert validator.validate(ok) == (True, "")
+    assert validator.validate({**ok, "game": "Bingo"})[0] is False
+    assert validator.validate({**ok, "stake": "501"}) == (False, '"Stake" must be no more than 500.')
+    assert validator.validate({**ok, "stake": "2.5"}) == (False, '"Stake" can have at most 0 decimal places.')
+    assert validator.validate({**ok, "stake": ""}) == (False, '"Stake" is required.')
+    assert validator.validate({"drinking_logged": True}) == (True, "")
+
+
+def test_validator_follows_participant_study_version(app_context, make_study, make_participant):
+    """Participants get their study's validator, rebuilt when the questions change."""
+    study = make_study("valid001", questions=STUDY_SCHEMA)
+    participant = make_participant("p@test.com", study.code)
+    loner = make_participant("l@test.com")
+
+    payload = {"gambling_logged": True, "game": "Slots", "stake": "800"}
+    assert validator_for_user(participant.id, DEFAULT_SCHEMA).validate(payload)[0] is False
+    assert validator_for_user(participant.id, DEFAULT_SCHEMA) is validator_for_user(participant.id, DEFAULT_SCHEMA)
+
+    study.questions = {**STUDY_SCHEMA, "gambling": STUDY_SCHEMA["gambling"][:1]}
+    study.questions_version += 1
+    db.session.commit()
+    assert validator_for_user(participant.id, DEFAULT_SCHEMA).validate(payload) == (True, "")
+
+    assert validator_for_user(loner.id, DEFAULT_SCHEMA).validate({"drinking_logged": True, "num_drinks": "0"}) == (
+        False, '"Drinks" must be at least 1.0.',
+    )
@@ -0,0 +1,76 @@
+"""Tests for the queue-backed structured logger."""
+import io
+import json
+import logging
+import queue
+
+from database.db_helper import commit_to_db, create_user
+from database.db_initialization import User
+from monitoring.structured_logging import (
+    JsonFormatter,
+    SuccessSamplingFilter,
+    build_queue_handler,
+    init_logging,
+    shutdown_logging,
+)
+
+
+def _record(msg, **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, (), None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_sampling_keeps_one_in_n_flagged_records():
+    """Only flagged records are sampled, and one of every N is kept."""
+    sampler = SuccessSamplingFilter(every=5)
+    kept = sum(sampler.filter(_record("Saved activity", sampled=True)) for _ in range(20))
+    assert kept == 4
+    assert sampler.filter(_record("Save error")) is True
+
+
+def test_queue_handler_drops_when_full_instead_of_blocking():
+    """A full queue must never block the caller."""
+    log_queue = queue.Queue(maxsize=1)
+    handler = build_queue_handler(log_queue, sample_every=1)
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))
+    assert log_queue.qsize() == 1
+
+
+def test_formatter_includes_extra_fields():
+    """Fields passed through `extra` should appear in the JSON document."""
+    line = JsonFormatter().format(_record("Committed %s", model="User", request_id="abc"))
+    document = json.loads(line)
+    assert document["model"] == "User"
+    assert document["request_id"] == "abc"
+
+
+def test_request_id_is_echoed_and_attached_to_logs(app):
+    """Log lines emitted during a request carry its correlation id."""
+    stream = io.StringIO()
+    init_logging(app, stream=stream)
+
+    @app.route('/log-something')
+    def log_something():
+        logging.getLogger("routes.test").warning("hello")
+        return "ok"
+
+    response = app.test_client().get('/log-something', headers={"X-Request-ID": "req-123"})
+    shutdown_logging()
+
+    assert response.headers["X-Request-ID"] == "req-123"
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert any(line["message"] == "hello" and line["request_id"] == "req-123" for line in lines)
+
+
+def test_commit_failure_names_the_model(app_context, caplog):
+    """commit_to_db errors should report the model that failed, not always 'user'."""
+    user = create_user(username="log@test.com", password="x")
+    duplicate = User(id=user.id, username="log2@test.com", password="x", is_admin=False)
+
+    with caplog.at_level(logging.ERROR, logger="database.db_helper"):
+        assert commit_to_db(duplicate) is None
+
+    assert "Error committing User" in caplog.text
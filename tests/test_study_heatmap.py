@@ -0,0 +1,26 @@
+"""Tests for the bit-packed study heatmap."""
+import base64
+from datetime import date, datetime
+
+from database.study_heatmap import DRINKING, GAMBLING, MISSING, NO_ACTIVITY, build_study_heatmap, decode_heatmap_cells
+
+
+def test_grid_cells_are_packed_two_bits_each(app_context, make_study, make_participant, log_day):
+    study = make_study("heat0001")
+    ann, ben = (make_participant(name, study.code) for name in ("ann@test.com", "ben@test.com"))
+    drinks, wager = {"num_drinks": "2"}, {"money_spent": "5"}
+
+    log_day(ann, datetime(2026, 5, 1))
+    log_day(ann, datetime(2026, 5, 2), drinking=drinks)
+    log_day(ann, datetime(2026, 5, 3), drinking=drinks)
+    log_day(ann, datetime(2026, 5, 3, 21), gambling=wager)
+    log_day(ben, datetime(2026, 5, 2), gambling=wager)
+
+    heatmap = build_study_heatmap(study.id, date(2026, 5, 1), date(2026, 5, 3))
+
+    assert [p["username"] for p in heatmap["participants"]] == ["ann@test.com", "ben@test.com"]
+    assert decode_heatmap_cells(heatmap["cells"], 6) == [
+        NO_ACTIVITY, DRINKING, GAMBLING,
+        MISSING, GAMBLING, MISSING,
+    ]
+    assert base64.b64decode(heatmap["both"]) == bytes([0b100])
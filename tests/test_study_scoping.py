@@ -0,0 +1,80 @@
+"""Tests for the study_id column carried by calendar, gambling and drinking rows."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from database.db_helper import get_gambling_aggregates
+from database.db_initialization import CalendarEntry, CompletedUpgrade, Gambling, User, db
+from database.db_upgrades import STUDY_IDS_BACKFILL, upgrade_schema
+from database.study_scoping import (
+    backfill_study_ids,
+    participant_in_studies,
+    participants_in_studies,
+    researcher_study_ids,
+)
+
+
+@pytest.fixture
+def two_studies(app_context, make_study, make_participant):
+    """(researcher, first study, second study, alice in first, bob in second)."""
+    researcher = User(username="r@test.com", password="x", is_admin=True)
+    db.session.add(researcher)
+    db.session.commit()
+    first = make_study("study001", researcher)
+    second = make_study("study002", researcher)
+    alice = make_participant("alice@test.com", first.code)
+    bob = make_participant("bob@test.com", second.code)
+    return researcher, first, second, alice, bob
+
+
+def test_new_rows_are_stamped_with_the_participant_study(app_context, two_studies, log_day):
+    """Writes pick up the participant's study without callers passing it."""
+    _, first, _, alice, _ = two_studies
+    entry = log_day(alice, datetime(2026, 5, 1), gambling={"money_spent": "10"})
+
+    assert entry.study_id == first.id
+    assert Gambling.query.one().study_id == first.id
+
+
+def test_backfill_sets_missing_study_ids(app_context, two_studies, log_day):
+    """Rows written before the column existed are filled in by one UPDATE per table."""
+    _, first, _, alice, _ = two_studies
+    log_day(alice, datetime(2026, 5, 1), gambling={"money_spent": "10"})
+    for model in (CalendarEntry, Gambling):
+        db.session.execute(update(model).values(study_id=None))
+    db.session.commit()
+
+    assert backfill_study_ids() == 2
+    assert CalendarEntry.query.one().study_id == first.id
+    assert Gambling.query.one().study_id == first.id
+
+
+def test_study_id_backfill_runs_once_across_startups(app_context, monkeypatch):
+    """The backfill scans every study-scoped table, so startup records it instead of repeating it."""
+    calls = []
+    monkeypatch.setattr("database.study_scoping.backfill_study_ids", lambda: calls.append(1) or 0)
+
+    upgrade_schema()
+    upgrade_schema()
+    assert len(calls) == 1
+    assert db.session.get(CompletedUpgrade, STUDY_IDS_BACKFILL) is not None
+
+
+def test_aggregates_and_membership_are_scoped_by_study(app_context, two_studies, log_day):
+    """Study filters use study_id rather than a list of participant ids."""
+    researcher, first, second, alice, bob = two_studies
+    log_day(alice, datetime(2026, 5, 1), gambling={"money_spent": "10"})
+    log_day(bob, datetime(2026, 5, 1), gambling={"money_spent": "99"})
+
+    aggregates = get_gambling_aggregates(study_ids=[first.id])
+    assert aggregates["total_spent"] == 10.0
+    assert aggregates["user_count"] == 1
+
+    assert get_gambling_aggregates(study_ids=researcher_study_ids(researcher.id))["total_spent"] == 109.0
+    assert participant_in_studies(alice.id, [first.id]) is not None
+    assert participant_in_studies(bob.id, [first.id]) is None
+    assert [(user.id, study.id) for user, study in participants_in_studies(
+        [bob.id, alice.id, researcher.id], researcher_study_ids(researcher.id),
+    )] == [(alice.id, first.id), (bob.id, second.id)]
+    assert participants_in_studies([alice.id, bob.id], [second.id])[0][0].id == bob.id
@@ -0,0 +1,55 @@
+"""Tests for the cached study-level daily/weekly activity series."""
+from datetime import date, datetime
+
+import pytest
+
+from database.study_series import clear_series_cache, study_time_series
+
+
+def test_daily_and_weekly_buckets_fill_gaps(app_context, make_study, make_participant, log_day):
+    clear_series_cache()
+    study = make_study("series01")
+    first, second = (make_participant(f"s{index}@test.com", study.code) for index in range(2))
+    log_day(first, datetime(2026, 5, 4), gambling={"money_intended": "10", "money_spent": "25", "time_spent": "2"})
+    log_day(second, datetime(2026, 5, 4), drinking={"num_drinks": "3"})
+    log_day(second, datetime(2026, 5, 6), drinking={"num_drinks": "1"})
+    log_day(first, datetime(2026, 5, 12), gambling={"money_spent": "5"})
+
+    abstinent = make_participant("s9@test.com", study.code)
+    log_day(abstinent, datetime(2026, 5, 6))
+
+    daily = study_time_series(study.id, date(2026, 5, 4), date(2026, 5, 6))
+    assert daily["dates"] == ["2026-05-04", "2026-05-05", "2026-05-06"]
+    assert daily["participants"] == [2, 0, 2]
+    assert (daily["drinks"], daily["wagered"], daily["hours"]) == ([3.0, 0, 1.0], [25.0, 0, 0], [2.0, 0, 0])
+
+    weekly = study_time_series(study.id, date(2026, 5, 6), date(2026, 5, 14), "week")
+    assert weekly["dates"] == ["2026-05-04", "2026-05-11"]
+    assert (weekly["participants"], weekly["wagered"]) == ([2, 1], [0, 5.0])
+
+    with pytest.raises(ValueError):
+        study_time_series(study.id, date(2026, 5, 4), date(2026, 5, 6), "month")
+
+
+def test_cached_series_is_dropped_when_a_participant_logs(app_context, make_study, make_participant, log_day):
+    clear_series_cache()
+    study = make_study("series01")
+    user = make_participant("s0@test.com", study.code)
+    log_day(user, datetime(2026, 5, 4), drinking={"num_drinks": "2"})
+    assert study_time_series(study.id, date(2026, 5, 4), date(2026, 5, 4))["drinks"] == [2.0]
+
+    log_day(user, datetime(2026, 5, 4), drinking={"num_drinks": "4"})
+    assert study_time_series(study.id, date(2026, 5, 4), date(2026, 5, 4))["drinks"] == [6.0]
+
+
+def test_cached_series_is_dropped_when_a_late_enrollee_logs(app_context, make_study, make_participant, log_day):
+    """Invalidation goes by the participant's current study, not the roster the entry was built with."""
+    clear_series_cache()
+    study = make_study("series01")
+    make_participant("s0@test.com", study.code)
+    assert study_time_series(study.id, date(2026, 5, 4), date(2026, 5, 4))["participants"] == [0]
+
+    newcomer = make_participant("late@test.com", study.code)
+    log_day(newcomer, datetime(2026, 5, 4), gambling={"money_spent": "7"})
+    series = study_time_series(study.id, date(2026, 5, 4), date(2026, 5, 4))
+    assert (series["participants"], series["wagered"]) == ([1], [7.0])
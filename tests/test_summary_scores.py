@@ -0,0 +1,33 @@
+"""Tests for the per-participant TLFB summary scores."""
+from datetime import datetime
+
+from database.summary_scores import compute_summary_scores
+
+
+def test_scores_for_every_participant(app_context, make_study, make_participant, log_day):
+    """Standard measures are computed per participant over the inclusive window."""
+    study = make_study("score001")
+    alice, bob = make_participant("alice@test.com", study.code), make_participant("bob@test.com", study.code)
+    log_day(alice, datetime(2026, 6, 1), drinking={"num_drinks": "6"},
+            gambling={"money_spent": "40", "money_earned": "-30"})
+    log_day(alice, datetime(2026, 6, 2), drinking={"num_drinks": "2"})
+    log_day(alice, datetime(2026, 6, 3), gambling={"money_spent": "10", "money_earned": "15"})
+    log_day(alice, datetime(2026, 6, 11), drinking={"num_drinks": "9"})  # outside the window
+
+    scores = compute_summary_scores([study.id], start_date="2026-06-01", end_date="2026-06-10")
+
+    alice_scores, bob_scores = scores
+    assert alice_scores["window_days"] == 10
+    assert alice_scores["logged_days"] == 3
+    assert alice_scores["drinking_days"] == 2
+    assert alice_scores["percent_days_drinking"] == 20.0
+    assert alice_scores["drinks_per_drinking_day"] == 4.0
+    assert alice_scores["heavy_drinking_days"] == 1
+    assert alice_scores["percent_days_gambling"] == 20.0
+    assert alice_scores["total_wagered"] == 50.0
+    assert alice_scores["average_wagered_per_gambling_day"] == 25.0
+    assert alice_scores["net_loss"] == 15.0
+
+    assert bob_scores["username"] == "bob@test.com"
+    assert bob_scores["logged_days"] == 0
+    assert bob_scores["drinks_per_drinking_day"] is None